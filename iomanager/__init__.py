@@ -7,9 +7,23 @@ from .iomanager import (
     TypeCheckFailureError,
     TypeCheckSuccessError,
     CoercionSuccessError,
+    TypeCheckSuccess,
+    TypeCheckFailure,
+    CoercionSuccess,
+    BatchResult,
+    ProcessingFailure,
+    Fault,
     AnyType,
     ListOf,
+    FrozenDict,
+    FrozenList,
     combine_iospecs,
+    freeze_iospec,
+    clear_iospec_cache,
     iospecs_from_callable,
+    managed,
     )
-from . import web_tools
\ No newline at end of file
+from . import web_tools
+from . import file_tools
+from . import async_tools
+from . import registry
@@ -0,0 +1,139 @@
+""" Verify and coerce the records of JSON data files on several processes.
+    
+    python -m iomanager [options] module:attribute file [file ...]
+    
+    'module:attribute' names an 'IOManager' (for example, a 'WebIOManager'),
+    an 'IOManager' subclass, or an 'IOProcessor'. Failing records are printed
+    with their file, line number and byte offset. The exit status is 1 if any
+    record fails. """
+
+import argparse
+import importlib
+import sys
+from .iomanager import (
+    IOManager,
+    IOProcessor,
+    )
+from .file_tools import (
+    FORMATS,
+    CHUNK_SIZE,
+    validate_files,
+    )
+
+def main(argv=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    
+    try:
+        target = load_target(args.target)
+    except (ImportError, AttributeError, ValueError) as exc:
+        parser.error(str(exc))
+    
+    reports = validate_files(
+        target,
+        args.files,
+        output=args.output,
+        format=args.format,
+        processes=args.processes,
+        chunk_size=args.chunk_size,
+        )
+    
+    records = failures = 0
+    for report in reports:
+        for failure in report.failures:
+            print(format_failure(report.path, failure))
+        records += report.count
+        failures += len(report.failures)
+    
+    print(
+        '{} records, {} failed, in {} files.'
+        .format(records, failures, len(reports)),
+        file=sys.stderr,
+        )
+    
+    if failures:
+        return 1
+    return 0
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m iomanager',
+        description='Verify and coerce the records of JSON data files.',
+        )
+    parser.add_argument(
+        'target',
+        help="An 'IOManager' or 'IOProcessor', as 'module:attribute'.",
+        )
+    parser.add_argument('files', nargs='+', help='The data files.')
+    parser.add_argument(
+        '--output',
+        action='store_true',
+        help="Process the records as output, not input.",
+        )
+    parser.add_argument(
+        '--format',
+        choices=FORMATS,
+        default='ndjson',
+        help="'ndjson' (one record per line) or 'json' (an array).",
+        )
+    parser.add_argument(
+        '--processes',
+        type=positive_int,
+        default=None,
+        help='The number of worker processes. Default: one for each CPU.',
+        )
+    parser.add_argument(
+        '--chunk-size',
+        type=positive_int,
+        default=CHUNK_SIZE,
+        help='The number of records in each task.',
+        )
+    return parser
+
+def positive_int(text):
+    """ An 'argparse' type for integer options that must be positive. """
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            "must be a positive integer. Got: {}".format(text)
+            )
+    
+    return value
+
+def load_target(name):
+    """ The 'IOManager' or 'IOProcessor' named by 'module:attribute'. An
+        'IOManager' subclass is instantiated. """
+    module_name, separator, attribute = name.partition(':')
+    if not separator:
+        raise ValueError(
+            "The target must be 'module:attribute'. Got: {}".format(name)
+            )
+    
+    target = getattr(importlib.import_module(module_name), attribute)
+    
+    if isinstance(target, type) and issubclass(target, IOManager):
+        target = target()
+    
+    if not isinstance(target, (IOManager, IOProcessor)):
+        raise ValueError(
+            "'{}' is not an 'IOManager' or an 'IOProcessor'.".format(name)
+            )
+    
+    return target
+
+def format_failure(path, failure):
+    """ 'path:line: (byte offset): message', with the lines of the message
+        after the first indented. """
+    return '{}:{}: (byte {}) {}'.format(
+        path,
+        failure.line,
+        failure.offset,
+        failure.message.replace('\n', '\n    '),
+        )
+
+if __name__ == '__main__':
+    sys.exit(main())
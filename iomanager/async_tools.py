@@ -0,0 +1,413 @@
+""" Tools for processing iovalues in asyncio servers.
+
+    'Offloader' --> Runs the processing of large iovalues in an executor, so
+        it does not block the event loop.
+    'process_stream' --> Processes the records of a newline-delimited JSON
+        stream as they arrive.
+    'Coalescer' --> Processes iovalues submitted by concurrent tasks in
+        batches.
+    """
+
+import asyncio
+import itertools
+import json
+from collections.abc import (
+    Sequence,
+    Mapping,
+    )
+from .iomanager import (
+    IOManager,
+    VerificationFailureError,
+    InputVerificationFailureError,
+    OutputVerificationFailureError,
+    ProcessingFailure,
+    ON_ERROR_POLICIES,
+    is_container,
+    )
+from .file_tools import (
+    get_processor,
+    )
+
+# The estimated size (see 'estimate_size') from which 'Offloader' runs
+# processing in its executor.
+OFFLOAD_THRESHOLD = 10000
+
+# How deep 'estimate_size' looks into nested containers, and how many items
+# of each sequence and values of each mapping it looks at.
+PROBE_DEPTH = 4
+PROBE_COUNT = 3
+PROBE_VALUE_COUNT = 8
+
+# The number of records 'process_stream' reads ahead of its consumer, the
+# number of bytes it reads at a time, and the longest record it accepts.
+STREAM_BUFFER_SIZE = 100
+STREAM_READ_SIZE = 65536
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+# How long 'Coalescer' waits for more iovalues (in seconds), and the most
+# iovalues it processes in one batch.
+COALESCE_DELAY = 0.001
+COALESCE_BATCH_SIZE = 100
+
+class EndOfStream(object):
+    """ Put in the queue of 'process_stream' after the last record. """
+
+class Offloader(object):
+    """ Runs 'process_input' and 'process_output' of an 'IOManager' (or an
+        'IOProcessor') from a coroutine.
+        
+        Processing is CPU-bound, and a large iovalue blocks the event loop for
+        as long as it takes. Iovalues with an estimated size (see
+        'estimate_size') below 'threshold' are processed inline, where that
+        costs less than a trip to another thread. Larger iovalues are
+        processed by 'executor', with 'loop.run_in_executor'; by default, the
+        loop's default executor (a thread pool).
+        
+        With a 'ProcessPoolExecutor', the manager, the iovalue and the result
+        are pickled, so the custom functions must be picklable, and
+        'inplace=True' does not change the iovalue. Always use the return
+        value. """
+    def __init__(self, manager, executor=None, threshold=OFFLOAD_THRESHOLD):
+        self.manager = manager
+        self.executor = executor
+        self.threshold = threshold
+    
+    async def process_input(self, iovalue, inplace=False):
+        return await self.run(self.manager.process_input, iovalue, inplace)
+    
+    async def process_output(self, iovalue, inplace=False):
+        return await self.run(self.manager.process_output, iovalue, inplace)
+    
+    async def run(self, method, iovalue, inplace=False):
+        if estimate_size(iovalue) < self.threshold:
+            return method(iovalue, inplace)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            method,
+            iovalue,
+            inplace,
+            )
+
+class Coalescer(object):
+    """ Collects the 'process_input' and 'process_output' calls of concurrent
+        tasks, and processes them in batches, with an 'IOManager' (or an
+        'IOProcessor').
+        
+        A batch is processed 'delay' seconds after its first iovalue was
+        submitted, or as soon as it holds 'max_batch_size' iovalues. Each
+        caller gets its own result, or its own error. Input and output
+        iovalues are batched separately.
+        
+        Under high concurrency, many small iovalues are processed in one
+        wake-up of the event loop instead of one each. Without custom
+        functions, a batch is processed in a single pass when its iovalues
+        all pass (see 'IOProcessor.process_batch'); with them, the iovalues
+        are processed one by one, so an error raised by a custom function
+        only fails its own caller. Each call waits up to 'delay' seconds
+        longer. """
+    def __init__(
+        self,
+        manager,
+        delay=COALESCE_DELAY,
+        max_batch_size=COALESCE_BATCH_SIZE,
+        ):
+        self.manager = manager
+        self.delay = delay
+        self.max_batch_size = max_batch_size
+        self.batches = {False: [], True: []}
+        self.timers = {}
+    
+    async def process_input(self, iovalue, inplace=False):
+        return await self.submit(iovalue, False, inplace)
+    
+    async def process_output(self, iovalue, inplace=False):
+        return await self.submit(iovalue, True, inplace)
+    
+    def submit(self, iovalue, output, inplace=False):
+        """ Add 'iovalue' to the next input (or output) batch. Return a
+            future of its result. """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.batches[output]
+        batch.append((iovalue, inplace, future))
+        
+        if len(batch) >= self.max_batch_size:
+            self.flush(output)
+        elif len(batch) == 1:
+            self.timers[output] = loop.call_later(
+                self.delay,
+                self.flush,
+                output,
+                )
+        
+        return future
+    
+    def flush(self, output):
+        """ Process the input (or output) batch now. """
+        timer = self.timers.pop(output, None)
+        if timer is not None:
+            timer.cancel()
+        
+        # Cancelled callers are left out.
+        batch = [
+            (iovalue, inplace, future)
+            for iovalue, inplace, future in self.batches[output]
+            if not future.done()
+            ]
+        self.batches[output] = []
+        
+        if not batch:
+            return
+        
+        processor = get_processor(self.manager, output)
+        error_class = get_error_class(self.manager, output)
+        
+        # Iovalues processed in place, and the others, are separate batches.
+        for inplace in [False, True]:
+            self.process_batch(
+                processor,
+                [
+                    (iovalue, future)
+                    for iovalue, item_inplace, future in batch
+                    if bool(item_inplace) is inplace
+                    ],
+                output,
+                inplace,
+                error_class,
+                )
+    
+    def process_batch(self, processor, batch, output, inplace, error_class):
+        """ Process the '(iovalue, future)' pairs of 'batch', and set the
+            result (or error) of each future. """
+        if not batch:
+            return
+        
+        if has_custom_functions(processor):
+            # A custom function can raise an error for one iovalue. Each
+            # iovalue is processed on its own, so the functions of the others
+            # are not called again to find it.
+            results = [
+                self.process_one(processor, iovalue, output, inplace)
+                for iovalue, future in batch
+                ]
+        else:
+            results = processor.process_batch(
+                [iovalue for iovalue, future in batch],
+                output,
+                inplace,
+                )
+        
+        for (iovalue, future), (result, failure) in zip(batch, results):
+            if isinstance(failure, Exception):
+                future.set_exception(failure)
+            elif failure is None:
+                future.set_result(result)
+            else:
+                future.set_exception(
+                    processor.make_error(failure, error_class)
+                    )
+    
+    def process_one(self, processor, iovalue, output, inplace=False):
+        """ 'processor.plan.process', with an error of a custom function
+            returned in place of the failure. """
+        try:
+            return processor.plan.process(iovalue, output, inplace)
+        except Exception as exc:
+            return None, exc
+
+def has_custom_functions(processor):
+    return bool(
+        processor.typecheck_dispatcher.functions or
+        processor.coercion_dispatcher.functions
+        )
+
+def estimate_size(iovalue, depth=PROBE_DEPTH):
+    """ A cheap estimate of the number of values in 'iovalue', including
+        containers.
+        
+        The length of each container is multiplied by the average estimated
+        size of a few of its items: up to 'PROBE_COUNT' items of a sequence
+        (the first, the last and the middle one), and the first
+        'PROBE_VALUE_COUNT' values of a mapping. Containers more than 'depth'
+        levels deep count as their length. """
+    if not is_container(iovalue, (Sequence, Mapping)):
+        return 1
+    
+    length = len(iovalue)
+    if not length or not depth:
+        return 1 + length
+    
+    if is_container(iovalue, Mapping):
+        probes = list(itertools.islice(iovalue.values(), PROBE_VALUE_COUNT))
+    else:
+        probes = [
+            iovalue[index]
+            for index in sorted(set(
+                index * (length - 1) // (PROBE_COUNT - 1)
+                for index in range(PROBE_COUNT)
+                ))
+            ]
+    
+    probed_size = sum(estimate_size(ivalue, depth - 1) for ivalue in probes)
+    return 1 + length * probed_size // len(probes)
+
+def process_stream(
+    target,
+    source,
+    output=False,
+    on_error='raise',
+    buffer_size=STREAM_BUFFER_SIZE,
+    max_record_size=MAX_RECORD_SIZE,
+    ):
+    """ Return an async iterator of the processed records of the
+        newline-delimited JSON stream 'source': an 'asyncio.StreamReader' (or
+        anything with an async 'read' method), or an async iterable of
+        'bytes' chunks. Blank lines are not records.
+        
+        'target' is an 'IOProcessor', or an 'IOManager'; the input processor
+        of an 'IOManager' is used, or the output processor when 'output' is
+        'True'. Each record is decoded and processed when the iterator is
+        advanced. A task reads records ahead of the consumer, but at most
+        'buffer_size' of them. When the consumer is slower than the stream,
+        the reading stops until it catches up, so a slow consumer slows down
+        the sender instead of filling memory.
+        
+        'on_error' decides what happens to a record that fails verification,
+        or that is not valid JSON; see 'IOProcessor.iter_process'. Records
+        are counted from 0 for 'ProcessingFailure.index'; the 'iovalue' of
+        a record that is not valid JSON is its bytes, and its 'error' is a
+        'ValueError'. A record longer than 'max_record_size' bytes raises
+        'ValueError'. """
+    if on_error not in ON_ERROR_POLICIES:
+        raise ValueError(
+            "'on_error' must be one of {}. Got: {}"
+            .format(list(ON_ERROR_POLICIES), on_error)
+            )
+    
+    return generate_stream_results(
+        get_processor(target, output),
+        source,
+        output,
+        on_error,
+        get_error_class(target, output),
+        buffer_size,
+        max_record_size,
+        )
+
+async def generate_stream_results(
+    processor,
+    source,
+    output,
+    on_error,
+    error_class,
+    buffer_size,
+    max_record_size,
+    ):
+    queue = asyncio.Queue(buffer_size)
+    reader = asyncio.ensure_future(
+        read_records(source, queue, max_record_size)
+        )
+    plan_process = processor.plan.process
+    index = -1
+    
+    try:
+        while True:
+            record = await queue.get()
+            
+            if record is EndOfStream:
+                break
+            if isinstance(record, Exception):
+                raise record
+            
+            index += 1
+            
+            try:
+                iovalue = json.loads(record)
+            except ValueError as exc:
+                if on_error == 'raise':
+                    raise
+                if on_error == 'yield':
+                    yield ProcessingFailure(index, record, exc)
+                continue
+            
+            # The decoded record is new, so it can be coerced in place.
+            coerced_iovalue, failure = plan_process(iovalue, output, True)
+            
+            if failure is None:
+                yield coerced_iovalue
+            elif on_error == 'raise':
+                raise processor.make_error(failure, error_class)
+            elif on_error == 'yield':
+                yield ProcessingFailure(
+                    index,
+                    iovalue,
+                    processor.make_error(failure, error_class),
+                    )
+    finally:
+        reader.cancel()
+
+async def read_records(source, queue, max_record_size=MAX_RECORD_SIZE):
+    """ Put the records of the stream 'source' in 'queue', as 'bytes', then
+        'EndOfStream'. An error is put in the queue in place of the records
+        that are left. """
+    buffer = bytearray()
+    
+    try:
+        async for chunk in iter_chunks(source):
+            # The buffered part of a record has no newline; only the new
+            # chunk is searched.
+            search_start = len(buffer)
+            buffer += chunk
+            start = 0
+            
+            while True:
+                end = buffer.find(b'\n', max(start, search_start))
+                if end == -1:
+                    break
+                
+                check_record_size(end - start, max_record_size)
+                record = bytes(buffer[start:end])
+                if record.strip():
+                    await queue.put(record)
+                start = end + 1
+            
+            del buffer[:start]
+            check_record_size(len(buffer), max_record_size)
+        
+        if bytes(buffer).strip():
+            await queue.put(bytes(buffer))
+    except Exception as exc:
+        await queue.put(exc)
+        return
+    
+    await queue.put(EndOfStream)
+
+def check_record_size(size, max_record_size):
+    if size > max_record_size:
+        raise ValueError(
+            'A record is longer than {} bytes.'.format(max_record_size)
+            )
+
+async def iter_chunks(source, read_size=STREAM_READ_SIZE):
+    """ The 'bytes' chunks of 'source'. See 'process_stream'. """
+    if not hasattr(source, 'read'):
+        async for chunk in source:
+            yield chunk
+        return
+    
+    while True:
+        chunk = await source.read(read_size)
+        if not chunk:
+            return
+        yield chunk
+
+def get_error_class(target, output=False):
+    """ The error raised when processing by 'target' fails. See
+        'IOManager.process_input'. """
+    if not isinstance(target, IOManager):
+        return VerificationFailureError
+    if output:
+        return OutputVerificationFailureError
+    return InputVerificationFailureError
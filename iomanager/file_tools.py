@@ -0,0 +1,388 @@
+""" Verify and coerce every record of a JSON data file, without reading the
+    whole file into memory.
+    
+    'ndjson' --> Newline-delimited JSON: one record per line.
+    'json' --> A JSON array of records.
+    """
+
+import array
+import json
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from .iomanager import (
+    IOManager,
+    )
+
+FORMATS = ('ndjson', 'json')
+
+# The number of records in each task of 'validate_files'.
+CHUNK_SIZE = 10000
+
+# The processor of a 'validate_files' worker process. See 'start_worker'.
+worker_processor = None
+
+# Strings, and the characters that matter for finding the records of a JSON
+# array. Other characters are skipped by 'finditer'.
+JSON_ARRAY_TOKENS = re.compile(rb'"(?:[^"\\]|\\.)*"|[][{},]')
+WHITESPACE = re.compile(rb'\s*')
+
+OPENING = frozenset(b'[{')
+CLOSING = frozenset(b']}')
+COMMA = ord(',')
+
+class RecordFile(object):
+    """ A memory-mapped JSON data file, with an index of its records.
+        
+        The index is built once, when the file is opened. It holds the byte
+        offset, length and line number of every record, in compact arrays, so
+        any record can be read again without rescanning the file.
+        
+        Blank lines of an 'ndjson' file are not records. Records are decoded
+        with 'json.loads' when they are read; a record that is not valid JSON
+        raises 'ValueError'.
+        
+        'index' is an '(offsets, lengths, lines)' tuple of arrays, made by
+        'index_slice' of another 'RecordFile' of the same file. The file is
+        then not scanned, and only holds the records of that index. """
+    def __init__(self, path, format='ndjson', index=None):
+        if format not in FORMATS:
+            raise ValueError(
+                "'format' must be one of {}. Got: {}"
+                .format(list(FORMATS), format)
+                )
+        
+        self.path = path
+        self.format = format
+        self.buffer = b''
+        
+        if index is None:
+            self.offsets = array.array('q')
+            self.lengths = array.array('q')
+            self.lines = array.array('q')
+        else:
+            self.offsets, self.lengths, self.lines = index
+        
+        self.file = open(path, 'rb')
+        try:
+            if os.fstat(self.file.fileno()).st_size:
+                self.buffer = mmap.mmap(
+                    self.file.fileno(),
+                    0,
+                    access=mmap.ACCESS_READ,
+                    )
+            # An empty file can not be memory-mapped. Its buffer is empty.
+            
+            if index is None:
+                self.make_index()
+        except Exception:
+            self.close()
+            raise
+    
+    def make_index(self):
+        if self.format == 'ndjson':
+            self.index_lines()
+        else:
+            self.index_array()
+    
+    def index_lines(self):
+        buffer = self.buffer
+        size = len(buffer)
+        start = 0
+        line = 1
+        
+        while start < size:
+            end = buffer.find(b'\n', start)
+            if end == -1:
+                end = size
+            
+            record_start = WHITESPACE.match(buffer, start, end).end()
+            if record_start < end:
+                self.add_record(record_start, end - record_start, line)
+            
+            start = end + 1
+            line += 1
+    
+    def index_array(self):
+        buffer = self.buffer
+        start = WHITESPACE.match(buffer).end()
+        
+        if buffer[start:start + 1] != b'[':
+            raise ValueError(
+                "'{}' is not a JSON array.".format(self.path)
+                )
+        
+        depth = 0
+        line = 1
+        counted = 0
+        
+        for match in JSON_ARRAY_TOKENS.finditer(buffer, start):
+            char = buffer[match.start()]
+            
+            if char in OPENING:
+                depth += 1
+                if depth == 1:
+                    item_start = match.end()
+                continue
+            
+            if char in CLOSING:
+                depth -= 1
+                if depth:
+                    continue
+            elif char != COMMA or depth != 1:
+                # A string, or a comma inside a record.
+                continue
+            
+            # The end of a record. Only '[]' has no records.
+            record_start = WHITESPACE.match(buffer, item_start).end()
+            if char == COMMA or record_start < match.start() or self.offsets:
+                line += buffer[counted:record_start].count(b'\n')
+                counted = record_start
+                self.add_record(
+                    record_start,
+                    match.start() - record_start,
+                    line,
+                    )
+            
+            if depth == 0:
+                break
+            
+            item_start = match.end()
+        else:
+            raise ValueError(
+                "'{}' is not a complete JSON array.".format(self.path)
+                )
+    
+    def add_record(self, offset, length, line):
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.lines.append(line)
+    
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *pargs):
+        self.close()
+    
+    def __len__(self):
+        return len(self.offsets)
+    
+    def __getitem__(self, index):
+        return json.loads(self.read(index))
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    
+    def read(self, index):
+        """ The bytes of the record at 'index'. """
+        offset = self.offsets[index]
+        return self.buffer[offset:offset + self.lengths[index]]
+    
+    def location(self, index):
+        """ The line number and byte offset of the record at 'index'. """
+        return self.lines[index], self.offsets[index]
+    
+    def index_slice(self, start, stop):
+        """ The part of the index from 'start' to 'stop'. See '__init__'. """
+        return (
+            self.offsets[start:stop],
+            self.lengths[start:stop],
+            self.lines[start:stop],
+            )
+
+class RecordFailure(object):
+    """ A record of a data file that failed verification, or that is not
+        valid JSON. 'offset' and 'length' locate its bytes in the file (see
+        'read_record'). """
+    __slots__ = ('index', 'line', 'offset', 'length', 'message')
+    
+    def __init__(self, index, line, offset, length, message):
+        self.index = index
+        self.line = line
+        self.offset = offset
+        self.length = length
+        self.message = message
+    
+    def __repr__(self):
+        return '{}(line={}, offset={}, {!r})'.format(
+            type(self).__name__,
+            self.line,
+            self.offset,
+            self.message,
+            )
+
+class FileReport(object):
+    """ The result of 'validate_file'. 'count' is the number of records in the
+        file, and 'failures' is a list of 'RecordFailure' instances, in file
+        order. """
+    __slots__ = ('path', 'count', 'failures')
+    
+    def __init__(self, path, count, failures):
+        self.path = path
+        self.count = count
+        self.failures = failures
+
+def validate_file(target, path, output=False, format='ndjson'):
+    """ Process every record of the data file at 'path'. Return a
+        'FileReport'.
+        
+        'target' is an 'IOProcessor', or an 'IOManager'; the input processor
+        of an 'IOManager' is used, or the output processor when 'output' is
+        'True'. Records that fail verification do not stop processing.
+        Failures with identical error messages share a single message. """
+    processor = get_processor(target, output)
+    
+    with RecordFile(path, format) as record_file:
+        failures = validate_records(processor, record_file, output)
+        return FileReport(path, len(record_file), failures)
+
+def validate_files(
+    target,
+    paths,
+    output=False,
+    format='ndjson',
+    processes=None,
+    chunk_size=CHUNK_SIZE,
+    ):
+    """ 'validate_file' for each of 'paths', on 'processes' worker processes
+        (by default, one for each CPU). Return a list of 'FileReport'
+        instances.
+        
+        Each file is indexed by this process, then its records are processed
+        in chunks of 'chunk_size' records. The processor is pickled to send it
+        to the workers, so its custom functions must be picklable. """
+    processor = get_processor(target, output)
+    
+    if processes == 1:
+        return [
+            validate_file(processor, path, output, format)
+            for path in paths
+            ]
+    
+    with ProcessPoolExecutor(
+        processes,
+        initializer=start_worker,
+        initargs=(processor,),
+        ) as executor:
+        tasks = []
+        
+        for path in paths:
+            with RecordFile(path, format) as record_file:
+                count = len(record_file)
+                futures = [
+                    executor.submit(
+                        validate_chunk,
+                        path,
+                        start,
+                        output,
+                        record_file.index_slice(start, start + chunk_size),
+                        )
+                    for start in range(0, count, chunk_size)
+                    ]
+            tasks.append((path, count, futures))
+        
+        reports = []
+        for path, count, futures in tasks:
+            failures = []
+            messages = {}
+            for future in futures:
+                for failure in future.result():
+                    # Identical messages from different workers are shared.
+                    failure.message = messages.setdefault(
+                        failure.message,
+                        failure.message,
+                        )
+                    failures.append(failure)
+            reports.append(FileReport(path, count, failures))
+        
+        return reports
+
+def process_file(target, path, output=False, format='ndjson'):
+    """ Process every record of the data file at 'path', lazily. Yield an
+        '(index, coerced_iovalue, failure)' tuple for each record; see
+        'process_records'. 'target' is as for 'validate_file'. The file is
+        closed when the generator is exhausted or closed. """
+    processor = get_processor(target, output)
+    
+    with RecordFile(path, format) as record_file:
+        yield from process_records(processor, record_file, output)
+
+def process_records(processor, record_file, output=False):
+    """ Process every record of 'record_file', lazily. Yield an
+        '(index, coerced_iovalue, failure)' tuple for each record. 'failure'
+        is 'None' when the record passes. Otherwise, it is a 'RecordFailure',
+        and 'coerced_iovalue' is 'None'. """
+    plan_process = processor.plan.process
+    messages = {}
+    
+    for index in range(len(record_file)):
+        try:
+            iovalue = record_file[index]
+        except ValueError as exc:
+            message = 'Invalid JSON: {}'.format(exc)
+        else:
+            coerced_iovalue, failure = plan_process(iovalue, output)
+            if failure is None:
+                yield index, coerced_iovalue, None
+                continue
+            message = processor.make_shared_error_message(failure, messages)
+        
+        line, offset = record_file.location(index)
+        yield index, None, RecordFailure(
+            index,
+            line,
+            offset,
+            record_file.lengths[index],
+            message,
+            )
+
+def validate_records(processor, record_file, output=False):
+    """ Process every record of 'record_file'. Return a list of
+        'RecordFailure' instances. """
+    return [
+        failure
+        for index, coerced_iovalue, failure in process_records(
+            processor,
+            record_file,
+            output,
+            )
+        if failure is not None
+        ]
+
+def start_worker(processor):
+    """ Run by each worker process of 'validate_files'. """
+    global worker_processor
+    worker_processor = processor
+
+def validate_chunk(path, start, output, index):
+    """ Run by a worker process of 'validate_files'. Process the records of
+        one chunk of a file. """
+    with RecordFile(path, index=index) as record_file:
+        failures = validate_records(worker_processor, record_file, output)
+    
+    for failure in failures:
+        failure.index += start
+    
+    return failures
+
+def read_record(path, offset, length):
+    """ Read and decode one record of a data file, by its byte offset and
+        length (see 'RecordFile' and 'RecordFailure'). """
+    with open(path, 'rb') as data_file:
+        data_file.seek(offset)
+        return json.loads(data_file.read(length))
+
+def get_processor(target, output=False):
+    if isinstance(target, IOManager):
+        if output:
+            return target.output_processor
+        return target.input_processor
+    
+    return target
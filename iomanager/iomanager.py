@@ -1,16 +1,61 @@
 """ Copyright (c) 2013 Josh Matthias <python.iomanager@gmail.com> """
 
+import array
+import asyncio
+import contextvars
+import functools
 import inspect
+import itertools
+import sys
+import types
+import typing
+from collections import OrderedDict
 from collections.abc import(
     Sequence,
     Mapping,
+    MutableSequence,
+    MutableMapping,
     )
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 """ Jargon:
     'ioval' --> 'Input/Output value'
     'iospec' --> 'Input/Output specification dictionary'
     """
 
+ENGINES = ('plan', 'codegen', 'numpy')
+
+# The kinds of parameters that 'iospecs_from_callable' makes iospecs for.
+KEYWORD_PARAMETER_KINDS = frozenset([
+    inspect.Parameter.POSITIONAL_OR_KEYWORD,
+    inspect.Parameter.KEYWORD_ONLY,
+    ])
+
+# What 'iter_process' does with an iovalue that fails verification.
+ON_ERROR_POLICIES = ('raise', 'skip', 'yield')
+
+# 'array.array' typecodes that can be used as 'ListOf' storage, by item type.
+ARRAY_TYPECODES = {int: 'bBhHiIlLqQ', float: 'fd'}
+
+# 'ListOf' storage options. See 'ListOf'.
+STORAGES = (
+    (None, 'ndarray') + tuple(ARRAY_TYPECODES[int] + ARRAY_TYPECODES[float])
+    )
+
+# Types checked with 'type(ioval) is expected_type' before 'isinstance'.
+BUILTIN_SCALAR_TYPES = frozenset([bool, bytes, complex, float, int, str])
+
+# The most frozen iospecs, combined iospecs, plans and async function
+# wrappers of each kind that are memoized.
+MEMO_SIZE = 10000
+
+# The 'AsyncCalls' of the running 'IOProcessor.run_async' pass.
+async_calls = contextvars.ContextVar('async_calls')
+
 # --------------------------- Error classes ----------------------------
 
 class Error(Exception):
@@ -18,12 +63,57 @@ class Error(Exception):
 
 class VerificationFailureError(Error):
     """ The 'iovalue' value submitted for processing did not conform to the
-        provided 'iospec' value. """
+        provided 'iospec' value.
+        
+        An error raised by an 'IOProcessor' holds the 'NodeFailure' that was
+        found, as 'failure', and the processor's 'error_msg'. Its message is
+        only made when it is read (by 'str', 'repr' or 'args'), so errors
+        that are caught and dropped cost little. See also 'faults'. """
     def __init__(self, *pargs, **kwargs):
-        if not pargs:
+        self.error_msg = kwargs.pop('error_msg', None)
+        self.failure = kwargs.pop('failure', None)
+        
+        if not pargs and self.failure is None:
             pargs = ['Input/Output verification failed.']
         
         super(VerificationFailureError, self).__init__(*pargs, **kwargs)
+    
+    @property
+    def args(self):
+        self.render()
+        return BaseException.args.__get__(self)
+    
+    @args.setter
+    def args(self, value):
+        BaseException.args.__set__(self, value)
+    
+    @property
+    def faults(self):
+        """ A list of 'Fault' instances, one for each fault held by
+            'failure'. Empty if the error was not made from a failure. """
+        if self.failure is None:
+            return []
+        return make_faults(self.failure)
+    
+    def render(self):
+        """ Make the message from 'failure', if it has not been made (or
+            given) yet. """
+        if self.failure is not None and not BaseException.args.__get__(self):
+            BaseException.args.__set__(
+                self,
+                (make_error_message(self.error_msg, self.failure),),
+                )
+    
+    def __str__(self):
+        self.render()
+        return super(VerificationFailureError, self).__str__()
+    
+    def __repr__(self):
+        self.render()
+        return super(VerificationFailureError, self).__repr__()
+    
+    def __reduce__(self):
+        return (type(self), self.args, self.__dict__)
 
 class InputVerificationFailureError(VerificationFailureError):
     """ Raised by IOManager to indicate that verification has failed when
@@ -33,24 +123,6 @@ class OutputVerificationFailureError(VerificationFailureError):
     """ Raised by IOManager to indicate that verification has failed when
         'verify_output' was called. """
 
-class WrongTypeError(Error):
-    """ An 'ioval' value could not be coerced to the expected type.
-        
-        This error is used to pass a 'failure result', which is an instance of
-        'WrongTypePair'. The failure result is used to generate human-readable
-        output indicating why coercion failed. """
-    def __init__(self, *pargs, **kwargs):
-        self.failure_result = WrongTypePair(*pargs, **kwargs)
-
-class WrongTypeDictError(WrongTypeError):
-    """ Values in a dict or list of arguments could not be coerced to the
-        expected type.
-        
-        This error is used to pass a 'failure result dictionary', a (possibly
-        nested) dictionary of 'WrongTypePair' instances. """
-    def __init__(self, failure_dict):
-        self.failure_result = failure_dict
-
 class TypeCheckFailureError(Error):
     """ A value fails type confirmation.
         
@@ -64,20 +136,31 @@ class TypeCheckFailureError(Error):
                 raise TypeCheckFailureError
             
             return value
-        """
+        
+        Returning 'TypeCheckFailure' has the same effect, and is faster. """
 
 class TypeCheckSuccessError(Error):
     """ A value passes type confirmation.
         
         Raised by a custom 'typecheck' (type confirmation) function to allow
-        a value not of the expected type to pass confirmation. """
+        a value not of the expected type to pass confirmation. Returning
+        'TypeCheckSuccess' has the same effect, and is faster. """
 
 class CoercionSuccessError(Error):
     """ A value has been successfully coerced to the expected type.
         
         Raising this exception instead of simply returning the coerced value
         stops the coercion routine. This behavior can be used to 'stack'
-        coercion functions. """
+        coercion functions. Returning a 'CoercionSuccess' instance has the
+        same effect, and is faster. """
+
+# Errors that custom functions raise to give their result. An awaitable
+# result that raises one of these is remembered like a returned value.
+ASYNC_RESULT_ERRORS = (
+    CoercionSuccessError,
+    TypeCheckSuccessError,
+    TypeCheckFailureError,
+    )
 
 
 
@@ -89,25 +172,74 @@ class AnyType(object):
 class ListOf(object):
     """ A list of items of a specified type.
         
-        The specified type can be an iospec dictionary. """
-    
-    def __init__(self, iospec_obj):
-        self.iospec_obj = iospec_obj
+        The specified type can be an iospec dictionary.
         
-        type_name_self = type(self).__name__.strip("'").strip('"')
+        'storage' changes what coercion returns for a list of 'int' or 'float'
+        items. With 'storage="ndarray"', a list whose items all have exactly
+        the expected type is coerced to a one-dimensional NumPy array (NumPy
+        must be installed). With an 'array.array' typecode, such as
+        'storage="q"' for 'int' items or 'storage="d"' for 'float' items, it
+        is coerced to an 'array.array' of that typecode. A list that does not
+        fit in the array (for example, an 'int' that is too large) is returned
+        as a list.
         
-        if is_container(iospec_obj, (Sequence, Mapping)):
-            type_name_obj = str(iospec_obj)
-        else:
-            type_name_obj = iospec_obj.__name__.strip("'").strip('"')
+        Storage is for input. The output processor of an 'IOManager' leaves
+        it out (see 'IOProcessor.make_plan'), so coerced output lists stay
+        lists, which 'json.dumps' can serialize. """
+    
+    frozen = False
+    
+    def __init__(self, iospec_obj, storage=None):
+        if storage not in STORAGES:
+            raise ValueError(
+                "'storage' must be one of {}. Got: {}"
+                .format(list(STORAGES), storage)
+                )
+        if storage is not None and iospec_obj not in (int, float):
+            raise ValueError(
+                "'storage' can only be used with 'int' or 'float' items. "
+                "Got: {}".format(iospec_obj)
+                )
+        if (
+            storage not in (None, 'ndarray') and
+            storage not in ARRAY_TYPECODES[iospec_obj]
+            ):
+            raise ValueError(
+                "'storage={}' is not an array typecode for '{}' items."
+                .format(repr(storage), iospec_obj.__name__)
+                )
         
-        self.__name__ = type_name_self + "({})".format(type_name_obj)
+        self.iospec_obj = iospec_obj
+        self.storage = storage
+        self.type_name = None
     
-    def make_dict(self, length):
-        return {i: self.iospec_obj for i in range(length)}
+    @property
+    def __name__(self):
+        """ The name used in error messages. It is made when it is first
+            needed, not when the 'ListOf' is created. """
+        if self.type_name is None:
+            type_name_self = type(self).__name__.strip("'").strip('"')
+            
+            if is_container(self.iospec_obj, (Sequence, Mapping)):
+                type_name_obj = str(self.iospec_obj)
+            else:
+                type_name_obj = (
+                    self.iospec_obj.__name__.strip("'").strip('"')
+                    )
+            
+            self.type_name = type_name_self + "({})".format(type_name_obj)
+        
+        return self.type_name
     
     def __repr__(self):
-        return "{}({})".format(type(self).__name__, repr(self.iospec_obj))
+        if self.storage is None:
+            return "{}({})".format(type(self).__name__, repr(self.iospec_obj))
+        
+        return "{}({}, storage={})".format(
+            type(self).__name__,
+            repr(self.iospec_obj),
+            repr(self.storage),
+            )
 
 
 
@@ -117,10 +249,33 @@ class NotProvided(object):
     """ Value when an argument or parameter is not given. """
 
 class NoDifference(object):
-    """ Return value when a 'difference' function returns no difference.
-        
-        This is necessary so that 'difference_ioval', 'difference_dict' and
-        'difference_list' can all return the same value. """
+    """ The 'missing' or 'unknown' value of a 'NodeFailure' that has no
+        missing or unknown values. """
+
+class TypeCheckSuccess(object):
+    """ Returned by a custom 'typecheck' function to allow a value not of the
+        expected type to pass confirmation. The same as raising a
+        'TypeCheckSuccessError'. """
+
+class TypeCheckFailure(object):
+    """ Returned by a custom 'typecheck' function to force a value of the
+        expected type to fail confirmation. The same as raising a
+        'TypeCheckFailureError'. """
+
+class PendingCoercion(object):
+    """ The coerced value, on a pass of 'IOProcessor.run_async', of a value
+        whose awaitable coercion function has not been awaited yet. """
+
+class CoercionSuccess(object):
+    """ Returned by a coercion function with a successfully coerced value.
+        The same as raising 'CoercionSuccessError(value)'. """
+    __slots__ = ('value',)
+    
+    def __init__(self, value):
+        self.value = value
+    
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.value)
 
 class UnknownContainer(object):
     """ Used to generate succinct error messages when a not-allowed keyword
@@ -163,18 +318,1794 @@ class TypeNameRepresentation(object):
         if type_obj is None:
             self.type_name = 'None'
         else:
-            self.type_name = type_obj.__name__
+            try:
+                self.type_name = type_obj.__name__
+            except AttributeError:
+                self.type_name = type(type_obj).__name__
     
     def __repr__(self):
         result = self.type_name.strip("'").strip('"')
         result = '<{}>'.format(result)
         return result
 
+class NodeFailure(object):
+    """ The result of a plan node that failed verification: its 'missing',
+        'unknown' and 'wrong types' values.
+        
+        'count' is the number of faults held, and 'suppressed' is the number
+        of faults that were found but not held (see 'max_errors'). """
+    __slots__ = ('missing', 'unknown', 'wrong_types', 'count', 'suppressed')
+    
+    def __init__(
+        self,
+        missing=NoDifference,
+        unknown=NoDifference,
+        wrong_types=None,
+        count=1,
+        suppressed=0,
+        ):
+        self.missing = missing
+        self.unknown = unknown
+        self.wrong_types = wrong_types
+        self.count = count
+        self.suppressed = suppressed
+
+class Fault(object):
+    """ One fault held by a 'VerificationFailureError'. 'path' is a tuple of
+        the keys and indexes that lead from the iovalue to the faulty value.
+            Missing --> 'expected' is the iospec; 'got' is 'NotProvided'.
+            Not allowed --> 'expected' is 'NotProvided'; 'got' is the value
+                (abbreviated; see 'UnknownContainer').
+            Wrong type --> 'expected' is the iospec; 'got' is the type of the
+                value.
+        """
+    __slots__ = ('path', 'expected', 'got')
+    
+    def __init__(self, path, expected, got):
+        self.path = path
+        self.expected = expected
+        self.got = got
+    
+    def __repr__(self):
+        return '{}({!r}, {!r}, {!r})'.format(
+            type(self).__name__,
+            self.path,
+            self.expected,
+            self.got,
+            )
+
+class FailureCollector(object):
+    """ Collects the faults of the items of a container node, and makes the
+        'NodeFailure' of the container. Container nodes only make a collector
+        when they find a fault.
+        
+        At most 'max_errors' faults are held. Faults after that are only
+        counted, as 'suppressed'. The failure of an item is held whole or not
+        at all, so the faults held are not always the first ones. Once the
+        collector is full (see 'is_full'), container nodes count the faults
+        of the remaining items with 'PlanNode.count_faults'. """
+    __slots__ = (
+        'max_errors',
+        'missing',
+        'unknown',
+        'wrong_types',
+        'count',
+        'suppressed',
+        )
+    
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.missing = {}
+        self.unknown = {}
+        self.wrong_types = {}
+        self.count = 0
+        self.suppressed = 0
+    
+    def admit(self, count):
+        """ Return 'True' if 'count' more faults can be held. Otherwise, count
+            them as suppressed and return 'False'. """
+        if self.count + count <= self.max_errors:
+            self.count += count
+            return True
+        
+        self.suppressed += count
+        return False
+    
+    def add(self, key, failure):
+        """ Hold the failure of the item at 'key'. """
+        if self.admit(failure.count):
+            collect_failure(
+                key, failure, self.missing, self.unknown, self.wrong_types
+                )
+        self.suppressed += failure.suppressed
+    
+    def add_unknown(self, key, ioval):
+        if self.admit(1):
+            self.unknown[key] = abbreviate_unknown(ioval)
+    
+    def is_full(self):
+        """ 'True' when no more faults can be held. """
+        return self.count >= self.max_errors
+    
+    def make_failure(self):
+        """ The 'NodeFailure' of the container. """
+        return NodeFailure(
+            missing=self.missing or NoDifference,
+            unknown=self.unknown or NoDifference,
+            wrong_types=self.wrong_types or None,
+            count=self.count,
+            suppressed=self.suppressed,
+            )
+
+class BatchResult(object):
+    """ The result of processing many iovalues at once (see
+        'IOProcessor.process_many').
+        
+        'values' holds the processed iovalues, in order. An iovalue that fails
+        verification is 'None' in 'values', and its error message is in
+        'errors', by index. Identical failures share a single message string,
+        which is only made once. """
+    __slots__ = ('values', 'errors')
+    
+    def __init__(self, values, errors):
+        self.values = values
+        self.errors = errors
+    
+    def summary(self):
+        """ A dictionary of {error message: [indexes]}, in order of first
+            appearance. """
+        result = {}
+        for index, message in self.errors.items():
+            result.setdefault(message, []).append(index)
+        return result
+
+class ProcessingFailure(object):
+    """ Yielded by 'IOProcessor.iter_process' with 'on_error="yield"' in place
+        of an iovalue that fails verification. 'index' is the position of the
+        iovalue in the input iterable, and 'error' is the
+        'VerificationFailureError' that would have been raised. """
+    __slots__ = ('index', 'iovalue', 'error')
+    
+    def __init__(self, index, iovalue, error):
+        self.index = index
+        self.iovalue = iovalue
+        self.error = error
+    
+    def __repr__(self):
+        return '{}({!r}, {!r})'.format(
+            type(self).__name__,
+            self.index,
+            self.error,
+            )
+
+
+
+# --------------------------- Frozen iospecs ---------------------------
+
+class MemoCache(OrderedDict):
+    """ A dictionary that holds at most 'maxsize' items. When it is full,
+        the least recently used item is removed. """
+    def __init__(self, maxsize):
+        super(MemoCache, self).__init__()
+        self.maxsize = maxsize
+    
+    def __getitem__(self, key):
+        value = super(MemoCache, self).__getitem__(key)
+        self.move_to_end(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        super(MemoCache, self).__setitem__(key, value)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+# Memoized derived values. See 'freeze_iospec' and 'clear_iospec_cache'.
+# They are kept when the processors that use them are gone, so processors
+# made again for each request reuse them.
+frozen_iospecs = MemoCache(MEMO_SIZE)
+compiled_plans = MemoCache(MEMO_SIZE)
+generated_plans = MemoCache(MEMO_SIZE)
+async_functions = MemoCache(MEMO_SIZE)
+
+class FrozenDict(dict):
+    """ An immutable, hashable iospec dictionary. Made by 'freeze_iospec'.
+        
+        Two frozen dictionaries are only equal when their keys are in the same
+        order, because the order of the 'required' keys is the order of the
+        'Missing' error output, and have the same types: '{1: int}' and
+        '{True: int}' are different iospecs. """
+    def __init__(self, *pargs, **kwargs):
+        super(FrozenDict, self).__init__(*pargs, **kwargs)
+        self.key_types = tuple(map(type, self))
+        self.hash_value = hash((self.key_types, tuple(self.items())))
+    
+    def __hash__(self):
+        return self.hash_value
+    
+    def __eq__(self, other):
+        if isinstance(other, FrozenDict):
+            return (
+                self.key_types == other.key_types and
+                tuple(self.items()) == tuple(other.items())
+                )
+        return super(FrozenDict, self).__eq__(other)
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __reduce__(self):
+        return (freeze_iospec, (dict(self),))
+    
+    def immutable(self, *pargs, **kwargs):
+        raise TypeError(
+            "'{}' object is immutable.".format(type(self).__name__)
+            )
+    
+    __setitem__ = __delitem__ = immutable
+    clear = pop = popitem = setdefault = update = immutable
+
+class FrozenList(tuple):
+    """ An immutable iospec list or tuple. Made by 'freeze_iospec'.
+        
+        '__name__' and 'repr()' are those of the original list or tuple, so
+        error messages do not change when an iospec is frozen. A frozen list
+        is equal to an equal list, but never to a tuple. """
+    def __new__(cls, items=(), type_name='list'):
+        self = super(FrozenList, cls).__new__(cls, items)
+        self.__name__ = type_name
+        return self
+    
+    def __hash__(self):
+        if self.__name__ == 'tuple':
+            return super(FrozenList, self).__hash__()
+        return hash((self.__name__, tuple(self)))
+    
+    def __eq__(self, other):
+        if isinstance(other, FrozenList):
+            return (
+                self.__name__ == other.__name__ and
+                tuple(self) == tuple(other)
+                )
+        if isinstance(other, list):
+            return self.__name__ == 'list' and list(self) == other
+        if self.__name__ == 'list':
+            return False
+        return super(FrozenList, self).__eq__(other)
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __repr__(self):
+        if self.__name__ == 'tuple':
+            return super(FrozenList, self).__repr__()
+        return repr(list(self))
+    
+    def __reduce__(self):
+        if self.__name__ == 'list':
+            return (freeze_iospec, (list(self),))
+        return (freeze_iospec, (tuple(self),))
+
+
+
+# -------------------------- Verification plan -------------------------
+
+class PlanNode(object):
+    """ One node of a verification 'plan'.
+        
+        A plan is a tree of nodes compiled once from a combined iospec (see
+        'PlanCompiler'). Each node already knows what kind of value it
+        expects and which custom functions apply to it, so 'verify' and
+        'coerce' never need to re-examine the iospec.
+        
+        Coercion is copy-on-write: a container is only copied when one of its
+        items changes, so values that need no changes are returned as they
+        are. 'coerces' is 'False' when no coercion function applies anywhere
+        below a node. """
+    
+    coerces = False
+    max_errors = sys.maxsize
+    
+    def verify(self, ioval):
+        """ Return 'None' when 'ioval' passes verification. Otherwise, return
+            a 'NodeFailure'. """
+        raise NotImplementedError
+    
+    def coerce(self, ioval, inplace=False):
+        """ With 'inplace=True', changed items of mutable containers
+            ('MutableMapping' and 'MutableSequence' instances) are replaced in
+            the containers themselves, instead of in copies. """
+        raise NotImplementedError
+    
+    def process(self, ioval, output=False, inplace=False):
+        """ Coerce and verify 'ioval' in a single pass. Return the coerced
+            value and the result of verification ('None' or a 'NodeFailure').
+            
+            Input values are coerced, then verified. Output values are
+            verified, then coerced. """
+        raise NotImplementedError
+    
+    def process_output(self, ioval, inplace=False):
+        """ process() for output. The whole value is verified before anything
+            is coerced, so no output coercion function (which can have side
+            effects) is called for a value that fails. """
+        failure = self.verify(ioval)
+        if failure is None and self.coerces:
+            ioval = self.coerce(ioval, inplace)
+        return ioval, failure
+    
+    def count_faults(self, ioval):
+        """ The number of faults of 'ioval' (0 when it passes verification),
+            without making a 'NodeFailure' for them. """
+        failure = self.verify(ioval)
+        if failure is None:
+            return 0
+        return failure.count + failure.suppressed
+    
+    def count_process(self, ioval, output=False, inplace=False):
+        """ process(), with the number of faults (see 'count_faults') in
+            place of the result of verification. """
+        if not output:
+            ioval = self.coerce(ioval, inplace)
+            return ioval, self.count_faults(ioval)
+        
+        # A value that fails is not coerced.
+        count = self.count_faults(ioval)
+        if not count:
+            return self.coerce(ioval, inplace), 0
+        return ioval, count
+    
+    def emit_check(self, writer, var):
+        """ Write source code that returns 'False' if the value named 'var'
+            fails verification. See 'GeneratedPlan'. """
+        raise NotImplementedError
+    
+    def emit_coerce(self, writer, src, dst, inplace=False):
+        """ Write source code that coerces the value named 'src' and assigns
+            the result to 'dst'. Unless 'inplace' is true, 'src' is left
+            unchanged (except when 'dst' has the same name). See
+            'GeneratedPlan'. """
+        raise NotImplementedError
+
+class ScalarNode(PlanNode):
+    """ A non-container iospec value: a type, or 'AnyType'. """
+    def __init__(
+        self,
+        expected_type,
+        nonetype_ok=True,
+        coercion_function=None,
+        ):
+        self.expected_type = expected_type
+        self.nonetype_ok = nonetype_ok
+        self.coercion_function = coercion_function
+        self.coerces = coercion_function is not None
+    
+    def check(self, ioval):
+        if ioval is None:
+            return self.nonetype_ok
+        
+        return isinstance(ioval, self.expected_type)
+    
+    def verify(self, ioval):
+        if self.check(ioval):
+            return None
+        
+        return NodeFailure(
+            wrong_types=WrongTypePair(self.expected_type, ioval)
+            )
+    
+    def count_faults(self, ioval):
+        if self.check(ioval):
+            return 0
+        return 1
+    
+    def coerce(self, ioval, inplace=False):
+        if self.coercion_function is None:
+            return ioval
+        
+        return call_coercion_function(
+            self.coercion_function,
+            ioval,
+            self.expected_type,
+            )
+    
+    def process(self, ioval, output=False, inplace=False):
+        if output:
+            failure = self.verify(ioval)
+            if failure is None:
+                ioval = self.coerce(ioval)
+            return ioval, failure
+        
+        ioval = self.coerce(ioval)
+        return ioval, self.verify(ioval)
+    
+    def emit_check(self, writer, var):
+        emit_type_check(writer, var, self.expected_type, self.nonetype_ok)
+    
+    def emit_coerce(self, writer, src, dst, inplace=False):
+        if self.coercion_function is None:
+            if dst != src:
+                writer.line('{} = {}'.format(dst, src))
+            return
+        
+        function_name = writer.constant(self.coercion_function, 'coerce')
+        type_name = writer.constant(self.expected_type, 'type')
+        exc_name = writer.name('exc')
+        
+        writer.line('try:')
+        writer.line(
+            '{} = {}({}, {})'.format(dst, function_name, src, type_name), 1
+            )
+        writer.line('except CoercionSuccessError as {}:'.format(exc_name))
+        writer.line('{} = {}.args[0]'.format(dst, exc_name), 1)
+        writer.line('else:')
+        writer.line('if type({}) is CoercionSuccess:'.format(dst), 1)
+        writer.line('{0} = {0}.value'.format(dst), 2)
+
+class BuiltinScalarNode(ScalarNode):
+    """ A builtin scalar type (see 'BUILTIN_SCALAR_TYPES'). Most values have
+        exactly the expected type, so that is checked before 'isinstance'. """
+    def check(self, ioval):
+        if type(ioval) is self.expected_type:
+            return True
+        
+        return super(BuiltinScalarNode, self).check(ioval)
+    
+    def emit_check(self, writer, var):
+        emit_type_check(
+            writer,
+            var,
+            self.expected_type,
+            self.nonetype_ok,
+            exact_type_first=True,
+            )
+
+class AnyTypeNode(ScalarNode):
+    def check(self, ioval):
+        return ioval is not None or self.nonetype_ok
+
+class TypeCheckFunctionNode(ScalarNode):
+    """ A 'ScalarNode' with a custom 'typecheck' function. """
+    def __init__(self, expected_type, typecheck_function, **kwargs):
+        super(TypeCheckFunctionNode, self).__init__(expected_type, **kwargs)
+        self.typecheck_function = typecheck_function
+    
+    def check(self, ioval):
+        result = call_typecheck_function(
+            self.typecheck_function,
+            ioval,
+            self.expected_type,
+            )
+        if result is TypeCheckSuccess:
+            return True
+        if result is TypeCheckFailure:
+            return False
+        
+        if ioval is None:
+            return self.nonetype_ok
+        
+        return (
+            self.expected_type is AnyType or
+            isinstance(ioval, self.expected_type)
+            )
+    
+    def emit_check(self, writer, var):
+        function_name = writer.constant(self.typecheck_function, 'typecheck')
+        type_name = writer.constant(self.expected_type, 'type')
+        
+        result_name = writer.name('result')
+        
+        type_check = writer.branch()
+        emit_type_check(type_check, var, self.expected_type, self.nonetype_ok)
+        
+        writer.line('try:')
+        writer.line(
+            '{} = {}({}, {})'.format(
+                result_name, function_name, var, type_name
+                ),
+            1
+            )
+        writer.line('except TypeCheckSuccessError:')
+        writer.line('{} = TypeCheckSuccess'.format(result_name), 1)
+        writer.line('except TypeCheckFailureError:')
+        writer.line('return False', 1)
+        writer.line('if {} is TypeCheckFailure:'.format(result_name))
+        writer.line('return False', 1)
+        if type_check.lines:
+            writer.line('if {} is not TypeCheckSuccess:'.format(result_name))
+            writer.extend(type_check, 1)
+
+class DictNode(PlanNode):
+    """ A dictionary iospec. 'children' maps each key of the combined iospec
+        to a node; 'required_keys' holds the keys of the 'required' iospec, in
+        order.
+        
+        With 'fail_fast', verification stops at the first fault: a missing key
+        (required keys are checked first), an unknown key or a wrong type. """
+    def __init__(
+        self,
+        children,
+        required_iospec,
+        unlimited=False,
+        fail_fast=False,
+        max_errors=None,
+        ):
+        self.children = children
+        self.required_iospec = required_iospec
+        self.required_keys = tuple(required_iospec)
+        self.unlimited = unlimited
+        self.fail_fast = fail_fast
+        if max_errors is not None:
+            self.max_errors = max_errors
+        self.coerces = any(child.coerces for child in children.values())
+    
+    def verify(self, iovals_dict):
+        if not isinstance(iovals_dict, Mapping):
+            return NodeFailure(wrong_types=WrongTypePair(dict, iovals_dict))
+        
+        if self.fail_fast:
+            failure = self.find_first_missing(iovals_dict)
+            if failure is not None:
+                return failure
+        
+        children = self.children
+        collector = None
+        items = iter(iovals_dict.items())
+        
+        for key, ioval in items:
+            child = children.get(key)
+            
+            if child is None:
+                if not self.unlimited:
+                    if collector is None:
+                        collector = FailureCollector(self.max_errors)
+                    collector.add_unknown(key, ioval)
+                    if self.fail_fast or collector.is_full():
+                        break
+                continue
+            
+            failure = child.verify(ioval)
+            if failure is not None:
+                if collector is None:
+                    collector = FailureCollector(self.max_errors)
+                collector.add(key, failure)
+                if self.fail_fast or collector.is_full():
+                    break
+        
+        if collector is not None and not self.fail_fast:
+            collector.suppressed += self.count_item_faults(items)
+        
+        collector = self.find_missing(iovals_dict, collector)
+        
+        return make_failure(collector)
+    
+    def count_faults(self, iovals_dict):
+        if not isinstance(iovals_dict, Mapping):
+            return 1
+        
+        count = self.count_item_faults(iovals_dict.items())
+        for key in self.required_keys:
+            if key not in iovals_dict:
+                count += 1
+        return count
+    
+    def count_item_faults(self, items):
+        """ The number of faults of the '(key, ioval)' pairs 'items'. """
+        children = self.children
+        count = 0
+        
+        for key, ioval in items:
+            child = children.get(key)
+            if child is not None:
+                count += child.count_faults(ioval)
+            elif not self.unlimited:
+                count += 1
+        
+        return count
+    
+    def find_first_missing(self, iovals_dict):
+        """ With 'fail_fast', a 'NodeFailure' for the first missing key, or
+            'None'. """
+        for key in self.required_keys:
+            if key not in iovals_dict:
+                return NodeFailure(missing={key: self.required_iospec[key]})
+        
+        return None
+    
+    def find_missing(self, iovals_dict, collector):
+        """ Add missing keys to the 'Missing' output of 'collector', and put
+            it in the order of the 'required' iospec. Return 'collector',
+            which is made if it is 'None' and there are missing keys. """
+        missing = {}
+        for key in self.required_keys:
+            if key not in iovals_dict:
+                if collector is None:
+                    collector = FailureCollector(self.max_errors)
+                if collector.admit(1):
+                    missing[key] = self.required_iospec[key]
+            elif collector is not None and key in collector.missing:
+                missing[key] = collector.missing[key]
+        
+        if collector is not None:
+            collector.missing = missing
+        return collector
+    
+    def coerce(self, iovals_dict, inplace=False):
+        if not self.coerces or not isinstance(iovals_dict, Mapping):
+            return iovals_dict
+        
+        children = self.children
+        result_iovals = iovals_dict
+        
+        for key, ioval in iovals_dict.items():
+            child = children.get(key)
+            if child is None:
+                continue
+            
+            coerced = child.coerce(ioval, inplace)
+            if coerced is not ioval:
+                if result_iovals is iovals_dict and not (
+                    inplace and isinstance(iovals_dict, MutableMapping)
+                    ):
+                    result_iovals = dict(iovals_dict)
+                result_iovals[key] = coerced
+        
+        return result_iovals
+    
+    def process(self, iovals_dict, output=False, inplace=False):
+        if output:
+            return self.process_output(iovals_dict, inplace)
+        
+        if not isinstance(iovals_dict, Mapping):
+            return iovals_dict, self.verify(iovals_dict)
+        
+        if self.fail_fast:
+            failure = self.find_first_missing(iovals_dict)
+            if failure is not None:
+                return iovals_dict, failure
+        
+        children = self.children
+        result_iovals = iovals_dict
+        collector = None
+        
+        for key, ioval in iovals_dict.items():
+            child = children.get(key)
+            
+            if child is None:
+                if not self.unlimited:
+                    if collector is None:
+                        collector = FailureCollector(self.max_errors)
+                    collector.add_unknown(key, ioval)
+                    if self.fail_fast:
+                        break
+                continue
+            
+            if collector is not None and collector.is_full():
+                coerced, count = child.count_process(ioval, output, inplace)
+                collector.suppressed += count
+                failure = None
+            else:
+                coerced, failure = child.process(ioval, output, inplace)
+            
+            if coerced is not ioval:
+                if result_iovals is iovals_dict and not (
+                    inplace and isinstance(iovals_dict, MutableMapping)
+                    ):
+                    result_iovals = dict(iovals_dict)
+                result_iovals[key] = coerced
+            if failure is not None:
+                if collector is None:
+                    collector = FailureCollector(self.max_errors)
+                collector.add(key, failure)
+                if self.fail_fast:
+                    break
+        
+        collector = self.find_missing(iovals_dict, collector)
+        
+        return result_iovals, make_failure(collector)
+    
+    def emit_check(self, writer, var):
+        writer.line('if not isinstance({}, Mapping):'.format(var))
+        writer.line('return False', 1)
+        
+        if not self.unlimited:
+            keys_name = writer.constant(frozenset(self.children), 'keys')
+            writer.line('if not {}.issuperset({}):'.format(keys_name, var))
+            writer.line('return False', 1)
+        
+        if self.required_keys:
+            required_name = writer.constant(
+                frozenset(self.required_keys), 'required'
+                )
+            writer.line('if not {}.keys() >= {}:'.format(var, required_name))
+            writer.line('return False', 1)
+        
+        for key, child in self.children.items():
+            item_name = writer.name('item')
+            child_check = writer.branch()
+            child.emit_check(child_check, item_name)
+            if not child_check.lines:
+                continue
+            
+            key_name = writer.constant(key, 'key')
+            get_item = '{} = {}[{}]'.format(item_name, var, key_name)
+            
+            if key in self.required_iospec:
+                writer.line(get_item)
+                writer.extend(child_check)
+            else:
+                writer.line('if {} in {}:'.format(key_name, var))
+                writer.line(get_item, 1)
+                writer.extend(child_check, 1)
+    
+    def emit_coerce(self, writer, src, dst, inplace=False):
+        if not self.coerces:
+            if dst != src:
+                writer.line('{} = {}'.format(dst, src))
+            return
+        
+        result_name = writer.name('result')
+        writer.line('if isinstance({}, Mapping):'.format(src))
+        writer.line('{} = {}'.format(result_name, src), 1)
+        
+        for key, child in self.children.items():
+            if not child.coerces:
+                continue
+            
+            key_name = writer.constant(key, 'key')
+            item_name = writer.name('item')
+            writer.line('if {} in {}:'.format(key_name, src), 1)
+            writer.line('{} = {}[{}]'.format(item_name, src, key_name), 2)
+            emit_copy_on_write(
+                writer, child, src, result_name, item_name, key_name, 'dict',
+                'MutableMapping' if inplace else None, 2
+                )
+        
+        writer.line('{} = {}'.format(dst, result_name), 1)
+        
+        if dst != src:
+            writer.line('else:')
+            writer.line('{} = {}'.format(dst, src), 1)
+
+class ListNode(PlanNode):
+    """ A list or tuple iospec. Each position has its own node. 'fail_fast'
+        is the same as for 'DictNode'. """
+    def __init__(
+        self,
+        iospec_obj,
+        children,
+        required_iospec,
+        unlimited=False,
+        fail_fast=False,
+        max_errors=None,
+        ):
+        self.iospec_obj = iospec_obj
+        self.children = children
+        self.required_iospec = required_iospec
+        self.unlimited = unlimited
+        self.fail_fast = fail_fast
+        if max_errors is not None:
+            self.max_errors = max_errors
+        self.coerces = any(child.coerces for child in children)
+    
+    def verify(self, iovals_list):
+        if not is_container(iovals_list, Sequence):
+            return NodeFailure(
+                wrong_types=WrongTypePair(self.iospec_obj, iovals_list)
+                )
+        
+        if self.fail_fast:
+            failure = self.find_first_missing(iovals_list)
+            if failure is not None:
+                return failure
+        
+        children = self.children
+        children_count = len(children)
+        collector = None
+        items = enumerate(iovals_list)
+        
+        for index, ioval in items:
+            if index >= children_count:
+                if not self.unlimited:
+                    if collector is None:
+                        collector = FailureCollector(self.max_errors)
+                    collector.add_unknown(index, ioval)
+                    if self.fail_fast or collector.is_full():
+                        break
+                continue
+            
+            failure = children[index].verify(ioval)
+            if failure is not None:
+                if collector is None:
+                    collector = FailureCollector(self.max_errors)
+                collector.add(index, failure)
+                if self.fail_fast or collector.is_full():
+                    break
+        
+        if collector is not None and not self.fail_fast:
+            collector.suppressed += self.count_item_faults(items)
+        
+        collector = self.find_missing(iovals_list, collector)
+        
+        return make_failure(collector)
+    
+    def count_faults(self, iovals_list):
+        if not is_container(iovals_list, Sequence):
+            return 1
+        
+        count = self.count_item_faults(enumerate(iovals_list))
+        return count + max(len(self.required_iospec) - len(iovals_list), 0)
+    
+    def count_item_faults(self, items):
+        """ The number of faults of the '(index, ioval)' pairs 'items'. """
+        children = self.children
+        children_count = len(children)
+        count = 0
+        
+        for index, ioval in items:
+            if index < children_count:
+                count += children[index].count_faults(ioval)
+            elif not self.unlimited:
+                count += 1
+        
+        return count
+    
+    def find_first_missing(self, iovals_list):
+        index = len(iovals_list)
+        if index < len(self.required_iospec):
+            return NodeFailure(missing={index: self.required_iospec[index]})
+        
+        return None
+    
+    def find_missing(self, iovals_list, collector):
+        iovals_count = len(iovals_list)
+        missing = {}
+        for index, iospec in enumerate(self.required_iospec):
+            if index >= iovals_count:
+                if collector is None:
+                    collector = FailureCollector(self.max_errors)
+                if collector.admit(1):
+                    missing[index] = iospec
+            elif collector is not None and index in collector.missing:
+                missing[index] = collector.missing[index]
+        
+        if collector is not None:
+            collector.missing = missing
+        return collector
+    
+    def coerce(self, iovals_list, inplace=False):
+        if not self.coerces or not is_container(iovals_list, Sequence):
+            return iovals_list
+        
+        result_list = iovals_list
+        
+        for index, (child, ioval) in enumerate(
+            zip(self.children, iovals_list)
+            ):
+            coerced = child.coerce(ioval, inplace)
+            if coerced is not ioval:
+                if result_list is iovals_list and not (
+                    inplace and isinstance(iovals_list, MutableSequence)
+                    ):
+                    result_list = list(iovals_list)
+                result_list[index] = coerced
+        
+        return keep_sequence_type(iovals_list, result_list)
+    
+    def process(self, iovals_list, output=False, inplace=False):
+        if output:
+            return self.process_output(iovals_list, inplace)
+        
+        if not is_container(iovals_list, Sequence):
+            return iovals_list, self.verify(iovals_list)
+        
+        if self.fail_fast:
+            failure = self.find_first_missing(iovals_list)
+            if failure is not None:
+                return iovals_list, failure
+        
+        children = self.children
+        children_count = len(children)
+        result_list = iovals_list
+        collector = None
+        
+        for index, ioval in enumerate(iovals_list):
+            if index >= children_count:
+                if not self.unlimited:
+                    if collector is None:
+                        collector = FailureCollector(self.max_errors)
+                    collector.add_unknown(index, ioval)
+                    if self.fail_fast:
+                        break
+                continue
+            
+            child = children[index]
+            if collector is not None and collector.is_full():
+                coerced, count = child.count_process(ioval, output, inplace)
+                collector.suppressed += count
+                failure = None
+            else:
+                coerced, failure = child.process(ioval, output, inplace)
+            
+            if coerced is not ioval:
+                if result_list is iovals_list and not (
+                    inplace and isinstance(iovals_list, MutableSequence)
+                    ):
+                    result_list = list(iovals_list)
+                result_list[index] = coerced
+            if failure is not None:
+                if collector is None:
+                    collector = FailureCollector(self.max_errors)
+                collector.add(index, failure)
+                if self.fail_fast:
+                    break
+        
+        collector = self.find_missing(iovals_list, collector)
+        
+        return (
+            keep_sequence_type(iovals_list, result_list),
+            make_failure(collector),
+            )
+    
+    def emit_check(self, writer, var):
+        emit_sequence_check(writer, var)
+        
+        length_name = writer.name('length')
+        writer.line('{} = len({})'.format(length_name, var))
+        
+        required_count = len(self.required_iospec)
+        conditions = []
+        if not self.unlimited:
+            conditions.append(
+                '{} > {}'.format(length_name, len(self.children))
+                )
+        if required_count:
+            conditions.append('{} < {}'.format(length_name, required_count))
+        if conditions:
+            writer.line('if {}:'.format(' or '.join(conditions)))
+            writer.line('return False', 1)
+        
+        for index, child in enumerate(self.children):
+            item_name = writer.name('item')
+            child_check = writer.branch()
+            child.emit_check(child_check, item_name)
+            if not child_check.lines:
+                continue
+            
+            get_item = '{} = {}[{}]'.format(item_name, var, index)
+            
+            if index < required_count:
+                writer.line(get_item)
+                writer.extend(child_check)
+            else:
+                writer.line('if {} > {}:'.format(length_name, index))
+                writer.line(get_item, 1)
+                writer.extend(child_check, 1)
+    
+    def emit_coerce(self, writer, src, dst, inplace=False):
+        if not self.coerces:
+            if dst != src:
+                writer.line('{} = {}'.format(dst, src))
+            return
+        
+        length_name = writer.name('length')
+        result_name = writer.name('result')
+        
+        writer.line(
+            'if isinstance({0}, Sequence) and '
+            'not isinstance({0}, (str, bytes)):'.format(src)
+            )
+        writer.line('{} = {}'.format(result_name, src), 1)
+        writer.line('{} = len({})'.format(length_name, src), 1)
+        
+        for index, child in enumerate(self.children):
+            if not child.coerces:
+                continue
+            
+            item_name = writer.name('item')
+            writer.line('if {} > {}:'.format(length_name, index), 1)
+            writer.line('{} = {}[{}]'.format(item_name, src, index), 2)
+            emit_copy_on_write(
+                writer, child, src, result_name, item_name, index, 'list',
+                'MutableSequence' if inplace else None, 2
+                )
+        
+        emit_keep_sequence_type(writer, src, result_name, 1)
+        writer.line('{} = {}'.format(dst, result_name), 1)
+        
+        if dst != src:
+            writer.line('else:')
+            writer.line('{} = {}'.format(dst, src), 1)
+
+class ListOfNode(PlanNode):
+    """ A 'ListOf' iospec. Every item is checked by the same node. With
+        'fail_fast', verification stops at the first item that fails. """
+    def __init__(self, iospec_obj, child, fail_fast=False, max_errors=None):
+        self.iospec_obj = iospec_obj
+        self.child = child
+        self.fail_fast = fail_fast
+        if max_errors is not None:
+            self.max_errors = max_errors
+        self.coerces = child.coerces
+    
+    def verify(self, iovals_list):
+        if not is_container(iovals_list, Sequence):
+            return NodeFailure(
+                wrong_types=WrongTypePair(self.iospec_obj, iovals_list)
+                )
+        
+        child_verify = self.child.verify
+        collector = None
+        items = enumerate(iovals_list)
+        
+        for index, ioval in items:
+            failure = child_verify(ioval)
+            if failure is not None:
+                if collector is None:
+                    collector = FailureCollector(self.max_errors)
+                collector.add(index, failure)
+                if self.fail_fast or collector.is_full():
+                    break
+        
+        if collector is not None and not self.fail_fast:
+            child_count_faults = self.child.count_faults
+            for index, ioval in items:
+                collector.suppressed += child_count_faults(ioval)
+        
+        return make_failure(collector)
+    
+    def count_faults(self, iovals_list):
+        if not is_container(iovals_list, Sequence):
+            return 1
+        
+        child_count_faults = self.child.count_faults
+        return sum(child_count_faults(ioval) for ioval in iovals_list)
+    
+    def coerce(self, iovals_list, inplace=False):
+        if not self.coerces or not is_container(iovals_list, Sequence):
+            return iovals_list
+        
+        child_coerce = self.child.coerce
+        result_list = iovals_list
+        
+        for index, ioval in enumerate(iovals_list):
+            coerced = child_coerce(ioval, inplace)
+            if coerced is not ioval:
+                if result_list is iovals_list and not (
+                    inplace and isinstance(iovals_list, MutableSequence)
+                    ):
+                    result_list = list(iovals_list)
+                result_list[index] = coerced
+        
+        return keep_sequence_type(iovals_list, result_list)
+    
+    def process(self, iovals_list, output=False, inplace=False):
+        if output:
+            return self.process_output(iovals_list, inplace)
+        
+        if not is_container(iovals_list, Sequence):
+            return iovals_list, self.verify(iovals_list)
+        
+        child_process = self.child.process
+        child_count_process = self.child.count_process
+        result_list = iovals_list
+        collector = None
+        
+        for index, ioval in enumerate(iovals_list):
+            if collector is not None and collector.is_full():
+                coerced, count = child_count_process(ioval, output, inplace)
+                collector.suppressed += count
+                failure = None
+            else:
+                coerced, failure = child_process(ioval, output, inplace)
+            
+            if coerced is not ioval:
+                if result_list is iovals_list and not (
+                    inplace and isinstance(iovals_list, MutableSequence)
+                    ):
+                    result_list = list(iovals_list)
+                result_list[index] = coerced
+            if failure is not None:
+                if collector is None:
+                    collector = FailureCollector(self.max_errors)
+                collector.add(index, failure)
+                if self.fail_fast:
+                    break
+        
+        return (
+            keep_sequence_type(iovals_list, result_list),
+            make_failure(collector),
+            )
+    
+    def emit_check(self, writer, var):
+        emit_sequence_check(writer, var)
+        
+        item_name = writer.name('item')
+        child_check = writer.branch()
+        self.child.emit_check(child_check, item_name)
+        
+        if child_check.lines:
+            writer.line('for {} in {}:'.format(item_name, var))
+            writer.extend(child_check, 1)
+    
+    def emit_coerce(self, writer, src, dst, inplace=False):
+        if not self.coerces:
+            if dst != src:
+                writer.line('{} = {}'.format(dst, src))
+            return
+        
+        index_name = writer.name('index')
+        item_name = writer.name('item')
+        result_name = writer.name('result')
+        
+        writer.line(
+            'if isinstance({0}, Sequence) and '
+            'not isinstance({0}, (str, bytes)):'.format(src)
+            )
+        writer.line('{} = {}'.format(result_name, src), 1)
+        writer.line(
+            'for {}, {} in enumerate({}):'.format(index_name, item_name, src),
+            1
+            )
+        emit_copy_on_write(
+            writer, self.child, src, result_name, item_name, index_name,
+            'list', 'MutableSequence' if inplace else None, 2
+            )
+        emit_keep_sequence_type(writer, src, result_name, 1)
+        writer.line('{} = {}'.format(dst, result_name), 1)
+        
+        if dst != src:
+            writer.line('else:')
+            writer.line('{} = {}'.format(dst, src), 1)
+
+class ScalarListOfNode(ListOfNode):
+    """ A 'ListOf' a builtin scalar type, with no custom typecheck function.
+        
+        When every item has exactly the expected type, the list passes in one
+        tight pass over the item types. Otherwise, the items are checked one
+        by one, which also builds the error report. """
+    def __init__(self, iospec_obj, child, fail_fast=False, max_errors=None):
+        super(ScalarListOfNode, self).__init__(
+            iospec_obj,
+            child,
+            fail_fast,
+            max_errors,
+            )
+        self.exact_types = frozenset([child.expected_type])
+    
+    def verify(self, iovals_list):
+        if (
+            is_container(iovals_list, Sequence) and
+            self.exact_types.issuperset(map(type, iovals_list))
+            ):
+            return None
+        
+        return super(ScalarListOfNode, self).verify(iovals_list)
+    
+    def count_faults(self, iovals_list):
+        if (
+            is_container(iovals_list, Sequence) and
+            self.exact_types.issuperset(map(type, iovals_list))
+            ):
+            return 0
+        
+        return super(ScalarListOfNode, self).count_faults(iovals_list)
+    
+    def process(self, iovals_list, output=False, inplace=False):
+        if output:
+            failure = self.verify(iovals_list)
+            if failure is None:
+                iovals_list = self.coerce(iovals_list, inplace)
+            return iovals_list, failure
+        
+        iovals_list = self.coerce(iovals_list, inplace)
+        return iovals_list, self.verify(iovals_list)
+    
+    def emit_check(self, writer, var):
+        emit_sequence_check(writer, var)
+        
+        exact_types_name = writer.constant(self.exact_types, 'exact_types')
+        item_name = writer.name('item')
+        child_check = writer.branch()
+        self.child.emit_check(child_check, item_name)
+        
+        writer.line(
+            'if not {}.issuperset(map(type, {})):'.format(
+                exact_types_name, var
+                )
+            )
+        writer.line('for {} in {}:'.format(item_name, var), 1)
+        writer.extend(child_check, 2)
+
+class NumpyListOfNode(ScalarListOfNode):
+    """ A 'ListOf(int)' or 'ListOf(float)' that also accepts one-dimensional
+        NumPy arrays with a matching dtype. Arrays are verified by their dtype
+        alone, and are returned by coercion as they are.
+        
+        With 'make_array', coerced lists are converted to arrays. Used by the
+        'numpy' engine, and for 'storage="ndarray"' (see 'ListOf'). """
+    dtype_kinds = {int: 'iu', float: 'f'}
+    dtypes = {int: 'int64', float: 'float64'}
+    
+    def __init__(
+        self,
+        iospec_obj,
+        child,
+        fail_fast=False,
+        max_errors=None,
+        make_array=False,
+        ):
+        super(NumpyListOfNode, self).__init__(
+            iospec_obj,
+            child,
+            fail_fast,
+            max_errors,
+            )
+        self.dtype_kind = self.dtype_kinds[child.expected_type]
+        self.dtype = self.dtypes[child.expected_type]
+        self.make_array = make_array
+        self.coerces = child.coerces or self.make_array
+    
+    def verify(self, iovals_list):
+        if isinstance(iovals_list, numpy.ndarray):
+            if (
+                iovals_list.ndim == 1 and
+                iovals_list.dtype.kind in self.dtype_kind
+                ):
+                return None
+            
+            return NodeFailure(
+                wrong_types=WrongTypePair(self.iospec_obj, iovals_list)
+                )
+        
+        return super(NumpyListOfNode, self).verify(iovals_list)
+    
+    def count_faults(self, iovals_list):
+        if isinstance(iovals_list, numpy.ndarray):
+            if self.verify(iovals_list) is None:
+                return 0
+            return 1
+        
+        return super(NumpyListOfNode, self).count_faults(iovals_list)
+    
+    def coerce(self, iovals_list, inplace=False):
+        if isinstance(iovals_list, numpy.ndarray):
+            return iovals_list
+        
+        if self.child.coerces:
+            iovals_list = super(NumpyListOfNode, self).coerce(
+                iovals_list,
+                inplace,
+                )
+        
+        if (
+            self.make_array and
+            is_container(iovals_list, Sequence) and
+            self.exact_types.issuperset(map(type, iovals_list))
+            ):
+            try:
+                return numpy.fromiter(
+                    iovals_list,
+                    self.dtype,
+                    len(iovals_list),
+                    )
+            except OverflowError:
+                pass
+        
+        return iovals_list
+    
+    def emit_check(self, writer, var):
+        node_name = writer.constant(self, 'node')
+        writer.line('if {}.verify({}) is not None:'.format(node_name, var))
+        writer.line('return False', 1)
+    
+    def emit_coerce(self, writer, src, dst, inplace=False):
+        node_name = writer.constant(self, 'node')
+        writer.line(
+            '{} = {}.coerce({}, {})'.format(dst, node_name, src, inplace)
+            )
+
+class ArrayListOfNode(ScalarListOfNode):
+    """ A 'ListOf(int)' or 'ListOf(float)' with an 'array.array' typecode as
+        its storage (see 'ListOf'). Coerced lists are converted to arrays of
+        that typecode. Arrays are verified like any other sequence. """
+    def __init__(self, iospec_obj, child, fail_fast=False, max_errors=None):
+        super(ArrayListOfNode, self).__init__(
+            iospec_obj,
+            child,
+            fail_fast,
+            max_errors,
+            )
+        self.typecode = iospec_obj.storage
+        self.coerces = True
+    
+    def coerce(self, iovals_list, inplace=False):
+        if (
+            isinstance(iovals_list, array.array) and
+            iovals_list.typecode == self.typecode
+            ):
+            return iovals_list
+        
+        if self.child.coerces:
+            iovals_list = super(ArrayListOfNode, self).coerce(
+                iovals_list,
+                inplace,
+                )
+        
+        if (
+            is_container(iovals_list, Sequence) and
+            self.exact_types.issuperset(map(type, iovals_list))
+            ):
+            try:
+                return array.array(self.typecode, iovals_list)
+            except OverflowError:
+                pass
+        
+        return iovals_list
+    
+    def emit_coerce(self, writer, src, dst, inplace=False):
+        node_name = writer.constant(self, 'node')
+        writer.line(
+            '{} = {}.coerce({}, {})'.format(dst, node_name, src, inplace)
+            )
+
+class GeneratedPlan(PlanNode):
+    """ Runs a plan as generated Python source code (the 'codegen' engine).
+        
+        The nodes of the plan write one 'check' function and one 'coerce'
+        function, with key lookups, 'isinstance' checks and custom function
+        calls inlined. 'check' only decides whether a value passes. When it
+        does not, the plan itself is run to find the faults, so error messages
+        are the same as with the default engine. """
+    def __init__(self, plan):
+        self.plan = plan
+        
+        writer = SourceWriter()
+        
+        check_body = writer.branch()
+        plan.emit_check(check_body, 'ioval')
+        writer.line('def check(ioval):')
+        writer.extend(check_body, 1)
+        writer.line('return True', 1)
+        
+        for function_name, inplace in [
+            ('coerce', False),
+            ('coerce_inplace', True),
+            ]:
+            coerce_body = writer.branch()
+            plan.emit_coerce(coerce_body, 'ioval', 'ioval', inplace)
+            writer.line('')
+            writer.line('def {}(ioval):'.format(function_name))
+            writer.extend(coerce_body, 1)
+            writer.line('return ioval', 1)
+        
+        self.source = '\n'.join(writer.lines)
+        
+        namespace = dict(
+            writer.namespace,
+            Mapping=Mapping,
+            Sequence=Sequence,
+            MutableMapping=MutableMapping,
+            MutableSequence=MutableSequence,
+            TypeCheckSuccessError=TypeCheckSuccessError,
+            TypeCheckFailureError=TypeCheckFailureError,
+            CoercionSuccessError=CoercionSuccessError,
+            TypeCheckSuccess=TypeCheckSuccess,
+            TypeCheckFailure=TypeCheckFailure,
+            CoercionSuccess=CoercionSuccess,
+            )
+        exec(compile(self.source, '<iomanager plan>', 'exec'), namespace)
+        
+        self.check = namespace['check']
+        self.coerce_function = namespace['coerce']
+        self.coerce_inplace_function = namespace['coerce_inplace']
+        self.coerces = plan.coerces
+    
+    def verify(self, ioval):
+        if self.check(ioval):
+            return None
+        
+        return self.plan.verify(ioval)
+    
+    def coerce(self, ioval, inplace=False):
+        if inplace:
+            return self.coerce_inplace_function(ioval)
+        return self.coerce_function(ioval)
+    
+    def process(self, ioval, output=False, inplace=False):
+        if output:
+            if self.check(ioval):
+                return self.coerce(ioval, inplace), None
+            return ioval, self.plan.verify(ioval)
+        
+        ioval = self.coerce(ioval, inplace)
+        return ioval, self.verify(ioval)
+
+class SourceWriter(object):
+    """ Collects lines of generated source code, and the objects that the
+        source code refers to by name. """
+    def __init__(self, namespace=None, constant_names=None, counter=None):
+        self.lines = []
+        self.namespace = {} if namespace is None else namespace
+        self.constant_names = {} if constant_names is None else constant_names
+        self.counter = [0] if counter is None else counter
+    
+    def branch(self):
+        """ A new writer for a block of lines. It shares names and constants
+            with this writer. """
+        return SourceWriter(self.namespace, self.constant_names, self.counter)
+    
+    def line(self, text, indent=0):
+        self.lines.append('    ' * indent + text)
+    
+    def extend(self, writer, indent=0):
+        for line in writer.lines:
+            self.line(line, indent)
+    
+    def name(self, prefix):
+        """ A new, unique variable name. """
+        self.counter[0] += 1
+        return '{}_{}'.format(prefix, self.counter[0])
+    
+    def constant(self, value, prefix='const'):
+        """ An expression for 'value': a literal, or a name in 'namespace'. """
+        if type(value) in (str, bytes, int, bool, type(None)):
+            return repr(value)
+        
+        try:
+            return self.constant_names[id(value)]
+        except KeyError:
+            pass
+        
+        name = self.name(prefix)
+        self.namespace[name] = value
+        self.constant_names[id(value)] = name
+        return name
+
+
+class FunctionDispatcher(object):
+    """ Finds the custom function for an expected type, and remembers it.
+        
+        A function registered for a class also applies to its subclasses,
+        unless a subclass has its own function; the nearest class in the
+        method resolution order wins. Functions registered for 'object' only
+        apply to 'object' itself. A builtin scalar type ('bool', 'int', 'str',
+        etc.) only gets its own function, so a function for 'int' does not
+        apply to 'bool'; it does apply to user subclasses of 'int'. """
+    def __init__(self, functions):
+        self.functions = functions
+        self.cache = {}
+    
+    def get(self, expected_type):
+        """ The function for 'expected_type', or 'None'. """
+        try:
+            function = self.cache.get(expected_type, NotProvided)
+        except TypeError:
+            # Unhashable types can not have functions.
+            return None
+        
+        if function is NotProvided:
+            function = self.cache[expected_type] = self.find(expected_type)
+        
+        return function
+    
+    def find(self, expected_type):
+        functions = self.functions
+        if not functions:
+            return None
+        
+        candidates = [expected_type]
+        if (
+            isinstance(expected_type, type) and
+            expected_type not in BUILTIN_SCALAR_TYPES
+            ):
+            candidates.extend(
+                candidate for candidate in expected_type.__mro__[1:]
+                if candidate is not object
+                )
+        
+        for candidate in candidates:
+            function = functions.get(candidate)
+            if function is not None:
+                return function
+        
+        return None
+
+class AsyncFunction(object):
+    """ Stands in for a custom function in the plan used by 'aprocess' and
+        'acoerce' (see 'IOProcessor.run_async').
+        
+        The function can return an awaitable; a coroutine function, for
+        example. The awaitable is not awaited here. It is added to the
+        pending calls of the current 'AsyncCalls', and a placeholder result
+        is returned: 'PendingCoercion' for a coercion function, or 'None'
+        (use the normal type check) for a typecheck function. On the next
+        pass over the iovalue, the awaited result is used.
+        
+        Typecheck functions are not called with 'PendingCoercion'; the value
+        is type checked once its coercion is known, on a later pass.
+        
+        Results are remembered by value identity and expected type, so the
+        function is called once for each value, however many passes are
+        made. """
+    def __init__(self, function, coercion):
+        self.function = function
+        self.coercion = coercion
+    
+    def __call__(self, ioval, expected_type):
+        if ioval is PendingCoercion:
+            # This pass fails anyway, and is made again.
+            return TypeCheckFailure
+        
+        calls = async_calls.get()
+        key = (self, id(ioval), expected_type)
+        
+        try:
+            ioval, result, error = calls.results[key]
+        except KeyError:
+            if key in calls.pending:
+                return self.make_placeholder(ioval)
+            
+            try:
+                result = self.function(ioval, expected_type)
+            except ASYNC_RESULT_ERRORS as exc:
+                result, error = None, exc
+            else:
+                if inspect.isawaitable(result):
+                    calls.pending[key] = (ioval, result)
+                    return self.make_placeholder(ioval)
+                error = None
+            
+            calls.results[key] = (ioval, result, error)
+        
+        if error is not None:
+            raise error
+        return result
+    
+    def make_placeholder(self, ioval):
+        if self.coercion:
+            return PendingCoercion
+        return None
+
+class AsyncCalls(object):
+    """ The custom function calls of one 'IOProcessor.run_async' call. See
+        'AsyncFunction'. Each value of 'results' and 'pending' holds the
+        value the function was called with, so its 'id' is not reused. """
+    __slots__ = ('results', 'pending')
+    
+    def __init__(self):
+        self.results = {}
+        self.pending = {}
+    
+    async def resolve(self, concurrency=None):
+        """ Await the pending calls concurrently, at most 'concurrency' at a
+            time, and remember their results. """
+        pending = self.pending
+        self.pending = {}
+        
+        if concurrency is None:
+            semaphore = None
+        else:
+            semaphore = asyncio.Semaphore(concurrency)
+        
+        outcomes = await asyncio.gather(
+            *[
+                await_result(awaitable, semaphore)
+                for ioval, awaitable in pending.values()
+                ],
+            return_exceptions=True
+            )
+        
+        unexpected_error = None
+        
+        for (key, (ioval, awaitable)), outcome in zip(
+            pending.items(),
+            outcomes,
+            ):
+            if isinstance(outcome, ASYNC_RESULT_ERRORS):
+                self.results[key] = (ioval, None, outcome)
+            elif isinstance(outcome, BaseException):
+                if unexpected_error is None:
+                    unexpected_error = outcome
+            else:
+                self.results[key] = (ioval, outcome, None)
+        
+        if unexpected_error is not None:
+            raise unexpected_error
+
+class PlanCompiler(object):
+    """ Compiles iospecs into plans, for one set of custom functions.
+        
+        With 'numpy_lists', 'ListOf(int)' and 'ListOf(float)' compile to
+        'NumpyListOfNode' instances (see the 'numpy' engine). Without
+        'list_storage', the 'storage' of 'ListOf' iospecs is left out. With
+        'fail_fast', container nodes stop verification at the first fault.
+        With 'max_errors', they hold at most that many faults (see
+        'FailureCollector').
+        
+        Plans for frozen iospecs (see 'freeze_iospec') are memoized. Processors
+        with the same iospec and the same custom functions share one plan, and
+        identical parts of different iospecs share nodes. """
+    def __init__(
+        self,
+        typecheck_functions={},
+        coercion_functions={},
+        numpy_lists=False,
+        fail_fast=False,
+        max_errors=None,
+        list_storage=True,
+        ):
+        self.typecheck_dispatcher = FunctionDispatcher(typecheck_functions)
+        self.coercion_dispatcher = FunctionDispatcher(coercion_functions)
+        self.numpy_lists = numpy_lists
+        self.fail_fast = fail_fast
+        self.max_errors = max_errors
+        self.list_storage = list_storage
+        
+        try:
+            self.functions_key = tuple(
+                frozenset(functions.items())
+                for functions in [typecheck_functions, coercion_functions]
+                ) + (numpy_lists, fail_fast, max_errors, list_storage)
+        except TypeError:
+            self.functions_key = None
+    
+    def compile(
+        self,
+        iospec,
+        required_iospec=NotProvided,
+        nonetype_ok=True,
+        unlimited=False,
+        ):
+        if (
+            self.functions_key is None or
+            not is_frozen_iospec(iospec) or
+            not is_frozen_iospec(required_iospec)
+            ):
+            return self.make_node(
+                iospec, required_iospec, nonetype_ok, unlimited
+                )
+        
+        key = (
+            self.functions_key,
+            iospec,
+            required_iospec,
+            nonetype_ok,
+            unlimited,
+            )
+        
+        try:
+            return compiled_plans[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Unhashable iospec values can not be memoized.
+            return self.make_node(
+                iospec, required_iospec, nonetype_ok, unlimited
+                )
+        
+        node = self.make_node(iospec, required_iospec, nonetype_ok, unlimited)
+        compiled_plans[key] = node
+        return node
+    
+    def make_node(self, iospec, required_iospec, nonetype_ok, unlimited):
+        if is_container(iospec, Mapping):
+            if not is_container(required_iospec, Mapping):
+                required_iospec = {}
+            
+            children = {
+                ikey: self.compile(
+                    ivalue,
+                    required_iospec.get(ikey, NotProvided),
+                    )
+                for ikey, ivalue in iospec.items()
+                }
+            return DictNode(
+                children,
+                required_iospec,
+                unlimited,
+                self.fail_fast,
+                self.max_errors,
+                )
+        
+        if isinstance(iospec, ListOf):
+            if isinstance(required_iospec, ListOf):
+                required_item = required_iospec.iospec_obj
+            else:
+                required_item = NotProvided
+            
+            child = self.compile(
+                iospec.iospec_obj,
+                required_item,
+                nonetype_ok=False,
+                )
+            limits = (self.fail_fast, self.max_errors)
+            if iospec.storage is not None and self.list_storage:
+                return self.make_storage_node(iospec, child, limits)
+            if type(child) is BuiltinScalarNode:
+                if (
+                    self.numpy_lists and
+                    child.expected_type in NumpyListOfNode.dtypes
+                    ):
+                    return NumpyListOfNode(iospec, child, *limits)
+                return ScalarListOfNode(iospec, child, *limits)
+            return ListOfNode(iospec, child, *limits)
+        
+        if is_container(iospec, Sequence):
+            if not is_container(required_iospec, Sequence):
+                required_iospec = ()
+            
+            children = [
+                self.compile(
+                    ivalue,
+                    (
+                        required_iospec[index]
+                        if index < len(required_iospec) else
+                        NotProvided
+                        ),
+                    )
+                for index, ivalue in enumerate(iospec)
+                ]
+            return ListNode(
+                iospec,
+                children,
+                required_iospec,
+                unlimited,
+                self.fail_fast,
+                self.max_errors,
+                )
+        
+        if iospec is NotProvided:
+            iospec = AnyType
+        
+        node_kwargs = {
+            'nonetype_ok': nonetype_ok,
+            'coercion_function': self.coercion_dispatcher.get(iospec),
+            }
+        
+        typecheck_function = self.typecheck_dispatcher.get(iospec)
+        
+        if typecheck_function is not None:
+            return TypeCheckFunctionNode(
+                iospec,
+                typecheck_function,
+                **node_kwargs
+                )
+        
+        if iospec is AnyType:
+            return AnyTypeNode(iospec, **node_kwargs)
+        
+        if is_builtin_scalar(iospec):
+            return BuiltinScalarNode(iospec, **node_kwargs)
+        
+        return ScalarNode(iospec, **node_kwargs)
+    
+    def make_storage_node(self, iospec, child, limits):
+        if type(child) is not BuiltinScalarNode:
+            raise ValueError(
+                "'storage' can not be used when a custom typecheck function "
+                "applies to the items of {}.".format(iospec)
+                )
+        
+        if iospec.storage != 'ndarray':
+            return ArrayListOfNode(iospec, child, *limits)
+        
+        if numpy is None:
+            raise ImportError(
+                "'storage={}' requires NumPy.".format(repr(iospec.storage))
+                )
+        return NumpyListOfNode(iospec, child, *limits, make_array=True)
+
 
 
 # ----------------------------- Processor ------------------------------
 
 class IOProcessor(object):
+    engine = 'plan'
+    fail_fast = False
+    max_errors = None
+    concurrency = None
+    list_storage = True
+    
     def __init__(
         self,
         required=NotProvided,
@@ -182,7 +2113,12 @@ class IOProcessor(object):
         unlimited=False,
         typecheck_functions=NotProvided,
         coercion_functions=NotProvided,
-        error_msg='Invalid input/output.'
+        error_msg='Invalid input/output.',
+        engine=NotProvided,
+        fail_fast=NotProvided,
+        max_errors=NotProvided,
+        concurrency=NotProvided,
+        list_storage=NotProvided,
         ):
         self.required = required
         self.optional = optional
@@ -193,273 +2129,484 @@ class IOProcessor(object):
             self.typecheck_functions = typecheck_functions.copy()
         if coercion_functions is not NotProvided:
             self.coercion_functions = coercion_functions.copy()
+        if engine is not NotProvided:
+            self.engine = engine
+        if fail_fast is not NotProvided:
+            self.fail_fast = fail_fast
+        if max_errors is not NotProvided:
+            self.max_errors = max_errors
+        if concurrency is not NotProvided:
+            self.concurrency = concurrency
+        if list_storage is not NotProvided:
+            self.list_storage = list_storage
+        
+        self.plan = self.make_plan()
     
-    def verify(self, iovalue):
-        required, optional, unlimited = [
-            getattr(self, attr_name)
-            for attr_name in ['required', 'optional', 'unlimited']
-            ]
-        
-        combined_iospec = combine_iospecs(required, optional)
-        
-        missing = self.difference_ioval(required, iovalue)
-        unknown = self.difference_ioval(
-            iovalue,
-            combined_iospec,
-            abbreviate=True,
-            )
-        
-        if unlimited is True:
-            unknown = self.filter_unlimited(unknown, combined_iospec)
-        
-        try:
-            self.confirm_type_ioval(iovalue, combined_iospec)
-        except WrongTypeError as exc:
-            wrong_types = exc.failure_result
-        else:
-            wrong_types = None
-        
-        if (
-            missing is NoDifference and
-            unknown is NoDifference and
-            wrong_types is None
-            ):
-            # Verification passes.
-            return
+    def make_plan(self):
+        """ Compile the iospec values and custom functions into a verification
+            plan, and return it. This is done once, by '__init__'. If
+            'required', 'optional', 'unlimited' or the custom functions of an
+            existing processor are changed, its plan must be re-made with
+            'processor.plan = processor.make_plan()'.
+            
+            With 'engine="codegen"', the plan is run as generated source code
+            (see 'GeneratedPlan'). With 'engine="numpy"', 'ListOf(int)' and
+            'ListOf(float)' values can be NumPy arrays (see
+            'NumpyListOfNode'); this engine requires NumPy.
+            
+            With 'fail_fast=True', verification stops at the first missing
+            key, unknown key or wrong type, and the error message only shows
+            that fault. With 'max_errors=N', at most N faults are collected;
+            the error message then ends with the number of faults that are
+            not shown. With 'list_storage=False', the 'storage' of 'ListOf'
+            iospecs is not used: coerced lists stay lists. """
+        for name in ['max_errors', 'concurrency']:
+            value = getattr(self, name)
+            if value is not None and not (
+                isinstance(value, int) and value > 0
+                ):
+                raise ValueError(
+                    "'{}' must be a positive integer or 'None'. Got: {}"
+                    .format(name, value)
+                    )
+        
+        if self.engine not in ENGINES:
+            raise ValueError(
+                "'engine' must be one of {}. Got: {}"
+                .format(sorted(ENGINES), self.engine)
+                )
         
-        # Verification fails.
-        err_msg_parts = [
-            caption_part + str(output_part)
-            for caption_part, output_part in
-            [
-                ('Missing: ', make_missing_output(missing)),
-                ('Not allowed: ', unknown),
-                ('Wrong type: ', wrong_types),
-                ]
-            if output_part and output_part is not NoDifference
-            ]
+        if self.engine == 'numpy' and numpy is None:
+            raise ImportError("The 'numpy' engine requires NumPy.")
         
-        error_msg = '\n'.join([self.error_msg] + err_msg_parts)
+        compiler = self.make_compiler(
+            getattr(self, 'typecheck_functions', {}),
+            getattr(self, 'coercion_functions', {}),
+            )
+        self.typecheck_dispatcher = compiler.typecheck_dispatcher
+        self.coercion_dispatcher = compiler.coercion_dispatcher
         
-        raise VerificationFailureError(error_msg)
-
-    def difference_ioval(
+        return self.compile_plan(compiler)
+    
+    def make_async_plan(self, all_faults=False):
+        """ A plan like 'plan', with each custom function wrapped in an
+            'AsyncFunction'. See 'run_async'. With 'all_faults=True', the plan
+            finds every fault, whatever 'fail_fast' and 'max_errors' are. """
+        compiler = self.make_compiler(
+            wrap_async_functions(getattr(self, 'typecheck_functions', {})),
+            wrap_async_functions(
+                getattr(self, 'coercion_functions', {}),
+                coercion=True,
+                ),
+            all_faults=all_faults,
+            )
+        return self.compile_plan(compiler)
+    
+    def make_compiler(
         self,
-        item_a,
-        item_b=NotProvided,
-        abbreviate=False,
+        typecheck_functions,
+        coercion_functions,
+        all_faults=False,
         ):
-        if all_are_containers((item_a, item_b), Mapping):
-            return self.difference_dict(item_a, item_b, abbreviate)
-        
-        if all_are_containers((item_a, item_b), (Sequence, ListOf)):
-            return self.difference_list(item_a, item_b, abbreviate)
-        
-        if item_b is NotProvided:
-            if abbreviate:
-                # For 'unknown' output. Abbreviate container results.
-                try:
-                    return UnknownContainer(item_a)
-                except TypeError:
-                    pass
-            
-            return item_a
-        
-        return NoDifference
+        """ With 'all_faults=True', plans find every fault, whatever
+            'fail_fast' and 'max_errors' are. """
+        if all_faults:
+            fail_fast, max_errors = False, None
+        else:
+            fail_fast, max_errors = self.fail_fast, self.max_errors
+        
+        return PlanCompiler(
+            typecheck_functions=typecheck_functions,
+            coercion_functions=coercion_functions,
+            numpy_lists=self.engine == 'numpy',
+            fail_fast=fail_fast,
+            max_errors=max_errors,
+            list_storage=self.list_storage,
+            )
     
-    def difference_dict(self, dict_a, dict_b, *pargs, **kwargs):
-        result = {}
-        
-        for ikey, item_a in dict_a.items():
-            item_b = dict_b.get(ikey, NotProvided)
-            item_result = (
-                self.difference_ioval(item_a, item_b, *pargs, **kwargs)
-                )
-            if item_result is not NoDifference:
-                result[ikey] = item_result
-        
-        if result:
-            return result
+    def get_plan_iospecs(self):
+        """ The combined iospec that plans are compiled from, and the
+            'required' and 'optional' iospecs it is combined from. """
+        try:
+            required = freeze_iospec(self.required)
+            optional = freeze_iospec(self.optional)
+        except TypeError:
+            # Unhashable iospec values. Compile without memoization.
+            required, optional = self.required, self.optional
         
-        return NoDifference
+        return combine_iospecs(required, optional), required, optional
     
-    def difference_list(self, list_a, list_b, *pargs, **kwargs):
-        """ The difference between two lists, or between a list and a
-            ListOf. """
-        for item in [list_a, list_b]:
-            try:
-                target_length = len(item)
-                break
-            except TypeError:
-                continue
-        else:
-            raise TypeError(
-                "At least one of 'list_a', 'list_b' must be an iterable. Got: "
-                "list_a={}, list_b={}".format(list_a, list_b)
-                )
+    def compile_plan(self, compiler, batch=False):
+        """ With 'batch=True', the plan is for a list of iovalues. See
+            'make_batch_plan'. """
+        iospec, required, optional = self.get_plan_iospecs()
+        
+        if batch:
+            iospec = ListOf(iospec)
+            if required is not NotProvided:
+                required = ListOf(required)
+        
+        plan = compiler.compile(
+            iospec,
+            required,
+            unlimited=self.unlimited is True,
+            )
         
-        dict_a, dict_b = [
-            make_dict_from_listlike(item, target_length)
-            for item in [list_a, list_b]
-            ]
+        if self.engine == 'codegen':
+            plan = generate_plan(plan)
         
-        return self.difference_dict(dict_a, dict_b, *pargs, **kwargs)
+        return plan
     
-    def filter_unlimited(self, unknown, combined_iospec):
-        """ Take the 'unlimited' argument into account. Only keys in the
-            intersection of 'unknown' and 'iospec_dict' are considered unknown
-            when 'unlimited=True'.
+    def make_batch_plan(self):
+        """ A plan for a list of iovalues, that each match the iospec of
+            'plan': 'ListOf' that iospec. See 'process_batch'.
             
-            In other words, when unlimited=True, top-level keys (and only
-            top-level keys) are unlimited."""
-        if unknown is NoDifference:
-            return NoDifference
-        
-        if is_container(combined_iospec, (Sequence, ListOf)):
-            iospec_dict = make_dict_from_listlike(combined_iospec, len(unknown))
-        else:
-            iospec_dict = combined_iospec
+            The batch plan is stricter than 'plan'. The items of the list can
+            not be 'None', and their dictionaries can not have unknown keys
+            even with 'unlimited=True'. It finds every fault, so the failure
+            of a list names every item that fails. """
+        compiler = self.make_compiler(
+            getattr(self, 'typecheck_functions', {}),
+            getattr(self, 'coercion_functions', {}),
+            all_faults=True,
+            )
+        return self.compile_plan(compiler, batch=True)
+    
+    def get_batch_plan(self):
+        """ The plan made by 'make_batch_plan'. It is made once for each
+            'plan', when it is first needed. """
+        try:
+            plan, batch_plan = self.batch_plans
+        except AttributeError:
+            plan = None
         
-        result = {
-            ikey: ivalue for ikey, ivalue in unknown.items()
-            if ikey in iospec_dict
-            }
+        if plan is not self.plan:
+            batch_plan = self.make_batch_plan()
+            self.batch_plans = (self.plan, batch_plan)
         
-        if not result:
-            return NoDifference
-        return result
+        return batch_plan
     
-    def confirm_type_ioval(self, ioval, expected_type, nonetype_ok=True):
-        if expected_type is NotProvided:
-            expected_type = AnyType
-        
-        # Verify container types.
-        if is_container(expected_type, Mapping):
-            self.confirm_type_dict(ioval, expected_type)
-            return
+    def warm_up(self, batch_plans=False, async_plans=False):
+        """ Make the values that are otherwise made when they are first
+            needed: the names of the 'ListOf' iospecs, which are used in error
+            messages, and, with 'batch_plans' and 'async_plans', the plans of
+            'process_batch' and 'run_async'. 'plan' is made by '__init__'.
+            
+            Call it before forking worker processes, so each worker does not
+            make (and write to the memory pages of) its own copy. """
+        iospecs = [self.required, self.optional]
+        iospecs.extend(self.get_plan_iospecs())
+        
+        for iospec in iospecs:
+            for list_of in iter_list_of_iospecs(iospec):
+                list_of.__name__
+        
+        if batch_plans:
+            self.get_batch_plan()
+        if async_plans:
+            self.get_async_plans()
+    
+    def get_async_plans(self):
+        """ The plans made by 'make_async_plan': the plan that collects the
+            custom function calls of 'run_async', which finds every fault, and
+            the plan of its last pass. They are made once for each 'plan',
+            when they are first needed. """
+        try:
+            plan, calls_plan, async_plan = self.async_plans
+        except AttributeError:
+            plan = None
+        
+        if plan is not self.plan:
+            async_plan = self.make_async_plan()
+            if self.fail_fast or self.max_errors is not None:
+                calls_plan = self.make_async_plan(all_faults=True)
+            else:
+                calls_plan = async_plan
+            self.async_plans = (self.plan, calls_plan, async_plan)
+        
+        return calls_plan, async_plan
+    
+    def __getstate__(self):
+        """ The plan, which can hold generated code, is not pickled. It is
+            made again when the processor is unpickled. """
+        state = self.__dict__.copy()
+        for key in [
+            'plan',
+            'batch_plans',
+            'async_plans',
+            'typecheck_dispatcher',
+            'coercion_dispatcher',
+            ]:
+            state.pop(key, None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.plan = self.make_plan()
+    
+    def verify(self, iovalue):
+        failure = self.plan.verify(iovalue)
         
-        if is_container(expected_type, (Sequence, ListOf)):
-            self.confirm_type_list(ioval, expected_type)
+        if failure is None:
+            # Verification passes.
             return
         
-        # Custom type-checking function.
-        try:
-            typecheck_function = self.typecheck_functions[expected_type]
-        except (KeyError, AttributeError):
-            pass
-        else:
-            try:
-                typecheck_function(ioval, expected_type)
-            except TypeCheckSuccessError:
-                return
-            except TypeCheckFailureError:
-                raise WrongTypeError(expected_type, ioval)
-        
-        # Catch 'None' values.
-        if ioval is None and not nonetype_ok:
-            raise WrongTypeError(expected_type, ioval)
+        # Verification fails.
+        raise self.make_error(failure)
+    
+    def process_input(self, iovalue, inplace=False):
+        """ coerce(), then verify(), in a single pass over 'iovalue'. """
+        return self.process(iovalue, output=False, inplace=inplace)
+    
+    def process_output(self, iovalue, inplace=False):
+        """ verify(), then coerce() if 'iovalue' passes. """
+        return self.process(iovalue, output=True, inplace=inplace)
+    
+    def process(self, iovalue, output, inplace=False):
+        coerced_iovalue, failure = self.plan.process(iovalue, output, inplace)
         
-        # General case.
-        if (
-            isinstance(ioval, expected_type) or
-            (expected_type is AnyType) or
-            (ioval is None and nonetype_ok)
-            ):
-            return
+        if failure is not None:
+            raise self.make_error(failure)
         
-        raise WrongTypeError(expected_type, ioval)
+        return coerced_iovalue
     
-    def confirm_type_dict(self, iovals_dict, iospec_dict, nonetype_ok=True):
-        if not isinstance(iovals_dict, Mapping):
-            raise WrongTypeError(dict, iovals_dict)
+    async def aprocess_input(self, iovalue, inplace=False):
+        """ process_input(), with awaitable custom functions. See
+            'run_async'. """
+        return await self.aprocess(iovalue, output=False, inplace=inplace)
+    
+    async def aprocess_output(self, iovalue, inplace=False):
+        """ process_output(), with awaitable custom functions. See
+            'run_async'. """
+        return await self.aprocess(iovalue, output=True, inplace=inplace)
+    
+    async def aprocess(self, iovalue, output, inplace=False):
+        coerced_iovalue, failure = await self.run_async(
+            lambda plan, inplace: plan.process(iovalue, output, inplace),
+            inplace,
+            )
         
-        wrong_types = {}
+        if failure is not None:
+            raise self.make_error(failure)
         
-        for key, ioval in iovals_dict.items():
-            if key not in iospec_dict:
-                continue
+        return coerced_iovalue
+    
+    async def run_async(self, run, inplace=False):
+        """ Call 'run(plan, inplace)' with a plan whose custom functions can
+            return awaitables (see 'AsyncFunction'), and return its result.
             
-            expected_type = iospec_dict[key]
+            Each pass over the iovalue collects the awaitables returned by the
+            custom functions. They are awaited concurrently with
+            'asyncio.gather', at most 'concurrency' at a time, and the next
+            pass uses their results. Passes are made until one finds no new
+            awaitables; that pass gives the result. A typecheck function of a
+            value made by an awaitable coercion function needs one more pass.
             
+            Passes are not made in place, and find every fault, so a
+            placeholder value that fails (see 'PendingCoercion') does not stop
+            'fail_fast' or 'max_errors' plans from collecting the other
+            calls. Once every result is known, a last pass is made with the
+            processor's own settings, in place with 'inplace=True'. """
+        calls_plan, plan = self.get_async_plans()
+        calls = AsyncCalls()
+        
+        while True:
+            token = async_calls.set(calls)
             try:
-                self.confirm_type_ioval(ioval, expected_type, nonetype_ok)
-            except WrongTypeError as exc:
-                wrong_types[key] = exc.failure_result
-        
-        if wrong_types:
-            raise WrongTypeDictError(wrong_types)
+                result = run(calls_plan, False)
+                if not calls.pending and (inplace or plan is not calls_plan):
+                    result = run(plan, inplace)
+            finally:
+                async_calls.reset(token)
+            
+            if not calls.pending:
+                return result
+            
+            await calls.resolve(self.concurrency)
+    
+    def process_input_many(self, iovalues, inplace=False):
+        """ process_input() for each of 'iovalues'. Return a 'BatchResult'. """
+        return self.process_many(iovalues, output=False, inplace=inplace)
     
-    def confirm_type_list(self, iovals_list, iospec_obj):
-        """ 'None' values are not permitted when ListOf is expected.
+    def process_output_many(self, iovalues, inplace=False):
+        """ process_output() for each of 'iovalues'. Return a 'BatchResult'.
+            """
+        return self.process_many(iovalues, output=True, inplace=inplace)
+    
+    def process_many(self, iovalues, output, inplace=False):
+        """ Process each of 'iovalues', which can be any iterable. An iovalue
+            that fails verification does not stop processing; its error
+            message is recorded in the 'BatchResult' instead. """
+        plan_process = self.plan.process
+        values = []
+        errors = {}
+        messages = {}
+        
+        for index, iovalue in enumerate(iovalues):
+            coerced_iovalue, failure = plan_process(iovalue, output, inplace)
             
-            An attribute called 'lists_allow_none_values' is being considered
-            to allow modification of this behavior. """
-        if not is_container(iovals_list, Sequence):
-            raise WrongTypeError(iospec_obj, iovals_list)
+            if failure is None:
+                values.append(coerced_iovalue)
+                continue
+            
+            values.append(None)
+            errors[index] = self.make_shared_error_message(failure, messages)
         
-        iovals_dict = make_dict_from_listlike(iovals_list)
+        return BatchResult(values, errors)
+    
+    def process_batch(self, iovalues, output, inplace=False):
+        """ 'plan.process' for each iovalue of the list 'iovalues'. Return a
+            list of '(coerced_iovalue, failure)' pairs.
+            
+            The list is processed as a whole, by the batch plan (see
+            'make_batch_plan'), which is faster for many small iovalues;
+            scalar iovalues, in particular, are checked in a single loop. Each
+            custom function is called once for each value, as with
+            'plan.process'. The iovalues that fail the batch plan are then
+            verified again by 'plan', which is less strict.
+            
+            Output is verified before it is coerced, and the batch plan does
+            not coerce the passing iovalues of a failing list. So output
+            iovalues that need coercion are each processed on their own. """
+        if output and self.plan.coerces:
+            plan_process = self.plan.process
+            return [
+                plan_process(iovalue, output, inplace)
+                for iovalue in iovalues
+                ]
         
-        iospec = make_dict_from_listlike(iospec_obj, len(iovals_list))
+        coerced_iovalues, failure = self.get_batch_plan().process(
+            list(iovalues),
+            output,
+            inplace,
+            )
         
-        nonetype_ok = not isinstance(iospec_obj, ListOf)
+        if failure is None:
+            return [
+                (coerced_iovalue, None)
+                for coerced_iovalue in coerced_iovalues
+                ]
         
-        self.confirm_type_dict(iovals_dict, iospec, nonetype_ok=nonetype_ok)
-    
-    def coerce(self, iovalue):
-        required, optional = [
-            getattr(self, attr_name)
-            for attr_name in ['required', 'optional']
+        failed_indices = get_failure_keys(failure)
+        plan_verify = self.plan.verify
+        return [
+            (
+                coerced_iovalue,
+                plan_verify(coerced_iovalue) if index in failed_indices
+                else None,
+                )
+            for index, coerced_iovalue in enumerate(coerced_iovalues)
             ]
-        
-        combined_iospec = combine_iospecs(required, optional)
-        
-        return self.coerce_ioval(iovalue, combined_iospec)
     
-    def coerce_ioval(self, ioval, expected_type, nonetype_ok=True):
-        # Coerce container types.
-        if is_container(expected_type, Mapping):
-            return self.coerce_dict(ioval, expected_type)
+    def iter_process_input(self, iovalues, on_error='raise', inplace=False):
+        """ process_input() for each of 'iovalues', lazily. See
+            'iter_process'. """
+        return self.iter_process(iovalues, False, on_error, inplace)
+    
+    def iter_process_output(self, iovalues, on_error='raise', inplace=False):
+        """ process_output() for each of 'iovalues', lazily. See
+            'iter_process'. """
+        return self.iter_process(iovalues, True, on_error, inplace)
+    
+    def iter_process(
+        self,
+        iovalues,
+        output,
+        on_error='raise',
+        inplace=False,
+        error_class=VerificationFailureError,
+        ):
+        """ Return an iterator of the processed 'iovalues', which can be any
+            iterable. Each iovalue is only taken from 'iovalues' when the
+            iterator is advanced, so memory use does not grow with the number
+            of iovalues.
+            
+            'on_error' decides what happens to an iovalue that fails
+            verification:
+                'raise' --> Raise the error ('error_class').
+                'skip' --> Leave it out.
+                'yield' --> Yield a 'ProcessingFailure' in its place.
+            """
+        if on_error not in ON_ERROR_POLICIES:
+            raise ValueError(
+                "'on_error' must be one of {}. Got: {}"
+                .format(list(ON_ERROR_POLICIES), on_error)
+                )
         
-        if is_container(expected_type, (Sequence, ListOf)):
-            return self.coerce_list(ioval, expected_type)
+        return self.generate_processed(
+            iovalues,
+            output,
+            on_error,
+            inplace,
+            error_class,
+            )
+    
+    def generate_processed(
+        self,
+        iovalues,
+        output,
+        on_error,
+        inplace,
+        error_class,
+        ):
+        plan_process = self.plan.process
         
-        # Coerce non-container types.
+        for index, iovalue in enumerate(iovalues):
+            coerced_iovalue, failure = plan_process(iovalue, output, inplace)
+            
+            if failure is None:
+                yield coerced_iovalue
+            elif on_error == 'raise':
+                raise self.make_error(failure, error_class)
+            elif on_error == 'yield':
+                yield ProcessingFailure(
+                    index,
+                    iovalue,
+                    self.make_error(failure, error_class),
+                    )
+    
+    def make_error(self, failure, error_class=VerificationFailureError):
+        """ Make a 'VerificationFailureError' (or an instance of
+            'error_class') from a 'NodeFailure'. The error message is made
+            when it is read. """
+        return error_class(error_msg=self.error_msg, failure=failure)
+    
+    def make_shared_error_message(self, failure, messages):
+        """ The error message for 'failure'. 'messages' is a dictionary that
+            is shared by calls for the same batch of iovalues; a message is
+            only made once for identical failures. """
         try:
-            coercion_function = self.coercion_functions[expected_type]
-        except (KeyError, AttributeError):
-            return ioval
+            key = failure_key(failure)
+        except TypeError:
+            # Unhashable values in the failure. Share equal messages.
+            key = self.make_error_message(failure)
         
         try:
-            return coercion_function(ioval, expected_type)
-        except CoercionSuccessError as exc:
-            return exc.args[0]
+            return messages[key]
+        except KeyError:
+            message = messages[key] = self.make_error_message(failure)
+            return message
     
-    def coerce_dict(self, iovals_dict, iospec, nonetype_ok=True):
-        result_iovals = {}
-        
-        for key, ioval in iovals_dict.items():
-            try:
-                expected_type = iospec[key]
-            except KeyError:
-                result_iovals[key] = ioval
-                continue
+    def make_error_message(self, failure):
+        return make_error_message(self.error_msg, failure)
+    
+    def coerce(self, iovalue, inplace=False):
+        """ Apply the coercion functions to 'iovalue'.
             
-            result_iovals[key] = self.coerce_ioval(ioval, expected_type)
-        
-        return result_iovals
+            By default, 'iovalue' is not changed; containers are copied where
+            their contents change. With 'inplace=True', dictionaries, lists
+            and other mutable containers are updated in place instead. Only
+            use this for a value nothing else refers to, such as a freshly
+            decoded request body. Immutable containers (tuples, for example)
+            are still copied, so always use the return value. """
+        return self.plan.coerce(iovalue, inplace)
     
-    def coerce_list(self, iovals_list, iospec_obj):
-        iovals_dict = make_dict_from_listlike(iovals_list)
-        
-        iospec = make_dict_from_listlike(iospec_obj, len(iovals_list))
-        
-        result_dict = self.coerce_dict(iovals_dict, iospec)
-        
-        result_list = [
-            result_dict[ikey] for ikey in sorted(result_dict.keys())
-            ]
-        
-        return result_list
+    async def acoerce(self, iovalue, inplace=False):
+        """ coerce(), with awaitable custom functions. See 'run_async'. """
+        return await self.run_async(
+            lambda plan, inplace: plan.coerce(iovalue, inplace),
+            inplace,
+            )
 
 class IOManager(object):
     def __init__(
@@ -468,11 +2615,22 @@ class IOManager(object):
         output_kwargs={},
         typecheck_functions=NotProvided,
         coercion_functions=NotProvided,
+        engine=NotProvided,
+        fail_fast=NotProvided,
+        max_errors=NotProvided,
+        concurrency=NotProvided,
         ):
         # Lowest precedence - General defaults from (sub)class attributes.
         default_general_kwargs = {
             ikey: getattr(self, ikey, NotProvided)
-            for ikey in ['typecheck_functions', 'coercion_functions']
+            for ikey in [
+                'typecheck_functions',
+                'coercion_functions',
+                'engine',
+                'fail_fast',
+                'max_errors',
+                'concurrency',
+                ]
             }
         
         # Next precedence - Specific defaults from (sub)class attributes.
@@ -487,6 +2645,10 @@ class IOManager(object):
             for ikey, ivalue in [
                 ('typecheck_functions', typecheck_functions),
                 ('coercion_functions', coercion_functions),
+                ('engine', engine),
+                ('fail_fast', fail_fast),
+                ('max_errors', max_errors),
+                ('concurrency', concurrency),
                 ]
             if ivalue is not NotProvided
             }
@@ -496,6 +2658,9 @@ class IOManager(object):
             default_general_kwargs.copy() for i in range(2)
             ]
         
+        # 'ListOf' storage is for input. Output stays serializable.
+        total_output_kwargs['list_storage'] = False
+        
         total_input_kwargs.update(default_input_kwargs)
         total_output_kwargs.update(default_output_kwargs)
         
@@ -515,19 +2680,69 @@ class IOManager(object):
             **total_output_kwargs
             )
     
-    def process_input(self, iovalue):
+    def process_input(self, iovalue, inplace=False):
         """ coerce(), then verify(). """
-        coerced_iovalue = self.coerce_input(iovalue)
-        self.verify_input(coerced_iovalue)
-        
-        return coerced_iovalue
+        try:
+            return self.input_processor.process_input(iovalue, inplace)
+        except VerificationFailureError as exc:
+            raise copy_error(exc, InputVerificationFailureError)
     
-    def process_output(self, iovalue):
+    def process_output(self, iovalue, inplace=False):
         """ verify(), then coerce(). """
-        self.verify_output(iovalue)
-        coerced_iovalue = self.coerce_output(iovalue)
-        
-        return coerced_iovalue
+        try:
+            return self.output_processor.process_output(iovalue, inplace)
+        except VerificationFailureError as exc:
+            raise copy_error(exc, OutputVerificationFailureError)
+    
+    async def aprocess_input(self, iovalue, inplace=False):
+        """ process_input(), with awaitable custom functions. See
+            'IOProcessor.run_async'. """
+        try:
+            return await self.input_processor.aprocess_input(iovalue, inplace)
+        except VerificationFailureError as exc:
+            raise copy_error(exc, InputVerificationFailureError)
+    
+    async def aprocess_output(self, iovalue, inplace=False):
+        """ process_output(), with awaitable custom functions. See
+            'IOProcessor.run_async'. """
+        try:
+            return await self.output_processor.aprocess_output(
+                iovalue,
+                inplace,
+                )
+        except VerificationFailureError as exc:
+            raise copy_error(exc, OutputVerificationFailureError)
+    
+    def process_input_many(self, iovalues, inplace=False):
+        """ process_input() for each of 'iovalues'. Return a 'BatchResult'. """
+        return self.input_processor.process_input_many(iovalues, inplace)
+    
+    def process_output_many(self, iovalues, inplace=False):
+        """ process_output() for each of 'iovalues'. Return a 'BatchResult'.
+            """
+        return self.output_processor.process_output_many(iovalues, inplace)
+    
+    def iter_process_input(self, iovalues, on_error='raise', inplace=False):
+        """ process_input() for each of 'iovalues', lazily. See
+            'IOProcessor.iter_process'. """
+        return self.input_processor.iter_process(
+            iovalues,
+            False,
+            on_error,
+            inplace,
+            InputVerificationFailureError,
+            )
+    
+    def iter_process_output(self, iovalues, on_error='raise', inplace=False):
+        """ process_output() for each of 'iovalues', lazily. See
+            'IOProcessor.iter_process'. """
+        return self.output_processor.iter_process(
+            iovalues,
+            True,
+            on_error,
+            inplace,
+            OutputVerificationFailureError,
+            )
     
     def coerce_input(self, *pargs, **kwargs):
         return self.input_processor.coerce(*pargs, **kwargs)
@@ -535,17 +2750,31 @@ class IOManager(object):
     def coerce_output(self, *pargs, **kwargs):
         return self.output_processor.coerce(*pargs, **kwargs)
     
+    async def acoerce_input(self, *pargs, **kwargs):
+        return await self.input_processor.acoerce(*pargs, **kwargs)
+    
+    async def acoerce_output(self, *pargs, **kwargs):
+        return await self.output_processor.acoerce(*pargs, **kwargs)
+    
     def verify_input(self, *pargs, **kwargs):
         try:
             return self.input_processor.verify(*pargs, **kwargs)
         except VerificationFailureError as exc:
-            raise InputVerificationFailureError(*exc.args)
+            raise copy_error(exc, InputVerificationFailureError)
     
     def verify_output(self, *pargs, **kwargs):
         try:
             return self.output_processor.verify(*pargs, **kwargs)
         except VerificationFailureError as exc:
-            raise OutputVerificationFailureError(*exc.args)
+            raise copy_error(exc, OutputVerificationFailureError)
+    
+    def warm_up(self, batch_plans=False, async_plans=False):
+        """ 'IOProcessor.warm_up' for the input and output processors. """
+        for processor in [self.input_processor, self.output_processor]:
+            processor.warm_up(
+                batch_plans=batch_plans,
+                async_plans=async_plans,
+                )
 
 
 
@@ -566,31 +2795,34 @@ def all_are_containers(objs, classinfo):
     return True
 
 def iospecs_from_callable(callable_obj):
+    """ 'required' and 'optional' iospecs for the keyword arguments of
+        'callable_obj', from its signature. Parameters without a default value
+        are required. A parameter's annotation is its iospec (see
+        'get_annotation_iospec'); parameters without one accept any value
+        ('AnyType').
+        
+        Positional-only parameters, '*args' and '**kwargs' can not be passed
+        from an iovalue dictionary, and are left out. """
     if not hasattr(callable_obj, '__call__'):
         raise TypeError(
             "{} is not callable.".format(type(callable_obj).__name__)
         )
-    if inspect.isfunction(callable_obj):
-        argspec = inspect.getargspec(callable_obj)
-        parameters = list(argspec.args)
-    else:
-        argspec = inspect.getargspec(callable_obj.__call__)
-        # Get rid of the 'self' parameter.
-        parameters = list(argspec.args)[1:]
-    
-    defaults = argspec.defaults
     
-    if argspec.defaults is None:
-        optionals_start = len(parameters)
-    else:
-        optionals_count = len(argspec.defaults)
-        optionals_start = -1 * optionals_count
-    
-    required_list = parameters[:optionals_start]
-    optional_list = parameters[optionals_start:]
+    required_iospec = {}
+    optional_iospec = {}
     
-    required_iospec = {ikey: AnyType for ikey in required_list}
-    optional_iospec = {ikey: AnyType for ikey in optional_list}
+    for parameter in get_signature(callable_obj).parameters.values():
+        if parameter.kind not in KEYWORD_PARAMETER_KINDS:
+            continue
+        
+        if parameter.default is parameter.empty:
+            iospec_dict = required_iospec
+        else:
+            iospec_dict = optional_iospec
+        
+        iospec_dict[parameter.name] = get_annotation_iospec(
+            parameter.annotation
+            )
     
     result = {
         'required': required_iospec,
@@ -598,26 +2830,167 @@ def iospecs_from_callable(callable_obj):
         }
     return result
 
-def make_dict_from_listlike(listlike_obj, target_length=None):
-    """ Make a dictionary from an iterable or a ListOf instance.
-        
-        'target_length' is only used if the listlike_obj is a ListOf
-        instance. """
-    if isinstance(listlike_obj, ListOf):
-        if target_length is None:
-            raise TypeError(
-                "'target_length' must be provided when 'listlike_obj' is a "
-                "'ListOf' instance."
+def get_signature(callable_obj):
+    """ The signature of 'callable_obj'. String annotations (see PEP 563) are
+        evaluated in the globals of the function. Raises 'ValueError' if one
+        can not be evaluated. """
+    try:
+        return inspect.signature(callable_obj, eval_str=True)
+    except Exception as exc:
+        raise ValueError(
+            "The annotations of {!r} can not be evaluated: {}".format(
+                callable_obj,
+                exc,
                 )
-        return listlike_obj.make_dict(target_length)
+            ) from exc
+
+def get_annotation_iospec(annotation):
+    """ The iospec for a parameter or return annotation.
+        
+        Classes, 'ListOf' and 'AnyType' are iospecs, as are dictionaries and
+        lists of them. Other annotations, such as 'typing.Optional[int]' or
+        'list[int]', can not be checked by an 'IOProcessor', and accept any
+        value ('AnyType'). """
+    if annotation is inspect.Parameter.empty:
+        return AnyType
+    
+    if is_annotation_iospec(annotation):
+        return annotation
+    
+    return AnyType
+
+def is_annotation_iospec(annotation):
+    """ See 'get_annotation_iospec'. """
+    if is_container(annotation, Mapping):
+        return all(map(is_annotation_iospec, annotation.values()))
+    
+    if isinstance(annotation, (list, tuple)):
+        return all(map(is_annotation_iospec, annotation))
+    
+    if isinstance(annotation, ListOf) or annotation is AnyType:
+        return True
+    
+    return (
+        isinstance(annotation, type)
+        and not isinstance(annotation, types.GenericAlias)
+        and annotation is not typing.Any
+        )
+
+def managed(
+    function=None,
+    required=NotProvided,
+    optional=NotProvided,
+    manager_class=IOManager,
+    **kwargs
+    ):
+    """ A decorator that makes an 'IOManager' for 'function' from its
+        signature, once, when it is decorated.
+        
+        The input iospecs come from 'iospecs_from_callable'. 'required' and
+        'optional' dictionaries override them, key by key; a key in
+        'optional' is no longer required, and the other way around. The
+        return annotation, if any, is the required output iospec.
+        
+        'manager_class' (by default, 'IOManager') is instantiated with
+        'kwargs', such as 'coercion_functions' or 'output_kwargs'.
+        
+        The function itself is returned unchanged, with two attributes:
+            'manager' --> The 'IOManager'.
+            'process_and_call' --> 'process_and_call(iovalue)' processes the
+                input dictionary 'iovalue', calls the function with the
+                result as keyword arguments, then processes the result as
+                output. For a coroutine function, it is a coroutine function
+                too.
+        
+        Use '@managed', or '@managed(...)' with arguments.
+        
+        Functions defined in a class body can not be decorated: 'self' (or
+        'cls') would be read as a required input key. Raises 'TypeError' for
+        them. Decorate a module-level function, and call it from the method,
+        instead. """
+    if function is None:
+        return functools.partial(
+            managed,
+            required=required,
+            optional=optional,
+            manager_class=manager_class,
+            **kwargs
+            )
     
-    return dict(zip(range(len(listlike_obj)), listlike_obj))
+    if is_defined_in_class(function):
+        raise TypeError(
+            "'managed' can not decorate {}, which is defined in a class."
+            .format(function.__qualname__)
+            )
+    
+    iospecs = iospecs_from_callable(function)
+    if required is not NotProvided:
+        for ikey in required:
+            iospecs['optional'].pop(ikey, None)
+        iospecs['required'].update(required)
+    if optional is not NotProvided:
+        for ikey in optional:
+            iospecs['required'].pop(ikey, None)
+        iospecs['optional'].update(optional)
+    
+    input_kwargs = dict(iospecs, **kwargs.pop('input_kwargs', {}))
+    output_kwargs = kwargs.pop('output_kwargs', {}).copy()
+    
+    return_annotation = get_signature(function).return_annotation
+    if return_annotation is not inspect.Signature.empty:
+        output_kwargs.setdefault(
+            'required',
+            get_annotation_iospec(return_annotation),
+            )
+    
+    manager = manager_class(
+        input_kwargs=input_kwargs,
+        output_kwargs=output_kwargs,
+        **kwargs
+        )
+    
+    function.manager = manager
+    function.process_and_call = make_process_and_call(function, manager)
+    return function
+
+def is_defined_in_class(function):
+    """ Whether 'function' was defined in a class body, from its qualified
+        name: 'Class.method', but not 'function.<locals>.inner'. """
+    qualname_parts = getattr(function, '__qualname__', '').split('.')
+    return len(qualname_parts) > 1 and qualname_parts[-2] != '<locals>'
+
+def make_process_and_call(function, manager):
+    """ See 'managed'. """
+    if inspect.iscoroutinefunction(function):
+        async def process_and_call(iovalue):
+            result = await function(**manager.process_input(iovalue))
+            return manager.process_output(result)
+    else:
+        def process_and_call(iovalue):
+            result = function(**manager.process_input(iovalue))
+            return manager.process_output(result)
+    
+    return process_and_call
+
+def keep_sequence_type(iovals_list, result_list):
+    """ Coercion results for tuples are tuples. Any other changed sequence
+        gives a list. """
+    if result_list is not iovals_list and isinstance(iovals_list, tuple):
+        return tuple(result_list)
+    return result_list
 
 def combine_iospecs(iospec_a=NotProvided, iospec_b=NotProvided):
+    """ Combine two iospecs. Where they overlap, 'iospec_a' takes precedence.
+        
+        The result of combining two frozen iospecs is frozen and memoized. """
     if all_are_containers((iospec_a, iospec_b), dict):
+        if all_are_containers((iospec_a, iospec_b), FrozenDict):
+            return combine_frozen_iospecs(iospec_a, iospec_b)
         return combine_iospecs_dict(iospec_a, iospec_b)
     
     if all_are_containers((iospec_a, iospec_b), Sequence):
+        if all_are_containers((iospec_a, iospec_b), FrozenList):
+            return combine_frozen_iospecs(iospec_a, iospec_b)
         return combine_iospecs_list(iospec_a, iospec_b)
     
     if iospec_a is NotProvided:
@@ -637,13 +3010,23 @@ def combine_iospecs_dict(iospec_a, iospec_b):
         for ikey in all_keys
         }
 
-def combine_iospecs_list(iospec_list_a, iospec_list_b):
-    iospec_a = make_dict_from_listlike(iospec_list_a)
-    iospec_b = make_dict_from_listlike(iospec_list_b)
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def combine_frozen_iospecs(iospec_a, iospec_b):
+    """ Combine two frozen dictionaries, or two frozen lists. """
+    if isinstance(iospec_a, FrozenDict):
+        return freeze_iospec(combine_iospecs_dict(iospec_a, iospec_b))
     
-    result_dict = combine_iospecs_dict(iospec_a, iospec_b)
-    
-    return [result_dict[i] for i in sorted(result_dict.keys())]
+    return freeze_iospec(combine_iospecs_list(iospec_a, iospec_b))
+
+def combine_iospecs_list(iospec_list_a, iospec_list_b):
+    return [
+        combine_iospecs(iospec_a, iospec_b)
+        for iospec_a, iospec_b in itertools.zip_longest(
+            iospec_list_a,
+            iospec_list_b,
+            fillvalue=NotProvided,
+            )
+        ]
 
 def make_missing_output(iospec):
     if iospec is NoDifference:
@@ -654,14 +3037,385 @@ def make_missing_output(iospec):
     
     return TypeNameRepresentation(iospec)
 
+def failure_key(failure):
+    """ A hashable value that is the same for two 'NodeFailure' instances
+        exactly when their error messages are the same. Raises 'TypeError' if
+        the failure holds unhashable values. """
+    key = (
+        failure_key_value(failure.missing),
+        failure_key_value(failure.unknown),
+        failure_key_value(failure.wrong_types),
+        failure.suppressed,
+        )
+    hash(key)
+    return key
+
+def failure_key_value(value):
+    if isinstance(value, WrongTypePair):
+        return (WrongTypePair, value.pair)
+    
+    if isinstance(value, UnknownContainer):
+        return (UnknownContainer, value.representation)
+    
+    if type(value) is dict:
+        return tuple(
+            (type(ikey), ikey, failure_key_value(ivalue))
+            for ikey, ivalue in value.items()
+            )
+    
+    # The type is part of the key because, for example, '1 == True'.
+    return (type(value), value)
+
+def make_error_message(error_msg, failure):
+    """ 'error_msg', followed by a line for each kind of fault held by the
+        'NodeFailure' 'failure'. """
+    err_msg_parts = [
+        caption_part + str(output_part)
+        for caption_part, output_part in
+        [
+            ('Missing: ', make_missing_output(failure.missing)),
+            ('Not allowed: ', failure.unknown),
+            ('Wrong type: ', failure.wrong_types),
+            ]
+        if output_part and output_part is not NoDifference
+        ]
+    
+    if failure.suppressed:
+        err_msg_parts.append(
+            'Not shown: {} more faults.'.format(failure.suppressed)
+            )
+    
+    return '\n'.join([error_msg] + err_msg_parts)
+
+def copy_error(exc, error_class):
+    """ An instance of 'error_class' with the message and failure of the
+        'VerificationFailureError' 'exc'. A message that has not been made
+        yet is still not made. """
+    return error_class(
+        *BaseException.args.__get__(exc),
+        error_msg=exc.error_msg,
+        failure=exc.failure,
+        )
+
+def make_faults(failure):
+    """ The faults held by a 'NodeFailure', as a list of 'Fault' instances.
+        Missing faults come first, then not allowed, then wrong types, each
+        in the order of the error message. """
+    faults = []
+    add_missing_faults(faults, (), failure.missing)
+    add_unknown_faults(faults, (), failure.unknown)
+    add_wrong_type_faults(faults, (), failure.wrong_types)
+    return faults
+
+def add_missing_faults(faults, path, missing):
+    if missing is NoDifference:
+        return
+    
+    # A missing dict iospec is reported as its missing required values.
+    if is_container(missing, Mapping) and missing:
+        for key, value in missing.items():
+            add_missing_faults(faults, path + (key,), value)
+    else:
+        faults.append(Fault(path, missing, NotProvided))
+
+def add_unknown_faults(faults, path, unknown):
+    if unknown is NoDifference:
+        return
+    
+    if type(unknown) is dict:
+        for key, value in unknown.items():
+            add_unknown_faults(faults, path + (key,), value)
+    else:
+        faults.append(Fault(path, NotProvided, unknown))
+
+def add_wrong_type_faults(faults, path, wrong_types):
+    if wrong_types is None:
+        return
+    
+    if type(wrong_types) is dict:
+        for key, value in wrong_types.items():
+            add_wrong_type_faults(faults, path + (key,), value)
+    else:
+        faults.append(Fault(path, *wrong_types.pair))
+
 def make_missing_output_dict(iospec):
     return {
         ikey: make_missing_output(ivalue)
         for ikey, ivalue in iospec.items()
         }
 
+def iter_list_of_iospecs(iospec):
+    """ Every 'ListOf' in 'iospec', including 'iospec' itself and the
+        'ListOf' iospecs of other 'ListOf' iospecs. """
+    if isinstance(iospec, ListOf):
+        yield iospec
+        yield from iter_list_of_iospecs(iospec.iospec_obj)
+    elif is_container(iospec, Mapping):
+        for ivalue in iospec.values():
+            yield from iter_list_of_iospecs(ivalue)
+    elif is_container(iospec, Sequence):
+        for ivalue in iospec:
+            yield from iter_list_of_iospecs(ivalue)
+
+def freeze_iospec(iospec):
+    """ An immutable, hashable copy of 'iospec'.
+        
+        Frozen iospecs are 'hash-consed': structurally identical iospecs, and
+        structurally identical parts of iospecs, are frozen to the same
+        instance. This lets 'combine_iospecs' and 'PlanCompiler' memoize
+        their results.
+        
+        Raises 'TypeError' if 'iospec' contains a value that can not be
+        hashed. """
+    if type(iospec) is type:
+        # Most iospec values are plain types.
+        return iospec
+    
+    if is_container(iospec, Mapping):
+        items = tuple(
+            (ikey, freeze_iospec(ivalue)) for ikey, ivalue in iospec.items()
+            )
+        key = (FrozenDict, tuple(map(type, iospec)), items)
+        make_frozen = lambda: FrozenDict(items)
+    
+    elif isinstance(iospec, ListOf):
+        iospec_obj = freeze_iospec(iospec.iospec_obj)
+        key = (type(iospec), iospec_obj, iospec.storage)
+        
+        def make_frozen():
+            frozen = type(iospec)(iospec_obj, storage=iospec.storage)
+            frozen.frozen = True
+            return frozen
+    
+    elif is_container(iospec, Sequence):
+        items = tuple(freeze_iospec(ivalue) for ivalue in iospec)
+        type_name = getattr(iospec, '__name__', type(iospec).__name__)
+        key = (FrozenList, type_name, items)
+        make_frozen = lambda: FrozenList(items, type_name)
+    
+    else:
+        hash(iospec)
+        return iospec
+    
+    try:
+        return frozen_iospecs[key]
+    except KeyError:
+        frozen = frozen_iospecs[key] = make_frozen()
+        return frozen
+
+def is_frozen_iospec(iospec):
+    if isinstance(iospec, (FrozenDict, FrozenList)):
+        return True
+    
+    if isinstance(iospec, ListOf):
+        return iospec.frozen
+    
+    return not is_container(iospec, (Sequence, Mapping))
+
+def clear_iospec_cache():
+    """ Forget all frozen iospecs, combined iospecs and memoized plans. """
+    frozen_iospecs.clear()
+    compiled_plans.clear()
+    generated_plans.clear()
+    async_functions.clear()
+    combine_frozen_iospecs.cache_clear()
+
+def call_coercion_function(coercion_function, ioval, expected_type):
+    """ Call a custom coercion function, which can return a plain value or a
+        'CoercionSuccess', or raise a 'CoercionSuccessError'. """
+    try:
+        result = coercion_function(ioval, expected_type)
+    except CoercionSuccessError as exc:
+        return exc.args[0]
+    
+    if type(result) is CoercionSuccess:
+        return result.value
+    return result
+
+def call_typecheck_function(typecheck_function, ioval, expected_type):
+    """ Call a custom typecheck function. Returns 'TypeCheckSuccess' or
+        'TypeCheckFailure' if the function decided (by returning or raising),
+        or 'None' if the normal type check should be used. """
+    try:
+        result = typecheck_function(ioval, expected_type)
+    except TypeCheckSuccessError:
+        return TypeCheckSuccess
+    except TypeCheckFailureError:
+        return TypeCheckFailure
+    
+    if result is TypeCheckSuccess or result is TypeCheckFailure:
+        return result
+    return None
+
+def wrap_async_functions(functions, coercion=False):
+    """ A copy of the custom 'functions' dictionary, with each function
+        wrapped in an 'AsyncFunction'. The wrappers are memoized, so async
+        plans for the same functions are shared. """
+    wrapped = {}
+    
+    for expected_type, function in functions.items():
+        key = (function, coercion)
+        try:
+            wrapped[expected_type] = async_functions[key]
+        except KeyError:
+            wrapped[expected_type] = async_functions[key] = AsyncFunction(
+                function,
+                coercion,
+                )
+        except TypeError:
+            # An unhashable function. Wrap it without memoization.
+            wrapped[expected_type] = AsyncFunction(function, coercion)
+    
+    return wrapped
+
+async def await_result(awaitable, semaphore=None):
+    if semaphore is None:
+        return await awaitable
+    
+    async with semaphore:
+        return await awaitable
+
+def abbreviate_unknown(ioval):
+    """ The 'Not allowed' output for an unknown value. Container values are
+        abbreviated; see 'UnknownContainer'. """
+    if is_container(ioval, (Sequence, Mapping)):
+        return UnknownContainer(ioval)
+    
+    return ioval
+
+def make_failure(collector):
+    """ The 'NodeFailure' made by 'collector', or 'None' if 'collector' is
+        'None' (no faults were found). """
+    if collector is None:
+        return None
+    
+    return collector.make_failure()
+
+def get_failure_keys(failure):
+    """ The keys (or indices) of the items of a container that failed, from
+        the container's 'NodeFailure'. """
+    keys = set()
+    for results in [failure.missing, failure.unknown, failure.wrong_types]:
+        if is_container(results, Mapping):
+            keys.update(results)
+    return keys
+
+def collect_failure(key, failure, missing, unknown, wrong_types):
+    """ Add the results of a failed child node to the results of its parent
+        node. """
+    if failure.missing is not NoDifference:
+        missing[key] = failure.missing
+    if failure.unknown is not NoDifference:
+        unknown[key] = failure.unknown
+    if failure.wrong_types is not None:
+        wrong_types[key] = failure.wrong_types
+
+def emit_type_check(
+    writer,
+    var,
+    expected_type,
+    nonetype_ok,
+    exact_type_first=False,
+    ):
+    """ Write the source code equivalent of 'ScalarNode.check'. """
+    if expected_type is AnyType:
+        if not nonetype_ok:
+            writer.line('if {} is None:'.format(var))
+            writer.line('return False', 1)
+        return
+    
+    type_name = writer.constant(expected_type, 'type')
+    
+    if nonetype_ok:
+        condition = '{0} is not None and not isinstance({0}, {1})'
+    else:
+        condition = '{0} is None or not isinstance({0}, {1})'
+    
+    if exact_type_first:
+        condition = 'type({0}) is not {1} and ({2})'.format(
+            '{0}', '{1}', condition
+            )
+    
+    writer.line('if {}:'.format(condition.format(var, type_name)))
+    writer.line('return False', 1)
 
+def emit_sequence_check(writer, var):
+    writer.line(
+        'if not isinstance({0}, Sequence) or isinstance({0}, (str, bytes)):'
+        .format(var)
+        )
+    writer.line('return False', 1)
 
+def emit_keep_sequence_type(writer, src, result_name, indent=0):
+    writer.line(
+        'if {} is not {} and isinstance({}, tuple):'.format(
+            result_name, src, src
+            ),
+        indent
+        )
+    writer.line('{0} = tuple({0})'.format(result_name), indent + 1)
 
+def emit_copy_on_write(
+    writer,
+    child,
+    src,
+    result_name,
+    item_name,
+    key,
+    copy_function,
+    mutable_class_name=None,
+    indent=0,
+    ):
+    """ Emit the coercion of 'item_name' by 'child'. When the item changes,
+        'src' is copied into 'result_name' (if that has not happened already)
+        and the new item is stored under 'key'.
+        
+        With a 'mutable_class_name', instances of that class are not copied;
+        the new item is stored in 'src' itself. """
+    coerced_name = writer.name('coerced')
+    child_coerce = writer.branch()
+    child.emit_coerce(
+        child_coerce,
+        item_name,
+        coerced_name,
+        inplace=mutable_class_name is not None,
+        )
+    writer.extend(child_coerce, indent)
+    
+    copy_condition = '{} is {}'.format(result_name, src)
+    if mutable_class_name is not None:
+        copy_condition += ' and not isinstance({}, {})'.format(
+            src, mutable_class_name
+            )
+    
+    writer.line('if {} is not {}:'.format(coerced_name, item_name), indent)
+    writer.line('if {}:'.format(copy_condition), indent + 1)
+    writer.line(
+        '{} = {}({})'.format(result_name, copy_function, src), indent + 2
+        )
+    writer.line(
+        '{}[{}] = {}'.format(result_name, key, coerced_name), indent + 1
+        )
 
+def generate_plan(plan):
+    """ Make a 'GeneratedPlan' from 'plan'. If the generated source code can
+        not be compiled (for example, an iospec nested more deeply than Python
+        allows), 'plan' is returned unchanged. """
+    try:
+        return generated_plans[plan]
+    except KeyError:
+        pass
+    
+    try:
+        generated_plan = GeneratedPlan(plan)
+    except (SyntaxError, RecursionError):
+        return plan
+    
+    generated_plans[plan] = generated_plan
+    return generated_plan
 
+def is_builtin_scalar(expected_type):
+    return (
+        type(expected_type) is type and
+        expected_type in BUILTIN_SCALAR_TYPES
+        )
@@ -0,0 +1,87 @@
+""" A registry of the 'IOManager' instances of an application, so they can
+    all be prepared at startup.
+    
+    A server that forks worker processes (for example, a pre-fork web server)
+    registers its managers when they are created, then calls 'warm_up' once,
+    before it forks:
+        
+        from iomanager import registry
+        
+        users = registry.register('users', WebIOManager(...))
+        ...
+        registry.warm_up()
+    
+    'warm_up' makes the values that would otherwise be made by each worker
+    when it first processes an iovalue (see 'IOProcessor.warm_up'), then
+    moves every object tracked by the garbage collector into its permanent
+    generation with 'gc.freeze'. Collections in the workers then do not
+    visit those objects, so they do not write to (and copy) the memory pages
+    the workers share with the parent process.
+    """
+
+import gc
+
+class ManagerRegistry(object):
+    """ 'IOManager' (or 'IOProcessor') instances, by name. """
+    def __init__(self):
+        self.managers = {}
+    
+    def register(self, name, manager):
+        """ Add 'manager' as 'name'. Return 'manager'. Raises 'ValueError' if
+            another manager is registered as 'name'. """
+        if self.managers.get(name, manager) is not manager:
+            raise ValueError(
+                "A manager is already registered as '{}'.".format(name)
+                )
+        
+        self.managers[name] = manager
+        return manager
+    
+    def unregister(self, name):
+        """ Remove the manager registered as 'name'. Raises 'KeyError' if
+            there is none. """
+        del self.managers[name]
+    
+    def get(self, name, default=None):
+        return self.managers.get(name, default)
+    
+    def __getitem__(self, name):
+        return self.managers[name]
+    
+    def __contains__(self, name):
+        return name in self.managers
+    
+    def __len__(self):
+        return len(self.managers)
+    
+    def __iter__(self):
+        return iter(self.managers)
+    
+    def warm_up(self, freeze=True, batch_plans=False, async_plans=False):
+        """ 'warm_up' each manager, then 'gc.freeze()' unless 'freeze' is
+            'False'. 'batch_plans' and 'async_plans' also make the plans of
+            'process_batch' (used by 'async_tools.Coalescer') and of the async
+            methods. """
+        for manager in self.managers.values():
+            manager.warm_up(
+                batch_plans=batch_plans,
+                async_plans=async_plans,
+                )
+        
+        if freeze:
+            gc.freeze()
+
+# The registry of the application.
+registry = ManagerRegistry()
+
+def register(name, manager):
+    """ 'ManagerRegistry.register' for the application registry. """
+    return registry.register(name, manager)
+
+def warm_up(freeze=True, batch_plans=False, async_plans=False):
+    """ 'ManagerRegistry.warm_up' for the application registry. """
+    registry.warm_up(
+        freeze=freeze,
+        batch_plans=batch_plans,
+        async_plans=async_plans,
+        )
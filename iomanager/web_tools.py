@@ -5,7 +5,7 @@ import uuid
 from .iomanager import (
     IOProcessor,
     IOManager,
-    CoercionSuccessError,
+    CoercionSuccess,
     )
 
 def coerce_bool_input(value, expected_type):
@@ -22,7 +22,7 @@ def coerce_bool_input(value, expected_type):
     except KeyError:
         return value
     else:
-        raise CoercionSuccessError(result)
+        return CoercionSuccess(result)
 
 def coerce_numeric_input(value, expected_type):
     if not isinstance(value, str):
@@ -33,7 +33,7 @@ def coerce_numeric_input(value, expected_type):
     except ValueError:
         return value
     else:
-        raise CoercionSuccessError(result)
+        return CoercionSuccess(result)
 
 def coerce_decimal_input(value, expected_type):
     if not isinstance(value, (str, int)):
@@ -44,7 +44,7 @@ def coerce_decimal_input(value, expected_type):
     except ArithmeticError:
         return value
     else:
-        raise CoercionSuccessError(result)
+        return CoercionSuccess(result)
 
 def coerce_uuid_input(value, expected_type):
     if not isinstance(value, str):
@@ -55,7 +55,7 @@ def coerce_uuid_input(value, expected_type):
     except ValueError:
         return value
     else:
-        raise CoercionSuccessError(result)
+        return CoercionSuccess(result)
 
 def coerce_datetime_input(value, expected_type):
     if not isinstance(value, str):
@@ -66,7 +66,7 @@ def coerce_datetime_input(value, expected_type):
     except ValueError:
         return value
     else:
-        raise CoercionSuccessError(result)
+        return CoercionSuccess(result)
 
 input_coercion_functions = {
     bool: coerce_bool_input,
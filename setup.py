@@ -14,4 +14,7 @@ setup(
     install_requires=[
         "python-dateutil>=2.1",
         ],
+    extras_require={
+        'numpy': ["numpy"],
+        },
     )
\ No newline at end of file
@@ -0,0 +1,416 @@
+import pytest
+import unittest
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from iomanager import (
+    IOProcessor,
+    IOManager,
+    ListOf,
+    VerificationFailureError,
+    InputVerificationFailureError,
+    OutputVerificationFailureError,
+    ProcessingFailure,
+    )
+from iomanager.async_tools import (
+    Offloader,
+    Coalescer,
+    estimate_size,
+    process_stream,
+    )
+
+class RecordingExecutor(ThreadPoolExecutor):
+    """ A thread pool that counts the calls it runs. """
+    def __init__(self):
+        super(RecordingExecutor, self).__init__(1)
+        self.submitted = 0
+    
+    def submit(self, *pargs, **kwargs):
+        self.submitted += 1
+        return super(RecordingExecutor, self).submit(*pargs, **kwargs)
+
+class TestEstimateSize(unittest.TestCase):
+    def test_scalars(self):
+        for value in [1, 'abc', b'abc', None]:
+            assert estimate_size(value) == 1
+    
+    def test_empty(self):
+        assert estimate_size([]) == 1
+        assert estimate_size({}) == 1
+    
+    def test_list(self):
+        assert estimate_size(list(range(1000))) == 1001
+    
+    def test_nested(self):
+        iovalue = {'a': [{'b': 1, 'c': [1, 2]}] * 100}
+        
+        assert estimate_size(iovalue) == 1 + 1 + 100 * (1 + 1 + 3)
+    
+    def test_depth(self):
+        assert estimate_size([[[1, 2, 3]]], depth=1) == 1 + 1 * 2
+    
+    def test_large_mapping(self):
+        iovalue = {index: [index] for index in range(100000)}
+        
+        assert estimate_size(iovalue) == 1 + 100000 * 2
+
+class TestOffloader(unittest.TestCase):
+    def setUp(self):
+        self.executor = RecordingExecutor()
+        self.manager = IOManager(
+            input_kwargs={'required': ListOf(int)},
+            output_kwargs={'required': ListOf(str)},
+            )
+        self.offloader = Offloader(self.manager, self.executor, threshold=100)
+    
+    def tearDown(self):
+        self.executor.shutdown()
+    
+    def test_small_inline(self):
+        result = asyncio.run(self.offloader.process_input([1, 2]))
+        
+        assert result == [1, 2]
+        assert self.executor.submitted == 0
+    
+    def test_large_offloaded(self):
+        iovalue = list(range(1000))
+        
+        result = asyncio.run(self.offloader.process_input(iovalue))
+        
+        assert result == iovalue
+        assert self.executor.submitted == 1
+    
+    def test_runs_in_executor_thread(self):
+        threads = []
+        manager = IOManager(
+            input_kwargs={'required': ListOf(int)},
+            coercion_functions={
+                int: lambda value, expected_type: threads.append(
+                    threading.current_thread()
+                    ) or value,
+                },
+            )
+        offloader = Offloader(manager, self.executor, threshold=100)
+        
+        asyncio.run(offloader.process_input(list(range(1000))))
+        
+        assert threading.main_thread() not in threads
+    
+    def test_input_error(self):
+        with pytest.raises(InputVerificationFailureError):
+            asyncio.run(self.offloader.process_input(['x'] * 1000))
+    
+    def test_output_error(self):
+        for iovalue in [[1], [1] * 1000]:
+            with pytest.raises(OutputVerificationFailureError):
+                asyncio.run(self.offloader.process_output(iovalue))
+    
+    def test_default_executor(self):
+        offloader = Offloader(self.manager, threshold=1)
+        
+        assert asyncio.run(offloader.process_input([1, 2])) == [1, 2]
+
+def make_reader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+async def iter_bytes(*chunks):
+    for chunk in chunks:
+        await asyncio.sleep(0)
+        yield chunk
+
+def collect_stream(target, source, **kwargs):
+    """ The results of 'process_stream'. A 'bytes' source is read from an
+        'asyncio.StreamReader'. """
+    async def collect():
+        stream = source
+        if isinstance(stream, bytes):
+            stream = make_reader(stream)
+        return [
+            result
+            async for result in process_stream(target, stream, **kwargs)
+            ]
+    return asyncio.run(collect())
+
+class TestProcessStream(unittest.TestCase):
+    def setUp(self):
+        self.manager = IOManager(
+            input_kwargs={'required': {'a': int}},
+            output_kwargs={'required': {'a': str}},
+            )
+    
+    def test_stream_reader(self):
+        data = b'{"a": 1}\n\n  \n{"a": 2}'
+        
+        assert collect_stream(self.manager, data) == [{'a': 1}, {'a': 2}]
+    
+    def test_chunks(self):
+        source = iter_bytes(b'{"a"', b': 1}\n{"a":', b' 2}\r\n', b'\n')
+        
+        assert collect_stream(self.manager, source) == [{'a': 1}, {'a': 2}]
+    
+    def test_one_byte_chunks(self):
+        data = b'{"a": 1}\n{"a": 2}\n'
+        source = iter_bytes(
+            *[data[index:index + 1] for index in range(len(data))]
+            )
+        
+        assert collect_stream(self.manager, source) == [{'a': 1}, {'a': 2}]
+    
+    def test_output(self):
+        data = b'{"a": "x"}\n'
+        
+        assert collect_stream(self.manager, data, output=True) == [
+            {'a': 'x'}
+            ]
+    
+    def test_raise(self):
+        data = b'{"a": 1}\n{"a": "x"}\n'
+        
+        with pytest.raises(InputVerificationFailureError):
+            collect_stream(self.manager, data)
+    
+    def test_invalid_json(self):
+        data = b'{"a": 1}\n{"a"\n'
+        
+        with pytest.raises(ValueError):
+            collect_stream(self.manager, data)
+    
+    def test_skip(self):
+        data = b'{"a": "x"}\n{"a"\n{"a": 3}\n'
+        
+        assert collect_stream(self.manager, data, on_error='skip') == [
+            {'a': 3}
+            ]
+    
+    def test_yield(self):
+        data = b'{"a": "x"}\n\n{"a"\n{"a": 3}\n'
+        
+        results = collect_stream(self.manager, data, on_error='yield')
+        
+        assert [type(result) for result in results] == [
+            ProcessingFailure,
+            ProcessingFailure,
+            dict,
+            ]
+        assert results[0].index == 0
+        assert isinstance(results[0].error, InputVerificationFailureError)
+        assert results[1].index == 1
+        assert results[1].iovalue == b'{"a"'
+        assert isinstance(results[1].error, ValueError)
+    
+    def test_processor(self):
+        data = b'"x"\n'
+        
+        with pytest.raises(VerificationFailureError):
+            collect_stream(IOProcessor(required=int), data)
+    
+    def test_record_too_long(self):
+        for source in [
+            iter_bytes(b'[1, 2, 3, 4'),
+            iter_bytes(b'[1, 2, 3, 4]\n'),
+            ]:
+            with pytest.raises(ValueError):
+                collect_stream(self.manager, source, max_record_size=5)
+    
+    def test_source_error(self):
+        async def failing_source():
+            yield b'{"a": 1}\n'
+            raise ConnectionResetError
+        
+        with pytest.raises(ConnectionResetError):
+            collect_stream(self.manager, failing_source())
+    
+    def test_bad_on_error(self):
+        with pytest.raises(ValueError):
+            process_stream(self.manager, iter_bytes(), on_error='xxx')
+    
+    def test_backpressure(self):
+        reads = []
+        
+        async def endless_source():
+            while True:
+                reads.append(None)
+                yield b'{"a": 1}\n'
+        
+        async def read_slowly():
+            results = process_stream(
+                self.manager,
+                endless_source(),
+                buffer_size=5,
+                )
+            await results.__anext__()
+            for index in range(100):
+                await asyncio.sleep(0)
+            await results.aclose()
+        
+        asyncio.run(read_slowly())
+        
+        assert len(reads) <= 8
+
+def failing_coercion_function(value, expected_type):
+    if value == 'fail':
+        raise ConnectionResetError
+    return value
+
+class RecordingProcessor(IOProcessor):
+    """ A processor that records the batches it processes. """
+    def __init__(self, *pargs, **kwargs):
+        super(RecordingProcessor, self).__init__(*pargs, **kwargs)
+        self.batches = []
+    
+    def process_batch(self, iovalues, *pargs, **kwargs):
+        self.batches.append(iovalues)
+        return super(RecordingProcessor, self).process_batch(
+            iovalues,
+            *pargs,
+            **kwargs
+            )
+
+class TestCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.manager = IOManager(
+            input_kwargs={'required': {'a': int}},
+            output_kwargs={'required': {'a': str}},
+            )
+    
+    def run_concurrently(self, coalescer, method_name, iovalues):
+        async def run_all():
+            return await asyncio.gather(
+                *[
+                    getattr(coalescer, method_name)(iovalue)
+                    for iovalue in iovalues
+                    ],
+                return_exceptions=True
+                )
+        return asyncio.run(run_all())
+    
+    def test_results(self):
+        coalescer = Coalescer(self.manager)
+        
+        results = self.run_concurrently(
+            coalescer,
+            'process_input',
+            [{'a': 1}, {'a': 2}],
+            )
+        
+        assert results == [{'a': 1}, {'a': 2}]
+    
+    def test_own_errors(self):
+        coalescer = Coalescer(self.manager)
+        
+        results = self.run_concurrently(
+            coalescer,
+            'process_input',
+            [{'a': 1}, {'a': 'x'}, {'a': 3}],
+            )
+        
+        assert results[0] == {'a': 1}
+        assert isinstance(results[1], InputVerificationFailureError)
+        assert results[2] == {'a': 3}
+    
+    def test_output(self):
+        coalescer = Coalescer(self.manager)
+        
+        results = self.run_concurrently(
+            coalescer,
+            'process_output',
+            [{'a': 'x'}, {'a': 1}],
+            )
+        
+        assert results[0] == {'a': 'x'}
+        assert isinstance(results[1], OutputVerificationFailureError)
+    
+    def test_one_batch(self):
+        processor = RecordingProcessor(required=int)
+        coalescer = Coalescer(processor, delay=1)
+        
+        results = self.run_concurrently(coalescer, 'process_input', range(5))
+        
+        assert results == [0, 1, 2, 3, 4]
+        assert processor.batches == [[0, 1, 2, 3, 4]]
+    
+    def test_max_batch_size(self):
+        processor = RecordingProcessor(required=int)
+        coalescer = Coalescer(processor, delay=1000, max_batch_size=2)
+        
+        results = self.run_concurrently(coalescer, 'process_input', range(4))
+        
+        assert results == [0, 1, 2, 3]
+        assert processor.batches == [[0, 1], [2, 3]]
+    
+    def test_function_error(self):
+        manager = IOManager(
+            input_kwargs={'required': str},
+            coercion_functions={str: failing_coercion_function},
+            )
+        coalescer = Coalescer(manager)
+        
+        results = self.run_concurrently(
+            coalescer,
+            'process_input',
+            ['x', 'fail'],
+            )
+        
+        assert results[0] == 'x'
+        assert isinstance(results[1], ConnectionResetError)
+    
+    def test_function_error_no_reruns(self):
+        calls = []
+        
+        def coercion_function(value, expected_type):
+            calls.append(value)
+            if value % 2:
+                raise ConnectionResetError
+            return value
+        
+        manager = IOManager(
+            input_kwargs={'required': int},
+            coercion_functions={int: coercion_function},
+            )
+        coalescer = Coalescer(manager)
+        
+        results = self.run_concurrently(coalescer, 'process_input', range(5))
+        
+        assert calls == [0, 1, 2, 3, 4]
+        assert results[::2] == [0, 2, 4]
+        assert all(
+            isinstance(result, ConnectionResetError)
+            for result in results[1::2]
+            )
+    
+    def test_cancelled_caller(self):
+        coalescer = Coalescer(self.manager, delay=0.01)
+        
+        async def cancel_one():
+            cancelled = asyncio.ensure_future(
+                coalescer.process_input({'a': 1})
+                )
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            return await coalescer.process_input({'a': 2})
+        
+        assert asyncio.run(cancel_one()) == {'a': 2}
+    
+    def test_inplace(self):
+        manager = IOManager(
+            input_kwargs={'required': {'a': int}},
+            coercion_functions={int: lambda value, expected_type: int(value)},
+            )
+        coalescer = Coalescer(manager)
+        iovalue, copied_iovalue = {'a': '1'}, {'a': '2'}
+        
+        async def run_both():
+            return await asyncio.gather(
+                coalescer.process_input(iovalue, inplace=True),
+                coalescer.process_input(copied_iovalue),
+                )
+        
+        results = asyncio.run(run_both())
+        
+        assert results == [{'a': 1}, {'a': 2}]
+        assert results[0] is iovalue
+        assert copied_iovalue == {'a': '2'}
@@ -0,0 +1,205 @@
+import pytest
+import unittest
+import os
+import tempfile
+
+import iomanager
+from iomanager import (
+    IOProcessor,
+    IOManager,
+    )
+from iomanager.file_tools import (
+    RecordFile,
+    validate_file,
+    process_file,
+    read_record,
+    )
+
+class DataFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def make_file(self, content, name='data'):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as data_file:
+            data_file.write(content)
+        return path
+
+class TestRecordFileNdjson(DataFileTest):
+    def test_records(self):
+        path = self.make_file('{"a": 1}\n[2]\n"x"')
+        
+        with RecordFile(path) as record_file:
+            assert list(record_file) == [{'a': 1}, [2], 'x']
+    
+    def test_blank_lines(self):
+        path = self.make_file('\n1\n  \n2\r\n\n')
+        
+        with RecordFile(path) as record_file:
+            assert list(record_file) == [1, 2]
+            assert list(record_file.lines) == [2, 4]
+    
+    def test_location(self):
+        path = self.make_file('1\n\n  22\n')
+        
+        with RecordFile(path) as record_file:
+            assert record_file.location(1) == (3, 5)
+            assert record_file.read(1) == b'22'
+    
+    def test_empty_file(self):
+        path = self.make_file('')
+        
+        with RecordFile(path) as record_file:
+            assert len(record_file) == 0
+    
+    def test_invalid_json(self):
+        path = self.make_file('{"a": \n')
+        
+        with RecordFile(path) as record_file:
+            with pytest.raises(ValueError):
+                record_file[0]
+    
+    def test_unknown_format(self):
+        path = self.make_file('')
+        
+        with pytest.raises(ValueError):
+            RecordFile(path, format='xxx')
+
+class TestRecordFileJsonArray(DataFileTest):
+    def test_records(self):
+        path = self.make_file(
+            '[{"a": [1, {"b": "],"}]},\n "x,y", 3 ,\n[4, [5]], {}]'
+            )
+        
+        with RecordFile(path, format='json') as record_file:
+            assert list(record_file) == [
+                {'a': [1, {'b': '],'}]},
+                'x,y',
+                3,
+                [4, [5]],
+                {},
+                ]
+            assert list(record_file.lines) == [1, 2, 2, 3, 3]
+    
+    def test_empty_array(self):
+        path = self.make_file(' [ ] ')
+        
+        with RecordFile(path, format='json') as record_file:
+            assert len(record_file) == 0
+    
+    def test_trailing_comma(self):
+        path = self.make_file('[1, ]')
+        
+        with RecordFile(path, format='json') as record_file:
+            assert len(record_file) == 2
+            
+            with pytest.raises(ValueError):
+                record_file[1]
+    
+    def test_not_an_array(self):
+        path = self.make_file('{"a": 1}')
+        
+        with pytest.raises(ValueError):
+            RecordFile(path, format='json')
+    
+    def test_incomplete_array(self):
+        path = self.make_file('[1, 2')
+        
+        with pytest.raises(ValueError):
+            RecordFile(path, format='json')
+
+class TestValidateFile(DataFileTest):
+    def test_no_failures(self):
+        path = self.make_file('{"a": 1}\n{"a": 2}\n')
+        
+        report = validate_file(IOProcessor(required={'a': int}), path)
+        
+        assert report.count == 2
+        assert report.failures == []
+    
+    def test_failures(self):
+        path = self.make_file('{"a": 1}\n{"a": "x"}\n\n{"a": 2}\n{"a"\n')
+        
+        report = validate_file(IOProcessor(required={'a': int}), path)
+        
+        assert [
+            (failure.index, failure.line, failure.offset)
+            for failure in report.failures
+            ] == [(1, 2, 9), (3, 5, 30)]
+        assert report.failures[0].message == (
+            "Invalid input/output.\n"
+            "Wrong type: {'a': (expected 'int'; got 'str')}"
+            )
+        assert report.failures[1].message.startswith('Invalid JSON: ')
+    
+    def test_identical_messages_shared(self):
+        path = self.make_file('{"a": "x"}\n{"a": "y"}\n')
+        
+        report = validate_file(IOProcessor(required={'a': int}), path)
+        
+        assert report.failures[0].message is report.failures[1].message
+    
+    def test_read_record(self):
+        path = self.make_file('{"a": 1}\n{"a": "x"}\n')
+        
+        report = validate_file(IOProcessor(required={'a': int}), path)
+        failure = report.failures[0]
+        
+        assert read_record(path, failure.offset, failure.length) == {
+            'a': 'x'
+            }
+    
+    def test_coercion(self):
+        path = self.make_file('{"a": "1"}\n')
+        processor = IOProcessor(
+            required={'a': int},
+            coercion_functions=iomanager.web_tools.input_coercion_functions,
+            )
+        
+        report = validate_file(processor, path)
+        
+        assert report.failures == []
+    
+    def test_manager(self):
+        path = self.make_file('[1, "x"]')
+        manager = IOManager(
+            input_kwargs={'required': int},
+            output_kwargs={'required': str},
+            )
+        
+        input_report = validate_file(manager, path, format='json')
+        output_report = validate_file(manager, path, True, format='json')
+        
+        assert input_report.failures[0].index == 1
+        assert input_report.failures[0].message.startswith('Invalid input.')
+        assert output_report.failures[0].index == 0
+        assert output_report.failures[0].message.startswith(
+            'Invalid output.'
+            )
+
+class TestProcessFile(DataFileTest):
+    def test_coerced_records(self):
+        path = self.make_file('{"a": "1"}\n{"a": "x"}\n{"a"\n')
+        processor = IOProcessor(
+            required={'a': int},
+            coercion_functions=iomanager.web_tools.input_coercion_functions,
+            )
+        
+        results = list(process_file(processor, path))
+        
+        assert results[0] == (0, {'a': 1}, None)
+        assert [index for index, value, failure in results] == [0, 1, 2]
+        for index, value, failure in results[1:]:
+            assert value is None
+            assert failure.index == index
+    
+    def test_lazy(self):
+        path = self.make_file('1\n2\n')
+        
+        results = process_file(IOProcessor(required=int), path)
+        
+        assert next(results) == (0, 1, None)
+        results.close()
@@ -1,9 +1,12 @@
 """ Copyright (c) 2013 Josh Matthias <python.iomanager@gmail.com> """
 
+import array
+import asyncio
+import gc
 import pytest
 import unittest
 import string
-from contextlib import contextmanager
+import pickle
 
 import iomanager
 from iomanager import (
@@ -33,6 +36,16 @@ class CustomType(object):
 class CustomSubclassType(CustomType):
     """ A custom type used for testing type-checking. """
 
+class UnhashableMeta(type):
+    """ A metaclass for types that can not be hashed. """
+    __hash__ = None
+
+UnhashableType = UnhashableMeta(
+    'UnhashableType',
+    (object,),
+    {'__doc__': """ A type that can not be hashed. """},
+    )
+
 class BeforeCoercionType(object):
     """ A type that coerces to YesCoercionType. """
 
@@ -50,6 +63,14 @@ def custom_typecheck_reject_function(value, expected_type):
 def custom_typecheck_accept_function(value, expected_type):
     raise TypeCheckSuccessError
 
+def describe(value):
+    """ Describe the structure and item types of a (possibly nested) value. """
+    if isinstance(value, dict):
+        return {ikey: describe(ivalue) for ikey, ivalue in value.items()}
+    if isinstance(value, (list, tuple)):
+        return (type(value), [describe(ivalue) for ivalue in value])
+    return type(value)
+
 # --------------------------- Baseline tests ---------------------------
 
 class TestVerifyNoIOSpec(unittest.TestCase):
@@ -1070,7 +1091,2197 @@ class TestListOfNestedContainers(unittest.TestCase):
 
 
 
+# ---------------------- Verification plan tests -----------------------
+
+class TestVerificationPlan(unittest.TestCase):
+    """ The iospec is compiled into a plan when the processor is created. """
+    def test_plan_made_on_init(self):
+        processor = IOProcessor(required={'a': int}, optional={'b': str})
+        assert isinstance(processor.plan, iomanager.iomanager.PlanNode)
+    
+    def test_iospecs_not_combined_on_verify(self):
+        processor = IOProcessor(required={'a': int}, optional={'b': str})
+        
+        original_combine_iospecs = iomanager.iomanager.combine_iospecs
+        def fail_combine_iospecs(*pargs, **kwargs):
+            raise ConfirmationError
+        
+        iomanager.iomanager.combine_iospecs = fail_combine_iospecs
+        try:
+            processor.verify(iovalue={'a': 1, 'b': 'x'})
+            processor.coerce(iovalue={'a': 1, 'b': 'x'})
+        finally:
+            iomanager.iomanager.combine_iospecs = original_combine_iospecs
+    
+    def test_make_plan_after_change(self):
+        processor = IOProcessor(required={'a': int})
+        processor.required = {'a': str}
+        processor.plan = processor.make_plan()
+        
+        processor.verify(iovalue={'a': 'x'})
+    
+    def test_builtin_scalar_node(self):
+        processor = IOProcessor(required=int)
+        
+        assert isinstance(
+            processor.plan,
+            iomanager.iomanager.BuiltinScalarNode,
+            )
+    
+    def test_scalar_listof_node(self):
+        processor = IOProcessor(required=ListOf(int))
+        
+        assert isinstance(
+            processor.plan,
+            iomanager.iomanager.ScalarListOfNode,
+            )
+    
+    def test_scalar_listof_not_for_custom_types(self):
+        processor = IOProcessor(required=ListOf(CustomType))
+        
+        assert not isinstance(
+            processor.plan,
+            iomanager.iomanager.ScalarListOfNode,
+            )
+    
+    def test_coerce_wrong_container_unchanged(self):
+        """ A value that is not the container expected by the iospec is not
+            coerced. Verification reports the wrong type. """
+        processor = IOProcessor(required={'a': [int]})
+        iovalue = {'a': 'xyz'}
+        
+        result = processor.coerce(iovalue=iovalue)
+        
+        assert result == iovalue
+        with pytest.raises(VerificationFailureError):
+            processor.verify(iovalue=result)
+
+class TestVerificationErrorMessages(unittest.TestCase):
+    """ The verification error message lists each fault. """
+    def error_message_test(self, iovalue, expected_message, **kwargs):
+        with pytest.raises(VerificationFailureError) as exc_info:
+            IOProcessor(**kwargs).verify(iovalue=iovalue)
+        
+        assert str(exc_info.value) == expected_message
+    
+    def test_missing(self):
+        self.error_message_test(
+            {'b': {}},
+            "Invalid input/output.\n"
+            "Missing: {'a': <int>, 'b': {'c': <str>}}",
+            required={'a': int, 'b': {'c': str}},
+            )
+    
+    def test_missing_list_item(self):
+        self.error_message_test(
+            [1],
+            "Invalid input/output.\n"
+            "Missing: {1: <str>}",
+            required=[int, str],
+            )
+    
+    def test_not_allowed(self):
+        self.error_message_test(
+            {'a': 1, 'x': [1, 2], 'y': 'z'},
+            "Invalid input/output.\n"
+            "Not allowed: {'x': [...], 'y': 'z'}",
+            required={'a': int},
+            )
+    
+    def test_not_allowed_nested_unlimited(self):
+        self.error_message_test(
+            {'a': {'b': 1, 'c': 2}, 'x': 3},
+            "Invalid input/output.\n"
+            "Not allowed: {'a': {'c': 2}}",
+            required={'a': {'b': int}},
+            unlimited=True,
+            )
+    
+    def test_wrong_type(self):
+        self.error_message_test(
+            {'a': 'x', 'b': [1, None], 'c': None},
+            "Invalid input/output.\n"
+            "Wrong type: {'a': (expected 'int'; got 'str'), "
+            "'b': {1: (expected 'int'; got 'NoneType')}, "
+            "'c': (expected 'dict'; got 'NoneType')}",
+            required={'a': int, 'b': ListOf(int), 'c': {'d': int}},
+            )
+    
+    def test_all_faults(self):
+        self.error_message_test(
+            {'b': 1, 'c': 2},
+            "Invalid input/output.\n"
+            "Missing: {'a': <int>}\n"
+            "Not allowed: {'c': 2}\n"
+            "Wrong type: {'b': (expected 'str'; got 'int')}",
+            required={'a': int},
+            optional={'b': str},
+            )
+
+
+
+# ----------------------- Code generation tests ------------------------
+
+class TestCodegenEngine(unittest.TestCase):
+    """ With 'engine="codegen"', the plan is run as generated source code. """
+    def test_generated_plan(self):
+        processor = IOProcessor(required={'a': int}, engine='codegen')
+        
+        assert isinstance(processor.plan, iomanager.iomanager.GeneratedPlan)
+        assert 'def check(ioval):' in processor.plan.source
+        assert 'def coerce(ioval):' in processor.plan.source
+    
+    def test_unknown_engine_raises(self):
+        with pytest.raises(ValueError):
+            IOProcessor(required={'a': int}, engine='xxx')
+    
+    def test_iomanager_engine(self):
+        manager = IOManager(
+            input_kwargs={'required': {'a': int}},
+            output_kwargs={'required': {'b': int}},
+            engine='codegen',
+            )
+        
+        for processor in [manager.input_processor, manager.output_processor]:
+            assert isinstance(
+                processor.plan,
+                iomanager.iomanager.GeneratedPlan
+                )
+    
+    def test_iomanager_engine_class_attribute(self):
+        class CustomIOManager(IOManager):
+            engine = 'codegen'
+        
+        manager = CustomIOManager(input_kwargs={'required': {'a': int}})
+        
+        assert isinstance(
+            manager.input_processor.plan,
+            iomanager.iomanager.GeneratedPlan
+            )
+    
+    def test_deep_iospec_falls_back_to_plan(self):
+        """ Python limits how deeply blocks can be nested. When the generated
+            source can not be compiled, the plan is used instead. """
+        iospec = int
+        iovalue = 1
+        for i in range(30):
+            iospec = ListOf(iospec)
+            iovalue = [iovalue]
+        
+        processor = IOProcessor(required=iospec, engine='codegen')
+        
+        assert isinstance(processor.plan, iomanager.iomanager.ListOfNode)
+        processor.verify(iovalue=iovalue)
+
+class TestCodegenEngineSameResults(unittest.TestCase):
+    """ The 'codegen' and 'plan' engines give the same coercion results and
+        the same verification error messages. """
+    iospec = {
+        'a': int,
+        'b': {'c': CustomType, 'd': ListOf(YesCoercionType)},
+        'e': [int, YesCoercionType],
+        'f': ListOf({'g': CustomType}),
+        }
+    
+    def make_processors(self, **kwargs):
+        kwargs.setdefault('required', self.iospec)
+        kwargs.setdefault(
+            'coercion_functions',
+            {YesCoercionType: custom_coercion_function},
+            )
+        return [
+            IOProcessor(engine=engine_name, **kwargs)
+            for engine_name in ['plan', 'codegen']
+            ]
+    
+    def get_error_message(self, processor, iovalue):
+        try:
+            processor.verify(iovalue=iovalue)
+        except VerificationFailureError as exc:
+            return str(exc)
+    
+    def same_results_test(self, iovalue, **kwargs):
+        plan_processor, codegen_processor = self.make_processors(**kwargs)
+        
+        plan_result = plan_processor.coerce(iovalue=iovalue)
+        codegen_result = codegen_processor.coerce(iovalue=iovalue)
+        assert describe(codegen_result) == describe(plan_result)
+        
+        for processor_iovalue in [iovalue, plan_result]:
+            plan_message, codegen_message = [
+                self.get_error_message(processor, processor_iovalue)
+                for processor in [plan_processor, codegen_processor]
+                ]
+            assert codegen_message == plan_message
+    
+    def make_iovalue(self):
+        return {
+            'a': 1,
+            'b': {'c': CustomType(), 'd': [BeforeCoercionType()]},
+            'e': [2, BeforeCoercionType()],
+            'f': [{'g': CustomType()}, {'g': None}],
+            }
+    
+    def test_valid(self):
+        self.same_results_test(self.make_iovalue())
+    
+    def test_wrong_types(self):
+        iovalue = self.make_iovalue()
+        iovalue['a'] = 'x'
+        iovalue['b']['d'].append(None)
+        iovalue['f'].append('y')
+        self.same_results_test(iovalue)
+    
+    def test_missing_and_unknown(self):
+        iovalue = self.make_iovalue()
+        del iovalue['a']
+        iovalue['e'].append(3)
+        iovalue['f'][0]['h'] = {}
+        iovalue['x'] = [1]
+        self.same_results_test(iovalue)
+    
+    def test_unlimited(self):
+        iovalue = self.make_iovalue()
+        iovalue['x'] = 1
+        self.same_results_test(iovalue, unlimited=True)
+    
+    def test_optional(self):
+        self.same_results_test(
+            {'a': 1, 'z': None},
+            required={'a': int},
+            optional={'z': {'q': int}, 'y': [int]},
+            )
+    
+    def test_not_a_container(self):
+        self.same_results_test('xyz')
+    
+    def test_typecheck_functions(self):
+        typecheck_functions = {CustomType: custom_typecheck_reject_function}
+        
+        self.same_results_test(
+            self.make_iovalue(),
+            typecheck_functions=typecheck_functions,
+            )
+
+
+
+# ----------------------- Single-pass processing -----------------------
+
+class TestProcessSinglePass(unittest.TestCase):
+    """ 'process_input' coerces and verifies each value in a single pass.
+        'process_output' verifies the whole value before coercing it. """
+    def make_processor(self, calls):
+        def counting_typecheck_function(value, expected_type):
+            calls.append(('typecheck', value))
+        
+        def counting_coercion_function(value, expected_type):
+            calls.append(('coerce', value))
+            return value
+        
+        return IOProcessor(
+            required={'a': CustomType, 'b': ListOf(CustomType)},
+            typecheck_functions={CustomType: counting_typecheck_function},
+            coercion_functions={CustomType: counting_coercion_function},
+            )
+    
+    def make_iovalue(self):
+        return {'a': CustomType(), 'b': [CustomType(), CustomType()]}
+    
+    def test_process_input_order(self):
+        calls = []
+        iovalue = self.make_iovalue()
+        
+        self.make_processor(calls).process_input(iovalue=iovalue)
+        
+        assert [kind for kind, value in calls] == ['coerce', 'typecheck'] * 3
+    
+    def test_process_output_order(self):
+        calls = []
+        iovalue = self.make_iovalue()
+        
+        self.make_processor(calls).process_output(iovalue=iovalue)
+        
+        assert [kind for kind, value in calls] == (
+            ['typecheck'] * 3 + ['coerce'] * 3
+            )
+    
+    def test_failing_output_not_coerced(self):
+        calls = []
+        iovalue = self.make_iovalue()
+        iovalue['b'].append('x')
+        
+        with pytest.raises(VerificationFailureError):
+            self.make_processor(calls).process_output(iovalue=iovalue)
+        
+        assert 'coerce' not in [kind for kind, value in calls]
+    
+    def process_same_error_test(self, process_kind):
+        manager = IOManager(**{
+            process_kind + '_kwargs': {
+                'required': {'a': int, 'b': ListOf({'c': str})},
+                },
+            })
+        iovalue = {'b': [{'c': 1}, {'d': 'x'}, None], 'e': {}}
+        
+        with pytest.raises(VerificationFailureError) as verify_exc_info:
+            getattr(manager, 'verify_' + process_kind)(iovalue)
+        
+        with pytest.raises(VerificationFailureError) as process_exc_info:
+            getattr(manager, 'process_' + process_kind)(iovalue)
+        
+        assert str(process_exc_info.value) == str(verify_exc_info.value)
+    
+    def test_process_input_same_error(self):
+        self.process_same_error_test('input')
+    
+    def test_process_output_same_error(self):
+        self.process_same_error_test('output')
+
+
+
+# --------------------------- Frozen iospecs ---------------------------
+
+class TestFreezeIospec(unittest.TestCase):
+    def setUp(self):
+        iomanager.clear_iospec_cache()
+    
+    def make_iospec(self):
+        return {'a': int, 'b': [str, {'c': bool}], 'd': ListOf({'e': float})}
+    
+    def test_interned(self):
+        frozen_a = iomanager.freeze_iospec(self.make_iospec())
+        frozen_b = iomanager.freeze_iospec(self.make_iospec())
+        
+        assert frozen_a is frozen_b
+    
+    def test_nested_interned(self):
+        frozen_a = iomanager.freeze_iospec({'a': [str, {'c': bool}]})
+        frozen_b = iomanager.freeze_iospec(self.make_iospec())
+        
+        assert frozen_a['a'] is frozen_b['b']
+    
+    def test_hashable(self):
+        frozen = iomanager.freeze_iospec(self.make_iospec())
+        
+        assert {frozen: 1}[frozen] == 1
+    
+    def test_equal_to_original(self):
+        iospec = {'a': int, 'b': [str]}
+        
+        assert iomanager.freeze_iospec(iospec) == iospec
+    
+    def test_key_order_matters(self):
+        frozen_a = iomanager.freeze_iospec({'a': int, 'b': str})
+        frozen_b = iomanager.freeze_iospec({'b': str, 'a': int})
+        
+        assert frozen_a != frozen_b
+    
+    def test_list_and_tuple_differ(self):
+        frozen_list = iomanager.freeze_iospec([int])
+        frozen_tuple = iomanager.freeze_iospec((int,))
+        
+        assert frozen_list != frozen_tuple
+        assert frozen_list.__name__ == 'list'
+        assert frozen_tuple.__name__ == 'tuple'
+    
+    def test_repr_unchanged(self):
+        iospec = ListOf([int, (str,)])
+        
+        assert iomanager.freeze_iospec(iospec).__name__ == iospec.__name__
+    
+    def test_immutable_dict(self):
+        frozen = iomanager.freeze_iospec({'a': int})
+        
+        with pytest.raises(TypeError):
+            frozen['b'] = str
+        
+        with pytest.raises(TypeError):
+            frozen.update(b=str)
+    
+    def test_immutable_list(self):
+        frozen = iomanager.freeze_iospec([int])
+        
+        with pytest.raises(TypeError):
+            frozen[0] = str
+    
+    def test_unhashable(self):
+        with pytest.raises(TypeError):
+            iomanager.freeze_iospec({'a': UnhashableType})
+    
+    def test_pickle(self):
+        import pickle
+        frozen = iomanager.freeze_iospec(self.make_iospec())
+        
+        unpickled = pickle.loads(pickle.dumps(frozen))
+        
+        assert unpickled is frozen
+        assert unpickled['b'].__name__ == 'list'
+
+class TestFrozenIospecMemoization(unittest.TestCase):
+    def setUp(self):
+        iomanager.clear_iospec_cache()
+    
+    def test_combine_memoized(self):
+        required = iomanager.freeze_iospec({'a': int})
+        optional = iomanager.freeze_iospec({'b': str})
+        
+        combined = iomanager.combine_iospecs(required, optional)
+        
+        assert combined == {'a': int, 'b': str}
+        assert iomanager.combine_iospecs(required, optional) is combined
+    
+    def test_combine_unfrozen(self):
+        combined = iomanager.combine_iospecs({'a': int}, {'b': str})
+        
+        assert type(combined) is dict
+    
+    def test_plan_shared(self):
+        processor_a = IOProcessor(required={'a': int}, optional={'b': str})
+        processor_b = IOProcessor(required={'a': int}, optional={'b': str})
+        
+        assert processor_a.plan is processor_b.plan
+    
+    def test_plan_not_shared_between_functions(self):
+        processor_a = IOProcessor(required={'a': int})
+        processor_b = IOProcessor(
+            required={'a': int},
+            typecheck_functions={int: lambda value: None},
+            )
+        
+        assert processor_a.plan is not processor_b.plan
+    
+    def test_iospecs_unchanged(self):
+        required = {'a': int}
+        processor = IOProcessor(required=required)
+        
+        assert processor.required is required
+    
+    def test_unhashable_iospec(self):
+        processor = IOProcessor(required={'a': UnhashableType})
+        
+        processor.verify({'a': UnhashableType()})
+        
+        with pytest.raises(VerificationFailureError):
+            processor.verify({'a': 1})
+    
+    def test_key_types(self):
+        """ Equal keys of different types are different iospecs. """
+        frozen = [
+            iomanager.freeze_iospec({key: int}) for key in [1, True, 1.0]
+            ]
+        
+        assert len(set(map(id, frozen))) == 3
+        assert frozen[0] != frozen[1]
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            IOProcessor(required={True: int}).verify({})
+        
+        assert 'Missing: {True: <int>}' in str(exc_info.value)
+    
+    def test_plans_reused(self):
+        """ Processors made and discarded one after another (one for each
+            request, for example) reuse the memoized plan. """
+        def coercion_function(value, expected_type):
+            return value
+        
+        for engine in ['plan', 'codegen']:
+            iomanager.clear_iospec_cache()
+            
+            plans = []
+            for index in range(10):
+                processor = IOProcessor(
+                    required={'a': int},
+                    coercion_functions={int: coercion_function},
+                    engine=engine,
+                    )
+                plans.append(id(processor.plan))
+                del processor
+                gc.collect()
+            
+            cached_plans = list(iomanager.iomanager.compiled_plans.values())
+            cached_plans.extend(
+                iomanager.iomanager.generated_plans.values()
+                )
+            
+            assert len(set(plans)) == 1
+            assert plans[0] in map(id, cached_plans)
+    
+    def test_plans_limited(self):
+        iomanager.iomanager.compiled_plans.maxsize = 10
+        try:
+            for index in range(20):
+                IOProcessor(required={'a{}'.format(index): int})
+            
+            assert len(iomanager.iomanager.compiled_plans) == 10
+        finally:
+            iomanager.iomanager.compiled_plans.maxsize = (
+                iomanager.iomanager.MEMO_SIZE
+                )
+    
+    def test_frozen_iospecs_limited(self):
+        iomanager.iomanager.frozen_iospecs.maxsize = 10
+        try:
+            for index in range(20):
+                iomanager.freeze_iospec({'a': [index]})
+            
+            assert len(iomanager.iomanager.frozen_iospecs) == 10
+        finally:
+            iomanager.iomanager.frozen_iospecs.maxsize = (
+                iomanager.iomanager.MEMO_SIZE
+                )
+
+class TestListOfName(unittest.TestCase):
+    def test_name_lazy(self):
+        listof = ListOf({'a': int})
+        
+        assert listof.type_name is None
+        assert listof.__name__ == "ListOf({'a': <class 'int'>})"
+    
+    def test_class_name(self):
+        assert ListOf.__name__ == 'ListOf'
+
+
+
+# ------------------------- Sequence traversal -------------------------
+
+class SequenceTraversalMixin(object):
+    """ Lists, tuples and 'ListOf' values are walked directly, without
+        building index-keyed dictionaries. Tuples stay tuples. """
+    def make_traversal_processor(self, required):
+        return IOProcessor(
+            required=required,
+            coercion_functions={YesCoercionType: custom_coercion_function},
+            engine=self.engine,
+            )
+    
+    def test_coerce_list(self):
+        processor = self.make_traversal_processor([int, YesCoercionType])
+        
+        result = processor.coerce([1, BeforeCoercionType(), 'extra'])
+        
+        assert type(result) is list
+        assert isinstance(result[1], YesCoercionType)
+        assert result[2] == 'extra'
+    
+    def test_coerce_tuple(self):
+        processor = self.make_traversal_processor([int, YesCoercionType])
+        
+        result = processor.coerce((1, BeforeCoercionType()))
+        
+        assert type(result) is tuple
+        assert isinstance(result[1], YesCoercionType)
+    
+    def test_coerce_listof_tuple(self):
+        processor = self.make_traversal_processor(ListOf(YesCoercionType))
+        
+        result = processor.coerce((BeforeCoercionType(), BeforeCoercionType()))
+        
+        assert type(result) is tuple
+        assert all(isinstance(item, YesCoercionType) for item in result)
+    
+    def test_coerce_nested_tuple(self):
+        processor = self.make_traversal_processor(
+            {'a': ListOf((int, YesCoercionType))}
+            )
+        
+        result = processor.coerce({'a': [(1, BeforeCoercionType())]})
+        
+        assert type(result['a']) is list
+        assert type(result['a'][0]) is tuple
+        assert isinstance(result['a'][0][1], YesCoercionType)
+    
+    def test_process_input_tuple(self):
+        processor = self.make_traversal_processor(ListOf(YesCoercionType))
+        
+        result = processor.process_input((BeforeCoercionType(),))
+        
+        assert type(result) is tuple
+    
+    def test_listof_error_index_keyed(self):
+        processor = self.make_traversal_processor(ListOf(int))
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            processor.verify(iovalue=[1, 'a', 2, None])
+        
+        assert str(exc_info.value) == (
+            "Invalid input/output.\n"
+            "Wrong type: {1: (expected 'int'; got 'str'), "
+            "3: (expected 'int'; got 'NoneType')}"
+            )
+
+
+
+# ----------------------- Copy-on-write coercion -----------------------
+
+class CopyOnWriteMixin(object):
+    """ Coercion only copies the containers on the path to a changed value.
+        Everything else is returned as it is. """
+    iospec = {
+        'a': {'b': YesCoercionType, 'c': [int, int]},
+        'd': ListOf({'e': YesCoercionType}),
+        }
+    
+    def make_copy_on_write_processor(self):
+        return IOProcessor(
+            required=self.iospec,
+            coercion_functions={YesCoercionType: custom_coercion_function},
+            engine=self.engine,
+            )
+    
+    def make_copy_on_write_iovalue(self):
+        return {
+            'a': {'b': YesCoercionType(), 'c': [1, 2]},
+            'd': [{'e': YesCoercionType()}, {'e': YesCoercionType()}],
+            }
+    
+    def test_unchanged(self):
+        iovalue = self.make_copy_on_write_iovalue()
+        
+        assert self.make_copy_on_write_processor().coerce(iovalue) is iovalue
+    
+    def test_process_input_unchanged(self):
+        iovalue = self.make_copy_on_write_iovalue()
+        
+        processor = self.make_copy_on_write_processor()
+        
+        assert processor.process_input(iovalue) is iovalue
+    
+    def test_no_coercion_functions(self):
+        processor = IOProcessor(required=self.iospec, engine=self.engine)
+        iovalue = self.make_copy_on_write_iovalue()
+        
+        assert processor.coerce(iovalue) is iovalue
+    
+    def test_copy_spine(self):
+        iovalue = self.make_copy_on_write_iovalue()
+        iovalue['d'][1]['e'] = BeforeCoercionType()
+        
+        result = self.make_copy_on_write_processor().coerce(iovalue)
+        
+        assert result is not iovalue
+        assert result['a'] is iovalue['a']
+        assert result['d'] is not iovalue['d']
+        assert result['d'][0] is iovalue['d'][0]
+        assert result['d'][1] is not iovalue['d'][1]
+        assert isinstance(result['d'][1]['e'], YesCoercionType)
+    
+    def test_original_unchanged(self):
+        iovalue = self.make_copy_on_write_iovalue()
+        before = BeforeCoercionType()
+        iovalue['a']['b'] = before
+        
+        self.make_copy_on_write_processor().coerce(iovalue)
+        
+        assert iovalue['a']['b'] is before
+    
+    def test_tuple_unchanged(self):
+        processor = IOProcessor(
+            required=ListOf(YesCoercionType),
+            coercion_functions={YesCoercionType: custom_coercion_function},
+            engine=self.engine,
+            )
+        iovalue = (YesCoercionType(), YesCoercionType())
+        
+        assert processor.coerce(iovalue) is iovalue
+
+
+
+# ------------------------- In-place coercion --------------------------
+
+class InPlaceCoercionMixin(object):
+    """ With 'inplace=True', mutable containers are updated instead of being
+        copied. """
+    def make_manager(self):
+        return IOManager(
+            input_kwargs={
+                'required': {'a': ListOf({'b': YesCoercionType})},
+                'optional': {'c': (YesCoercionType,)},
+                },
+            coercion_functions={YesCoercionType: custom_coercion_function},
+            engine=self.engine,
+            )
+    
+    def make_inplace_iovalue(self):
+        return {'a': [{'b': YesCoercionType()}, {'b': BeforeCoercionType()}]}
+    
+    def test_coerce_input_inplace(self):
+        iovalue = self.make_inplace_iovalue()
+        items = iovalue['a']
+        item = items[1]
+        
+        result = self.make_manager().coerce_input(iovalue, inplace=True)
+        
+        assert result is iovalue
+        assert result['a'] is items
+        assert result['a'][1] is item
+        assert isinstance(item['b'], YesCoercionType)
+    
+    def test_process_input_inplace(self):
+        iovalue = self.make_inplace_iovalue()
+        
+        result = self.make_manager().process_input(iovalue, inplace=True)
+        
+        assert result is iovalue
+        assert isinstance(iovalue['a'][1]['b'], YesCoercionType)
+    
+    def test_not_inplace_by_default(self):
+        iovalue = self.make_inplace_iovalue()
+        before = iovalue['a'][1]['b']
+        
+        result = self.make_manager().coerce_input(iovalue)
+        
+        assert result is not iovalue
+        assert iovalue['a'][1]['b'] is before
+    
+    def test_tuple_copied(self):
+        iovalue = {'a': [], 'c': (BeforeCoercionType(),)}
+        
+        result = self.make_manager().coerce_input(iovalue, inplace=True)
+        
+        assert result is iovalue
+        assert type(result['c']) is tuple
+        assert isinstance(result['c'][0], YesCoercionType)
+
+
+
+# ------------------------ Return-value protocol -------------------------
+
+def returning_coercion_function(value, expected_type):
+    if isinstance(value, BeforeCoercionType):
+        return iomanager.CoercionSuccess(YesCoercionType())
+    return value
+
+def returning_reject_function(value, expected_type):
+    return iomanager.TypeCheckFailure
+
+def returning_accept_function(value, expected_type):
+    return iomanager.TypeCheckSuccess
+
+class ReturnValueProtocolMixin(object):
+    """ Custom functions can return 'CoercionSuccess', 'TypeCheckSuccess' and
+        'TypeCheckFailure' instead of raising the matching errors. """
+    def make_protocol_processor(self, **kwargs):
+        return IOProcessor(
+            required={'a': CustomType, 'b': ListOf(YesCoercionType)},
+            engine=self.engine,
+            **kwargs
+            )
+    
+    def test_coercion_success(self):
+        processor = self.make_protocol_processor(
+            coercion_functions={YesCoercionType: returning_coercion_function},
+            )
+        
+        result = processor.coerce({'b': [BeforeCoercionType()]})
+        
+        assert isinstance(result['b'][0], YesCoercionType)
+    
+    def test_typecheck_success(self):
+        processor = self.make_protocol_processor(
+            typecheck_functions={CustomType: returning_accept_function},
+            )
+        
+        processor.verify({'a': object(), 'b': []})
+    
+    def test_typecheck_failure(self):
+        processor = self.make_protocol_processor(
+            typecheck_functions={CustomType: returning_reject_function},
+            )
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            processor.verify({'a': CustomType(), 'b': []})
+        
+        assert str(exc_info.value) == (
+            "Invalid input/output.\n"
+            "Wrong type: {'a': (expected 'CustomType'; got 'CustomType')}"
+            )
+    
+    def test_other_return_values_ignored(self):
+        processor = self.make_protocol_processor(
+            typecheck_functions={CustomType: lambda value, expected: False},
+            )
+        
+        processor.verify({'a': CustomType(), 'b': []})
+        
+        with pytest.raises(VerificationFailureError):
+            processor.verify({'a': object(), 'b': []})
 
 
 
+# --------------------------- Function dispatch --------------------------
+
+class TestFunctionDispatcher(unittest.TestCase):
+    """ Custom functions are found through the method resolution order of the
+        expected type, once per type. """
+    def make_dispatcher(self, functions):
+        return iomanager.iomanager.FunctionDispatcher(functions)
+    
+    def test_exact_type(self):
+        function = object()
+        dispatcher = self.make_dispatcher({CustomType: function})
+        
+        assert dispatcher.get(CustomType) is function
+    
+    def test_base_class(self):
+        function = object()
+        dispatcher = self.make_dispatcher({CustomType: function})
+        
+        assert dispatcher.get(CustomSubclassType) is function
+    
+    def test_nearest_class(self):
+        base_function = object()
+        subclass_function = object()
+        dispatcher = self.make_dispatcher({
+            CustomType: base_function,
+            CustomSubclassType: subclass_function,
+            })
+        
+        assert dispatcher.get(CustomSubclassType) is subclass_function
+    
+    def test_object_only_for_object(self):
+        function = object()
+        dispatcher = self.make_dispatcher({object: function})
+        
+        assert dispatcher.get(object) is function
+        assert dispatcher.get(CustomType) is None
+    
+    def test_builtin_scalar_only_for_itself(self):
+        """ 'bool' is a subclass of 'int', but a function for 'int' does not
+            apply to it. """
+        function = object()
+        dispatcher = self.make_dispatcher({int: function})
+        
+        assert dispatcher.get(int) is function
+        assert dispatcher.get(bool) is None
+    
+    def test_builtin_scalar_for_user_subclass(self):
+        class UserId(int):
+            pass
+        
+        function = object()
+        dispatcher = self.make_dispatcher({int: function})
+        
+        assert dispatcher.get(UserId) is function
+    
+    def test_not_found(self):
+        dispatcher = self.make_dispatcher({CustomType: object()})
+        
+        assert dispatcher.get(int) is None
+    
+    def test_unhashable_type(self):
+        dispatcher = self.make_dispatcher({CustomType: object()})
+        
+        assert dispatcher.get(UnhashableType) is None
+    
+    def test_cached(self):
+        function = object()
+        functions = {CustomType: function}
+        dispatcher = self.make_dispatcher(functions)
+        dispatcher.get(CustomSubclassType)
+        
+        del functions[CustomType]
+        
+        assert dispatcher.get(CustomSubclassType) is function
+
+class FunctionDispatchMixin(object):
+    def test_subclass_coercion(self):
+        processor = IOProcessor(
+            required={'a': CustomSubclassType},
+            coercion_functions={
+                CustomType: lambda value, expected_type: CustomSubclassType(),
+                },
+            engine=self.engine,
+            )
+        
+        result = processor.coerce({'a': 1})
+        
+        assert isinstance(result['a'], CustomSubclassType)
+    
+    def test_subclass_typecheck(self):
+        processor = IOProcessor(
+            required={'a': CustomSubclassType},
+            typecheck_functions={CustomType: custom_typecheck_reject_function},
+            engine=self.engine,
+            )
+        
+        with pytest.raises(VerificationFailureError):
+            processor.verify({'a': CustomSubclassType()})
+    
+    def test_builtin_scalar_subclass(self):
+        """ The exact-type check for builtin scalars falls back to
+            'isinstance'. """
+        processor = IOProcessor(
+            required={'a': int, 'b': ListOf(int)},
+            engine=self.engine,
+            )
+        
+        processor.verify({'a': True, 'b': [1, True]})
+        
+        with pytest.raises(VerificationFailureError):
+            processor.verify({'a': 1.5, 'b': []})
+    
+    def test_int_function_not_for_bool(self):
+        coerced = []
+        def coerce_int(value, expected_type):
+            coerced.append(value)
+            return int(value)
+        
+        processor = IOProcessor(
+            required={'a': bool},
+            coercion_functions={int: coerce_int},
+            engine=self.engine,
+            )
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            processor.process_input({'a': '3'})
+        
+        assert coerced == []
+        assert "got 'str'" in str(exc_info.value)
+    
+    def test_str_function_for_subclass(self):
+        class Name(str):
+            pass
+        
+        processor = IOProcessor(
+            required={'a': Name},
+            coercion_functions={str: lambda value, expected_type: Name(value)},
+            engine=self.engine,
+            )
+        
+        result = processor.process_input({'a': 'x'})
+        
+        assert type(result['a']) is Name
+    
+    def test_int_output_function_not_for_bool(self):
+        processor = IOProcessor(
+            required={'a': bool, 'b': int},
+            coercion_functions={int: lambda value, expected_type: str(value)},
+            engine=self.engine,
+            )
+        
+        result = processor.process_output({'a': True, 'b': 1})
+        
+        assert result == {'a': True, 'b': '1'}
+
+
+
+# ------------------------- Homogeneous ListOf --------------------------
+
+class ScalarListOfMixin(object):
+    """ 'ListOf' a builtin scalar type is verified in one pass over the item
+        types. Items are only checked one by one when that pass fails. """
+    def make_scalar_list_processor(self, item_type=int, **kwargs):
+        return IOProcessor(
+            required=ListOf(item_type),
+            engine=self.engine,
+            **kwargs
+            )
+    
+    def test_homogeneous(self):
+        self.make_scalar_list_processor().verify(list(range(1000)))
+    
+    def test_homogeneous_tuple(self):
+        self.make_scalar_list_processor(str).verify(tuple('abc'))
+    
+    def test_subclass_items(self):
+        self.make_scalar_list_processor().verify([1, True, 2])
+    
+    def test_error_report(self):
+        with pytest.raises(VerificationFailureError) as exc_info:
+            self.make_scalar_list_processor(float).verify(
+                [1.0, 'a', 2.0, None]
+                )
+        
+        assert str(exc_info.value) == (
+            "Invalid input/output.\n"
+            "Wrong type: {1: (expected 'float'; got 'str'), "
+            "3: (expected 'float'; got 'NoneType')}"
+            )
+    
+    def test_custom_typecheck_function(self):
+        processor = self.make_scalar_list_processor(
+            typecheck_functions={int: custom_typecheck_reject_function},
+            )
+        
+        with pytest.raises(VerificationFailureError):
+            processor.verify([1])
+    
+    def test_process_input_coerces(self):
+        processor = self.make_scalar_list_processor(
+            coercion_functions={int: lambda value, expected_type: int(value)},
+            )
+        
+        assert processor.process_input(['1', 2]) == [1, 2]
+    
+    def test_process_output_fails(self):
+        processor = self.make_scalar_list_processor(
+            coercion_functions={int: lambda value, expected_type: int(value)},
+            )
+        
+        with pytest.raises(VerificationFailureError):
+            processor.process_output(['1', 2])
+
+
+
+# ----------------------------- NumPy engine -----------------------------
+
+class TestNumpyEngine(unittest.TestCase):
+    """ With 'engine="numpy"', 'ListOf(int)' and 'ListOf(float)' values can
+        be NumPy arrays. """
+    def setUp(self):
+        self.numpy = pytest.importorskip('numpy')
+    
+    def make_processor(self, **kwargs):
+        return IOProcessor(
+            required={'a': ListOf(int), 'b': ListOf(float)},
+            engine='numpy',
+            **kwargs
+            )
+    
+    def test_numpy_listof_node(self):
+        processor = self.make_processor()
+        
+        for key in ['a', 'b']:
+            assert isinstance(
+                processor.plan.children[key],
+                iomanager.iomanager.NumpyListOfNode,
+                )
+    
+    def test_verify_arrays(self):
+        self.make_processor().verify({
+            'a': self.numpy.arange(5),
+            'b': self.numpy.linspace(0, 1, 5),
+            })
+    
+    def test_verify_lists(self):
+        self.make_processor().verify({'a': [1, 2], 'b': [0.5]})
+    
+    def test_wrong_dtype(self):
+        with pytest.raises(VerificationFailureError) as exc_info:
+            self.make_processor().verify({
+                'a': self.numpy.arange(5),
+                'b': self.numpy.arange(5),
+                })
+        
+        assert str(exc_info.value) == (
+            "Invalid input/output.\n"
+            "Wrong type: {'b': (expected 'ListOf(float)'; got 'ndarray')}"
+            )
+    
+    def test_two_dimensional(self):
+        with pytest.raises(VerificationFailureError):
+            self.make_processor().verify({
+                'a': self.numpy.zeros((2, 2), dtype=int),
+                'b': [],
+                })
+    
+    def test_output_array_unchanged(self):
+        processor = self.make_processor(
+            coercion_functions={float: lambda value, expected_type: value},
+            )
+        array = self.numpy.arange(3.0)
+        
+        result = processor.process_output({'a': [], 'b': array})
+        
+        assert result['b'] is array
+
+class TestListOfStorage(unittest.TestCase):
+    """ 'ListOf(..., storage="ndarray")' coerces lists to NumPy arrays. """
+    def test_ndarray(self):
+        numpy = pytest.importorskip('numpy')
+        for engine in iomanager.iomanager.ENGINES:
+            processor = IOProcessor(
+                required={'a': ListOf(float, storage='ndarray')},
+                coercion_functions=(
+                    iomanager.web_tools.input_coercion_functions
+                    ),
+                engine=engine,
+                )
+            
+            result = processor.process_input({'a': ['1.5', 2.0]})
+            
+            assert isinstance(result['a'], numpy.ndarray)
+            assert result['a'].tolist() == [1.5, 2.0]
+    
+    def test_not_converted_when_invalid(self):
+        pytest.importorskip('numpy')
+        processor = IOProcessor(required=ListOf(int, storage='ndarray'))
+        
+        assert processor.coerce(['a', 1]) == ['a', 1]
+    
+    def test_unknown_storage(self):
+        with pytest.raises(ValueError):
+            ListOf(int, storage='xxx')
+    
+    def test_storage_needs_numeric_items(self):
+        with pytest.raises(ValueError):
+            ListOf(str, storage='ndarray')
+    
+    def test_storage_with_typecheck_function(self):
+        with pytest.raises(ValueError):
+            IOProcessor(
+                required=ListOf(int, storage='ndarray'),
+                typecheck_functions={int: custom_typecheck_accept_function},
+                )
+    
+    def test_repr(self):
+        assert repr(ListOf(int, storage='ndarray')) == (
+            "ListOf(<class 'int'>, storage='ndarray')"
+            )
+    
+    def test_frozen_storage(self):
+        frozen = iomanager.freeze_iospec(ListOf(int, storage='ndarray'))
+        
+        assert frozen.storage == 'ndarray'
+        assert frozen is not iomanager.freeze_iospec(ListOf(int))
+    
+    def test_array(self):
+        for engine in iomanager.iomanager.ENGINES:
+            if engine == 'numpy':
+                pytest.importorskip('numpy')
+            processor = IOProcessor(
+                required={
+                    'a': ListOf(float, storage='d'),
+                    'b': ListOf(int, storage='q'),
+                    },
+                coercion_functions=(
+                    iomanager.web_tools.input_coercion_functions
+                    ),
+                engine=engine,
+                )
+            
+            result = processor.process_input({'a': ['1.5', 2.0], 'b': ['3']})
+            
+            assert result == {
+                'a': array.array('d', [1.5, 2.0]),
+                'b': array.array('q', [3]),
+                }
+    
+    def test_array_unchanged(self):
+        processor = IOProcessor(required=ListOf(int, storage='q'))
+        value = array.array('q', [1, 2])
+        
+        assert processor.process_output(value) is value
+    
+    def test_array_other_typecode(self):
+        processor = IOProcessor(required=ListOf(int, storage='q'))
+        
+        result = processor.process_output(array.array('b', [1, 2]))
+        
+        assert result.typecode == 'q'
+        assert result.tolist() == [1, 2]
+    
+    def test_array_overflow(self):
+        processor = IOProcessor(required=ListOf(int, storage='b'))
+        
+        assert processor.coerce([1, 1000]) == [1, 1000]
+    
+    def test_array_wrong_typecode(self):
+        with pytest.raises(ValueError):
+            ListOf(int, storage='d')
+    
+    def test_manager_output_lists(self):
+        """ Storage is for input; output lists stay lists. """
+        iospec = {'a': ListOf(int, storage='q')}
+        manager = IOManager(
+            input_kwargs={'required': iospec},
+            output_kwargs={'required': iospec},
+            )
+        
+        assert manager.process_input({'a': [1]}) == {
+            'a': array.array('q', [1]),
+            }
+        assert type(manager.process_output({'a': [1]})['a']) is list
+        assert type(manager.coerce_output({'a': [1]})['a']) is list
+    
+    def test_list_storage_off(self):
+        processor = IOProcessor(
+            required=ListOf(int, storage='q'),
+            list_storage=False,
+            )
+        
+        assert type(processor.coerce([1])) is list
+
+class TestNumpyNotInstalled(unittest.TestCase):
+    def setUp(self):
+        self.numpy = iomanager.iomanager.numpy
+        iomanager.iomanager.numpy = None
+    
+    def tearDown(self):
+        iomanager.iomanager.numpy = self.numpy
+    
+    def test_numpy_engine(self):
+        with pytest.raises(ImportError):
+            IOProcessor(required=ListOf(int), engine='numpy')
+    
+    def test_ndarray_storage(self):
+        iomanager.clear_iospec_cache()
+        
+        with pytest.raises(ImportError):
+            IOProcessor(required=ListOf(int, storage='ndarray'))
+    
+    def test_array_storage(self):
+        processor = IOProcessor(required=ListOf(int, storage='q'))
+        
+        assert processor.process_output([1]) == array.array('q', [1])
+
+
+
+# -------------------------- Batch processing --------------------------
+
+class BatchProcessingMixin(object):
+    def make_batch_processor(self, **kwargs):
+        return IOProcessor(
+            required={'a': int},
+            optional={'b': YesCoercionType},
+            engine=self.engine,
+            **kwargs
+            )
+    
+    def test_batch_values(self):
+        processor = self.make_batch_processor()
+        
+        result = processor.process_input_many(iter([{'a': 1}, {'a': 2}]))
+        
+        assert result.values == [{'a': 1}, {'a': 2}]
+        assert result.errors == {}
+    
+    def test_errors_by_index(self):
+        processor = self.make_batch_processor()
+        
+        result = processor.process_input_many([{'a': 'x'}, {'a': 1}, {}])
+        
+        assert result.values == [None, {'a': 1}, None]
+        assert result.errors == {
+            0: (
+                "Invalid input/output.\n"
+                "Wrong type: {'a': (expected 'int'; got 'str')}"
+                ),
+            2: "Invalid input/output.\nMissing: {'a': <int>}",
+            }
+    
+    def test_identical_messages_shared(self):
+        processor = self.make_batch_processor()
+        
+        result = processor.process_output_many([{'a': 'x'}] * 3)
+        
+        assert result.errors[0] is result.errors[1] is result.errors[2]
+        assert result.summary() == {result.errors[0]: [0, 1, 2]}
+    
+    def test_equal_unknown_values_of_other_types(self):
+        processor = self.make_batch_processor()
+        
+        result = processor.process_input_many(
+            [{'a': 1, 'z': 1}, {'a': 1, 'z': True}]
+            )
+        
+        assert result.errors[0].endswith("Not allowed: {'z': 1}")
+        assert result.errors[1].endswith("Not allowed: {'z': True}")
+    
+    def test_unhashable_failure(self):
+        processor = IOProcessor(required=UnhashableType, engine=self.engine)
+        
+        result = processor.process_input_many([1, 2])
+        
+        assert result.errors[0] == result.errors[1]
+    
+    def test_batch_coercion(self):
+        processor = self.make_batch_processor(
+            coercion_functions={YesCoercionType: custom_coercion_function},
+            )
+        
+        result = processor.process_input_many(
+            [{'a': 1, 'b': BeforeCoercionType()}]
+            )
+        
+        assert isinstance(result.values[0]['b'], YesCoercionType)
+    
+    def test_same_messages_as_process(self):
+        processor = self.make_batch_processor()
+        iovalues = [{'a': 'x'}, {'a': 1, 'c': [1]}, {'b': 1}]
+        
+        result = processor.process_input_many(iovalues)
+        
+        for index, iovalue in enumerate(iovalues):
+            with pytest.raises(VerificationFailureError) as exc_info:
+                processor.process_input(iovalue)
+            
+            assert str(exc_info.value) == result.errors[index]
+
+class TestBatchProcessingManager(unittest.TestCase):
+    def test_process_input_many(self):
+        manager = IOManager(input_kwargs={'required': [int]})
+        
+        result = manager.process_input_many([[1], ['x']])
+        
+        assert result.values == [[1], None]
+        assert result.errors == {
+            1: "Invalid input.\nWrong type: {0: (expected 'int'; got 'str')}",
+            }
+    
+    def test_process_output_many(self):
+        manager = IOManager(output_kwargs={'required': [int]})
+        
+        result = manager.process_output_many([['x']])
+        
+        assert result.errors[0].startswith('Invalid output.')
+
+
+
+# -------------------------- Lazy processing ---------------------------
+
+class LazyProcessingMixin(object):
+    def make_lazy_processor(self):
+        return IOProcessor(required={'a': int}, engine=self.engine)
+    
+    def test_lazy_values(self):
+        processor = self.make_lazy_processor()
+        
+        result = processor.iter_process_input([{'a': 1}, {'a': 2}])
+        
+        assert list(result) == [{'a': 1}, {'a': 2}]
+    
+    def test_lazy(self):
+        processor = self.make_lazy_processor()
+        taken = []
+        
+        def iovalues():
+            for value in range(3):
+                taken.append(value)
+                yield {'a': value}
+        
+        result = processor.iter_process_output(iovalues())
+        
+        assert taken == []
+        assert next(result) == {'a': 0}
+        assert taken == [0]
+    
+    def test_raise(self):
+        processor = self.make_lazy_processor()
+        result = processor.iter_process_input([{'a': 1}, {'a': 'x'}])
+        
+        assert next(result) == {'a': 1}
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            next(result)
+        
+        assert str(exc_info.value) == (
+            "Invalid input/output.\n"
+            "Wrong type: {'a': (expected 'int'; got 'str')}"
+            )
+    
+    def test_skip(self):
+        processor = self.make_lazy_processor()
+        
+        result = processor.iter_process_input(
+            [{'a': 'x'}, {'a': 1}, {}],
+            on_error='skip',
+            )
+        
+        assert list(result) == [{'a': 1}]
+    
+    def test_yield(self):
+        processor = self.make_lazy_processor()
+        iovalue = {'a': 'x'}
+        
+        result = list(processor.iter_process_input(
+            [{'a': 1}, iovalue],
+            on_error='yield',
+            ))
+        
+        assert result[0] == {'a': 1}
+        assert isinstance(result[1], iomanager.ProcessingFailure)
+        assert result[1].index == 1
+        assert result[1].iovalue is iovalue
+        assert isinstance(result[1].error, VerificationFailureError)
+    
+    def test_unknown_policy(self):
+        processor = self.make_lazy_processor()
+        
+        with pytest.raises(ValueError):
+            processor.iter_process_input([], on_error='xxx')
+
+class TestLazyProcessingManager(unittest.TestCase):
+    def test_input_error_class(self):
+        manager = IOManager(input_kwargs={'required': int})
+        
+        with pytest.raises(InputVerificationFailureError):
+            list(manager.iter_process_input([1, 'x']))
+    
+    def test_output_error_class(self):
+        manager = IOManager(output_kwargs={'required': int})
+        
+        result = list(manager.iter_process_output(['x'], on_error='yield'))
+        
+        assert isinstance(result[0].error, OutputVerificationFailureError)
+
+
+
+# ------------------------------ Pickling ------------------------------
+
+class TestPickleProcessor(unittest.TestCase):
+    """ A processor is pickled without its plan, which is made again when it
+        is unpickled. """
+    def test_pickle(self):
+        for engine in ['plan', 'codegen']:
+            processor = IOProcessor(
+                required={'a': int},
+                coercion_functions=(
+                    iomanager.web_tools.input_coercion_functions
+                    ),
+                engine=engine,
+                )
+            
+            unpickled = pickle.loads(pickle.dumps(processor))
+            
+            assert unpickled.engine == engine
+            assert unpickled.process_input({'a': '1'}) == {'a': 1}
+    
+    def test_pickle_manager(self):
+        manager = IOManager(output_kwargs={'required': int})
+        
+        unpickled = pickle.loads(pickle.dumps(manager))
+        
+        with pytest.raises(OutputVerificationFailureError):
+            unpickled.process_output('x')
+
+
+
+# ----------------------- Fail-fast verification -----------------------
+
+class FailFastMixin(object):
+    """ With 'fail_fast=True', verification stops at the first fault. """
+    def make_fail_fast_processor(self, iospec, **kwargs):
+        return IOProcessor(
+            required=iospec,
+            engine=self.engine,
+            fail_fast=True,
+            **kwargs
+            )
+    
+    def assert_message(self, processor, iovalue, message):
+        with pytest.raises(VerificationFailureError) as exc_info:
+            processor.process_input(iovalue)
+        
+        assert str(exc_info.value) == 'Invalid input/output.\n' + message
+    
+    def test_missing_first(self):
+        processor = self.make_fail_fast_processor(
+            {'a': int, 'b': int, 'c': int}
+            )
+        
+        self.assert_message(
+            processor,
+            {'b': 'x', 'z': 1},
+            "Missing: {'a': <int>}",
+            )
+    
+    def test_unknown(self):
+        processor = self.make_fail_fast_processor({'a': int})
+        
+        self.assert_message(
+            processor,
+            {'y': 1, 'a': 1, 'z': 1},
+            "Not allowed: {'y': 1}",
+            )
+    
+    def test_wrong_type(self):
+        processor = self.make_fail_fast_processor({'a': int, 'b': str})
+        
+        self.assert_message(
+            processor,
+            {'a': 'x', 'b': 1},
+            "Wrong type: {'a': (expected 'int'; got 'str')}",
+            )
+    
+    def test_fail_fast_list_of(self):
+        processor = self.make_fail_fast_processor(ListOf(int))
+        
+        self.assert_message(
+            processor,
+            [1, 'x', 'y'],
+            "Wrong type: {1: (expected 'int'; got 'str')}",
+            )
+    
+    def test_list(self):
+        processor = self.make_fail_fast_processor([int, str, int])
+        
+        self.assert_message(processor, [1], "Missing: {1: <str>}")
+    
+    def test_fail_fast_nested(self):
+        processor = self.make_fail_fast_processor({'a': ListOf({'b': int})})
+        
+        self.assert_message(
+            processor,
+            {'a': [{'b': 1}, {}, {'b': 'x'}]},
+            "Missing: {'a': {1: {'b': <int>}}}",
+            )
+    
+    def test_fail_fast_output(self):
+        processor = self.make_fail_fast_processor({'a': int})
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            processor.process_output({'a': 'x', 'z': 1})
+        
+        assert str(exc_info.value).count('\n') == 1
+    
+    def test_fail_fast_passes(self):
+        processor = self.make_fail_fast_processor({'a': ListOf(int)})
+        
+        assert processor.process_input({'a': [1, 2]}) == {'a': [1, 2]}
+
+class TestFailFastManager(unittest.TestCase):
+    def test_manager_kwarg(self):
+        manager = IOManager(fail_fast=True)
+        
+        assert manager.input_processor.fail_fast
+        assert manager.output_processor.fail_fast
+    
+    def test_default(self):
+        assert not IOManager().input_processor.fail_fast
+    
+    def test_not_shared_with_full_plan(self):
+        iospec = {'a': int, 'b': int}
+        full = IOProcessor(required=iospec)
+        fail_fast = IOProcessor(required=iospec, fail_fast=True)
+        
+        assert full.plan is not fail_fast.plan
+
+
+
+# ---------------------- Bounded error collection ----------------------
+
+class MaxErrorsMixin(object):
+    """ With 'max_errors=N', at most N faults are collected. """
+    def make_max_errors_processor(self, iospec, max_errors, **kwargs):
+        return IOProcessor(
+            required=iospec,
+            engine=self.engine,
+            max_errors=max_errors,
+            **kwargs
+            )
+    
+    def get_message(self, processor, iovalue):
+        with pytest.raises(VerificationFailureError) as exc_info:
+            processor.process_input(iovalue)
+        
+        return str(exc_info.value)
+    
+    def test_max_errors_list_of(self):
+        processor = self.make_max_errors_processor(ListOf(int), 2)
+        
+        message = self.get_message(processor, ['x'] * 1000)
+        
+        assert message == (
+            "Invalid input/output.\n"
+            "Wrong type: {0: (expected 'int'; got 'str'), "
+            "1: (expected 'int'; got 'str')}\n"
+            "Not shown: 998 more faults."
+            )
+    
+    def test_all_fault_kinds(self):
+        processor = self.make_max_errors_processor(
+            {'a': int, 'b': int, 'c': int},
+            2,
+            )
+        
+        message = self.get_message(processor, {'a': 'x', 'y': 1, 'z': 1})
+        
+        assert message == (
+            "Invalid input/output.\n"
+            "Not allowed: {'y': 1}\n"
+            "Wrong type: {'a': (expected 'int'; got 'str')}\n"
+            "Not shown: 3 more faults."
+            )
+    
+    def test_max_errors_nested(self):
+        processor = self.make_max_errors_processor(
+            ListOf({'a': int, 'b': int}),
+            3,
+            )
+        
+        message = self.get_message(processor, [{'a': 'x', 'b': 'y'}] * 5)
+        
+        assert message.count('expected') == 2
+        assert message.endswith('Not shown: 8 more faults.')
+    
+    def test_under_limit(self):
+        full = IOProcessor(required={'a': int, 'b': int}, engine=self.engine)
+        processor = self.make_max_errors_processor({'a': int, 'b': int}, 2)
+        iovalue = {'a': 'x'}
+        
+        assert (
+            self.get_message(processor, iovalue) ==
+            self.get_message(full, iovalue)
+            )
+    
+    def test_max_errors_passes(self):
+        processor = self.make_max_errors_processor(ListOf(int), 1)
+        
+        assert processor.process_input([1, 2]) == [1, 2]
+    
+    def test_batch_messages(self):
+        processor = self.make_max_errors_processor(ListOf(int), 1)
+        
+        result = processor.process_input_many([['x', 'y'], ['x', 'y', 'z']])
+        
+        assert result.errors[0].endswith('Not shown: 1 more faults.')
+        assert result.errors[1].endswith('Not shown: 2 more faults.')
+    
+    def test_bad_value(self):
+        for max_errors in [0, -1, 'x']:
+            with pytest.raises(ValueError):
+                self.make_max_errors_processor(int, max_errors)
+    
+    def test_no_failures_made_when_full(self):
+        """ Once 'max_errors' faults are held, the faults of the remaining
+            items are only counted. """
+        made = []
+        
+        class CountingNodeFailure(iomanager.iomanager.NodeFailure):
+            __slots__ = ()
+            
+            def __init__(self, *pargs, **kwargs):
+                made.append(self)
+                super(CountingNodeFailure, self).__init__(*pargs, **kwargs)
+        
+        processor = self.make_max_errors_processor(
+            ListOf({'a': int, 'b': [int]}),
+            2,
+            )
+        iovalue = [{'a': 'x', 'b': ['y'], 'c': 1}] * 100
+        
+        original = iomanager.iomanager.NodeFailure
+        iomanager.iomanager.NodeFailure = CountingNodeFailure
+        try:
+            for method in [processor.verify, processor.process_input]:
+                del made[:]
+                with pytest.raises(VerificationFailureError) as exc_info:
+                    method(iovalue)
+                
+                assert len(made) < 10
+                assert str(exc_info.value).endswith(
+                    'Not shown: 298 more faults.'
+                    )
+        finally:
+            iomanager.iomanager.NodeFailure = original
+
+class TestMaxErrorsManager(unittest.TestCase):
+    def test_manager_kwarg(self):
+        manager = IOManager(max_errors=5)
+        
+        assert manager.input_processor.max_errors == 5
+        assert manager.output_processor.max_errors == 5
+
+
+
+# ------------------------- Structured errors --------------------------
+
+class StructuredErrorMixin(object):
+    """ Verification errors hold their faults, and make their message when it
+        is read. """
+    def get_error(self, iospec, iovalue, **kwargs):
+        processor = IOProcessor(required=iospec, engine=self.engine, **kwargs)
+        with pytest.raises(VerificationFailureError) as exc_info:
+            processor.process_input(iovalue)
+        return exc_info.value
+    
+    def test_faults(self):
+        error = self.get_error(
+            {'a': int, 'b': ListOf({'c': str}), 'd': {'e': int}},
+            {'a': 'x', 'b': [{'c': 'y'}, {'c': 1}], 'z': [1]},
+            )
+        
+        assert [
+            (fault.path, fault.expected, fault.got)
+            for fault in error.faults
+            ] == [
+            (('d', 'e'), int, iomanager.iomanager.NotProvided),
+            (('z',), iomanager.iomanager.NotProvided, error.faults[1].got),
+            (('a',), int, str),
+            (('b', 1, 'c'), str, int),
+            ]
+        assert repr(error.faults[1].got) == '[...]'
+    
+    def test_message_not_made_until_read(self):
+        error = self.get_error({'a': int}, {'a': 'x'})
+        
+        assert BaseException.args.__get__(error) == ()
+        assert str(error) == (
+            "Invalid input/output.\n"
+            "Wrong type: {'a': (expected 'int'; got 'str')}"
+            )
+        assert error.args == (str(error),)
+    
+    def test_same_message(self):
+        processor = IOProcessor(
+            required={'a': int, 'b': [int, int]},
+            engine=self.engine,
+            )
+        iovalue = {'a': 'x', 'b': [1], 'c': {}}
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            processor.process_input(iovalue)
+        
+        failure = processor.plan.process(iovalue, False)[1]
+        assert str(exc_info.value) == processor.make_error_message(failure)
+    
+    def test_suppressed(self):
+        error = self.get_error(ListOf(int), ['x'] * 5, max_errors=2)
+        
+        assert len(error.faults) == 2
+        assert error.failure.suppressed == 3
+        assert str(error).endswith('Not shown: 3 more faults.')
+    
+    def test_pickle(self):
+        error = self.get_error({'a': int}, {'a': 'x'})
+        
+        unpickled = pickle.loads(pickle.dumps(error))
+        
+        assert unpickled.args == error.args
+        assert len(unpickled.faults) == 1
+
+class TestStructuredErrorManager(unittest.TestCase):
+    def test_manager_error(self):
+        manager = IOManager(input_kwargs={'required': {'a': int}})
+        
+        with pytest.raises(InputVerificationFailureError) as exc_info:
+            manager.process_input({'a': 'x'})
+        
+        error = exc_info.value
+        assert BaseException.args.__get__(error) == ()
+        assert error.faults[0].path == ('a',)
+        assert str(error).startswith('Invalid input.')
+    
+    def test_plain_error(self):
+        error = VerificationFailureError('Custom message.')
+        
+        assert error.faults == []
+        assert str(error) == 'Custom message.'
+
+
+
+# -------------------------- Async processing --------------------------
+
+class Lookup(object):
+    """ An async coercion function that resolves IDs to 'LookupResult'
+        instances, and counts its calls. """
+    def __init__(self):
+        self.calls = []
+        self.running = 0
+        self.most_running = 0
+    
+    async def __call__(self, value, expected_type):
+        self.calls.append(value)
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        await asyncio.sleep(0)
+        self.running -= 1
+        
+        if value == 'error':
+            raise ConfirmationError
+        if isinstance(value, int):
+            return LookupResult(value)
+        return value
+
+class LookupResult(object):
+    def __init__(self, value):
+        self.value = value
+
+async def async_typecheck(value, expected_type):
+    await asyncio.sleep(0)
+    if value == 'ok':
+        raise TypeCheckSuccessError
+    if value.value < 0:
+        return iomanager.TypeCheckFailure
+
+async def async_coercion_success(value, expected_type):
+    raise CoercionSuccessError(str(value))
+
+class AsyncProcessingMixin(object):
+    """ 'aprocess_input', 'aprocess_output' and 'acoerce' await the results
+        of async custom functions. """
+    def make_async_processor(self, iospec, **kwargs):
+        self.lookup = Lookup()
+        return IOProcessor(
+            required=iospec,
+            coercion_functions={LookupResult: self.lookup},
+            engine=self.engine,
+            **kwargs
+            )
+    
+    def test_async_coercion(self):
+        processor = self.make_async_processor({'a': LookupResult, 'b': int})
+        
+        result = asyncio.run(processor.aprocess_input({'a': 1, 'b': 2}))
+        
+        assert result['a'].value == 1
+        assert result['b'] == 2
+    
+    def test_concurrent(self):
+        processor = self.make_async_processor(ListOf(LookupResult))
+        
+        result = asyncio.run(processor.aprocess_input(list(range(20))))
+        
+        assert [item.value for item in result] == list(range(20))
+        assert self.lookup.most_running == 20
+    
+    def test_concurrent_fail_fast(self):
+        """ Placeholder values do not stop 'fail_fast' passes from collecting
+            every call. """
+        for kwargs in [{'fail_fast': True}, {'max_errors': 1}]:
+            processor = self.make_async_processor(
+                {'a': ListOf(LookupResult), 'b': LookupResult},
+                **kwargs
+                )
+            
+            result = asyncio.run(
+                processor.aprocess_input({'a': list(range(8)), 'b': 8})
+                )
+            
+            assert [item.value for item in result['a']] == list(range(8))
+            assert self.lookup.most_running == 9
+    
+    def test_fail_fast_error(self):
+        processor = self.make_async_processor(
+            {'a': LookupResult, 'b': int, 'c': int},
+            fail_fast=True,
+            )
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            asyncio.run(
+                processor.aprocess_input({'a': 1, 'b': 'x', 'c': 'y'})
+                )
+        
+        assert len(exc_info.value.faults) == 1
+    
+    def test_concurrency_limit(self):
+        processor = self.make_async_processor(
+            ListOf(LookupResult),
+            concurrency=3,
+            )
+        
+        asyncio.run(processor.aprocess_input(list(range(20))))
+        
+        assert self.lookup.most_running == 3
+    
+    def test_one_call_per_value(self):
+        processor = self.make_async_processor(ListOf(LookupResult))
+        value = 12345
+        
+        result = asyncio.run(processor.aprocess_input([value] * 5 + [1]))
+        
+        assert sorted(self.lookup.calls) == [1, value]
+        assert result[0] is result[4]
+    
+    def test_async_failure(self):
+        processor = self.make_async_processor({'a': LookupResult, 'b': int})
+        iovalue = {'a': 'x', 'b': 'y'}
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            asyncio.run(processor.aprocess_input(iovalue))
+        
+        assert str(exc_info.value) == (
+            "Invalid input/output.\n"
+            "Wrong type: {"
+            "'a': (expected 'LookupResult'; got 'str'), "
+            "'b': (expected 'int'; got 'str')}"
+            )
+    
+    def test_async_typecheck(self):
+        processor = self.make_async_processor(
+            ListOf(LookupResult),
+            typecheck_functions={LookupResult: async_typecheck},
+            )
+        
+        with pytest.raises(VerificationFailureError) as exc_info:
+            asyncio.run(processor.aprocess_input([1, 'ok', -1]))
+        
+        assert str(exc_info.value) == (
+            "Invalid input/output.\n"
+            "Wrong type: {2: (expected 'LookupResult'; got 'LookupResult')}"
+            )
+    
+    def test_typecheck_coerced_value(self):
+        checked = []
+        
+        def typecheck(value, expected_type):
+            checked.append(value)
+            if value.value < 0:
+                return iomanager.TypeCheckFailure
+            return iomanager.TypeCheckSuccess
+        
+        processor = self.make_async_processor(
+            {'a': LookupResult, 'b': LookupResult},
+            typecheck_functions={LookupResult: typecheck},
+            )
+        
+        result = asyncio.run(processor.aprocess_input({'a': 1, 'b': 2}))
+        
+        assert result['a'].value == 1
+        assert all(isinstance(value, LookupResult) for value in checked)
+        
+        with pytest.raises(VerificationFailureError):
+            asyncio.run(processor.aprocess_input({'a': 1, 'b': -2}))
+    
+    def test_coercion_success_error(self):
+        processor = IOProcessor(
+            required=[str],
+            coercion_functions={str: async_coercion_success},
+            engine=self.engine,
+            )
+        
+        assert asyncio.run(processor.aprocess_input([1])) == ['1']
+    
+    def test_function_error(self):
+        processor = self.make_async_processor(ListOf(LookupResult))
+        
+        with pytest.raises(ConfirmationError):
+            asyncio.run(processor.aprocess_input([1, 'error']))
+    
+    def test_async_output(self):
+        processor = self.make_async_processor({'a': LookupResult})
+        
+        with pytest.raises(VerificationFailureError):
+            asyncio.run(processor.aprocess_output({'a': 1}))
+        
+        assert self.lookup.calls == []
+    
+    def test_acoerce(self):
+        processor = self.make_async_processor({'a': LookupResult})
+        
+        result = asyncio.run(processor.acoerce({'a': 1, 'b': 'x'}))
+        
+        assert result['a'].value == 1
+        assert result['b'] == 'x'
+    
+    def test_async_inplace(self):
+        processor = self.make_async_processor({'a': LookupResult})
+        iovalue = {'a': 1}
+        
+        result = asyncio.run(processor.aprocess_input(iovalue, inplace=True))
+        
+        assert result is iovalue
+        assert iovalue['a'].value == 1
+    
+    def test_not_inplace(self):
+        processor = self.make_async_processor({'a': LookupResult})
+        iovalue = {'a': 1}
+        
+        result = asyncio.run(processor.aprocess_input(iovalue))
+        
+        assert iovalue == {'a': 1}
+        assert result['a'].value == 1
+    
+    def test_sync_functions(self):
+        processor = IOProcessor(
+            required={'a': YesCoercionType},
+            coercion_functions={YesCoercionType: custom_coercion_function},
+            engine=self.engine,
+            )
+        
+        result = asyncio.run(
+            processor.aprocess_input({'a': BeforeCoercionType()})
+            )
+        
+        assert isinstance(result['a'], YesCoercionType)
+    
+    def test_bad_concurrency(self):
+        for concurrency in [0, -1, 'x']:
+            with pytest.raises(ValueError):
+                self.make_async_processor(int, concurrency=concurrency)
+
+class TestAsyncProcessingManager(unittest.TestCase):
+    def make_manager(self, **kwargs):
+        self.lookup = Lookup()
+        return IOManager(
+            input_kwargs={'required': {'a': LookupResult}},
+            output_kwargs={'required': {'a': LookupResult}},
+            coercion_functions={LookupResult: self.lookup},
+            **kwargs
+            )
+    
+    def test_aprocess_input(self):
+        manager = self.make_manager()
+        
+        result = asyncio.run(manager.aprocess_input({'a': 1}))
+        
+        assert result['a'].value == 1
+    
+    def test_input_error(self):
+        manager = self.make_manager()
+        
+        with pytest.raises(InputVerificationFailureError):
+            asyncio.run(manager.aprocess_input({'a': 'x'}))
+    
+    def test_output_error(self):
+        manager = self.make_manager()
+        
+        with pytest.raises(OutputVerificationFailureError):
+            asyncio.run(manager.aprocess_output({'a': 1}))
+    
+    def test_acoerce(self):
+        manager = self.make_manager()
+        
+        assert asyncio.run(manager.acoerce_input({'a': 1}))['a'].value == 1
+        assert asyncio.run(manager.acoerce_output({'a': 2}))['a'].value == 2
+    
+    def test_manager_kwarg(self):
+        manager = self.make_manager(concurrency=4)
+        
+        assert manager.input_processor.concurrency == 4
+        assert manager.output_processor.concurrency == 4
+
+
+
+# ---------------------------- Batch plans -----------------------------
+
+class BatchPlanMixin(object):
+    """ 'process_batch' gives the same results as processing each iovalue on
+        its own. """
+    def get_results(self, iospec, iovalues, output=False, **kwargs):
+        processor = IOProcessor(required=iospec, engine=self.engine, **kwargs)
+        
+        results = processor.process_batch(iovalues, output)
+        
+        assert self.describe(processor, results) == self.describe(
+            processor,
+            [processor.plan.process(iovalue, output) for iovalue in iovalues],
+            )
+        return results
+    
+    def describe(self, processor, results):
+        return [
+            (
+                describe(coerced_iovalue),
+                failure and processor.make_error_message(failure),
+                )
+            for coerced_iovalue, failure in results
+            ]
+    
+    def test_scalars(self):
+        results = self.get_results(int, [1, 2, 3])
+        
+        assert results == [(1, None), (2, None), (3, None)]
+    
+    def test_dictionaries(self):
+        results = self.get_results({'a': int}, [{'a': 1}, {'a': 2}])
+        
+        assert [coerced_iovalue for coerced_iovalue, failure in results] == [
+            {'a': 1},
+            {'a': 2},
+            ]
+    
+    def test_batch_plan_failure(self):
+        results = self.get_results({'a': int}, [{'a': 1}, {'a': 'x'}])
+        
+        assert results[0][1] is None
+        assert results[1][1] is not None
+    
+    def test_none(self):
+        results = self.get_results(int, [1, None])
+        
+        assert results == [(1, None), (None, None)]
+    
+    def test_unlimited(self):
+        results = self.get_results(
+            {'a': int},
+            [{'a': 1, 'b': 2}],
+            unlimited=True,
+            )
+        
+        assert results == [({'a': 1, 'b': 2}, None)]
+    
+    def test_batch_plan_coercion(self):
+        results = self.get_results(
+            {'a': YesCoercionType},
+            [{'a': BeforeCoercionType()}],
+            coercion_functions={YesCoercionType: custom_coercion_function},
+            )
+        
+        assert isinstance(results[0][0]['a'], YesCoercionType)
+    
+    def test_batch_plan_output(self):
+        results = self.get_results(str, ['x', 1], output=True)
+        
+        assert results[0] == ('x', None)
+    
+    def test_optional(self):
+        processor = IOProcessor(
+            required={'a': int},
+            optional={'b': int},
+            engine=self.engine,
+            )
+        
+        results = processor.process_batch([{'a': 1, 'b': 2}, {'a': 3}], False)
+        
+        assert results == [({'a': 1, 'b': 2}, None), ({'a': 3}, None)]
+    
+    def test_functions_called_once(self):
+        """ A failing iovalue does not make the others run their custom
+            functions again. """
+        calls = []
+        def coerce_int(value, expected_type):
+            calls.append(value)
+            try:
+                return int(value)
+            except ValueError:
+                return value
+        
+        processor = IOProcessor(
+            required={'a': int},
+            coercion_functions={int: coerce_int},
+            engine=self.engine,
+            )
+        
+        results = processor.process_batch(
+            [{'a': '1'}, {'a': 'bad'}, {'a': '2'}],
+            False,
+            )
+        
+        assert calls == ['1', 'bad', '2']
+        assert [failure is None for coerced, failure in results] == [
+            True,
+            False,
+            True,
+            ]
+    
+    def test_batch_plan_inplace(self):
+        processor = IOProcessor(
+            required={'a': int},
+            coercion_functions={int: lambda value, expected_type: int(value)},
+            engine=self.engine,
+            )
+        iovalues = [{'a': '1'}, {'a': '2'}]
+        
+        results = processor.process_batch(iovalues, False, inplace=True)
+        
+        assert iovalues == [{'a': 1}, {'a': 2}]
+        assert [coerced for coerced, failure in results] == iovalues
+
+
+
+# ------------------------------ Engines -------------------------------
+
+class EngineCases(
+    SequenceTraversalMixin,
+    CopyOnWriteMixin,
+    InPlaceCoercionMixin,
+    ReturnValueProtocolMixin,
+    FunctionDispatchMixin,
+    ScalarListOfMixin,
+    BatchProcessingMixin,
+    LazyProcessingMixin,
+    FailFastMixin,
+    MaxErrorsMixin,
+    StructuredErrorMixin,
+    AsyncProcessingMixin,
+    BatchPlanMixin,
+    ):
+    """ The cases that run with each engine, named by 'engine'. """
+
+class TestEngineCasesPlan(EngineCases, unittest.TestCase):
+    engine = 'plan'
 
+class TestEngineCasesCodegen(EngineCases, unittest.TestCase):
+    engine = 'codegen'
@@ -1,10 +1,11 @@
 import pytest
 import unittest
+import typing
 from iomanager import (
     IOProcessor,
     AnyType,
+    ListOf,
     iospecs_from_callable,
-    combine_iospecs,
     )
 
 class ResultTest(object):
@@ -136,6 +137,98 @@ class TestNonFunctionCallable(unittest.TestCase):
         with pytest.raises(TypeError):
             iospecs_from_callable(object())
 
+class TestSignatureDetails(unittest.TestCase):
+    def test_annotations(self):
+        def callable_obj(a: int, b: ListOf(str) = None, c=None):
+            pass
+        
+        result = iospecs_from_callable(callable_obj)
+        
+        assert result['required'] == {'a': int}
+        assert repr(result['optional']['b']) == repr(ListOf(str))
+        assert result['optional']['c'] is AnyType
+    
+    def test_string_annotations(self):
+        def callable_obj(a: 'int', b: 'ListOf(str)' = None):
+            pass
+        
+        result = iospecs_from_callable(callable_obj)
+        
+        assert result['required'] == {'a': int}
+        assert isinstance(result['optional']['b'], ListOf)
+    
+    def test_string_annotations_of_callable_object(self):
+        class Custom(object):
+            def __call__(self, a: 'int'):
+                pass
+        
+        result = iospecs_from_callable(Custom())
+        
+        assert result['required'] == {'a': int}
+    
+    def test_unknown_string_annotation(self):
+        def callable_obj(a: 'NotDefined'):
+            pass
+        
+        with pytest.raises(ValueError):
+            iospecs_from_callable(callable_obj)
+    
+    def test_generic_alias_annotations(self):
+        def callable_obj(a: list[int], b: typing.List[int], c: dict[str, int]):
+            pass
+        
+        result = iospecs_from_callable(callable_obj)
+        
+        assert result['required'] == {'a': AnyType, 'b': AnyType, 'c': AnyType}
+    
+    def test_optional_annotations(self):
+        def callable_obj(a: typing.Optional[int], b: int | None = None):
+            pass
+        
+        result = iospecs_from_callable(callable_obj)
+        
+        assert result == {
+            'required': {'a': AnyType},
+            'optional': {'b': AnyType},
+            }
+    
+    def test_other_annotations(self):
+        def callable_obj(a: typing.Any, b: 5):
+            pass
+        
+        result = iospecs_from_callable(callable_obj)
+        
+        assert result['required'] == {'a': AnyType, 'b': AnyType}
+    
+    def test_container_annotations(self):
+        def callable_obj(a: {'x': int}, b: [ListOf(str)], c: {'x': list[int]}):
+            pass
+        
+        result = iospecs_from_callable(callable_obj)
+        
+        assert result['required']['a'] == {'x': int}
+        assert result['required']['b'][0].iospec_obj is str
+        assert result['required']['c'] is AnyType
+    
+    def test_keyword_only(self):
+        def callable_obj(a, *, b, c=None):
+            pass
+        
+        result = iospecs_from_callable(callable_obj)
+        
+        assert result == {
+            'required': {'a': AnyType, 'b': AnyType},
+            'optional': {'c': AnyType},
+            }
+    
+    def test_variable_parameters_left_out(self):
+        def callable_obj(a, /, b, *pargs, **kwargs):
+            pass
+        
+        result = iospecs_from_callable(callable_obj)
+        
+        assert result == {'required': {'b': AnyType}, 'optional': {}}
+
 
 
 
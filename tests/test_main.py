@@ -0,0 +1,192 @@
+import pytest
+import unittest
+import io
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout, redirect_stderr
+
+import iomanager
+from iomanager import (
+    IOProcessor,
+    ListOf,
+    )
+from iomanager.__main__ import (
+    main,
+    load_target,
+    )
+from iomanager.file_tools import validate_files
+
+SPEC_MODULE = """
+from iomanager import IOProcessor, ListOf, web_tools
+
+manager = web_tools.WebIOManager(
+    input_kwargs={'required': {'a': int, 'b': ListOf(float)}},
+    output_kwargs={'required': {'a': str}},
+    )
+
+processor = IOProcessor(required={'a': int})
+
+class Manager(web_tools.WebIOManager):
+    input_kwargs = {
+        'coercion_functions': web_tools.input_coercion_functions,
+        'required': {'a': int},
+        }
+
+not_a_manager = 1
+"""
+
+class CommandLineTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.make_file(SPEC_MODULE, 'iomanager_cli_spec.py')
+        sys.path.insert(0, self.directory.name)
+    
+    def tearDown(self):
+        sys.path.remove(self.directory.name)
+        sys.modules.pop('iomanager_cli_spec', None)
+        self.directory.cleanup()
+    
+    def make_file(self, content, name='data'):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as data_file:
+            data_file.write(content)
+        return path
+    
+    def make_records(self, count):
+        return self.make_file(''.join(
+            '{{"a": "{}", "b": ["1.5"]}}\n'.format('x' if index % 3 else index)
+            for index in range(count)
+            ))
+    
+    def run_main(self, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            status = main(list(args))
+        return status, stdout.getvalue(), stderr.getvalue()
+
+class TestMain(CommandLineTest):
+    def test_no_failures(self):
+        path = self.make_file('{"a": "1", "b": []}\n')
+        
+        status, stdout, stderr = self.run_main(
+            'iomanager_cli_spec:manager',
+            path,
+            '--processes', '1',
+            )
+        
+        assert status == 0
+        assert stdout == ''
+        assert stderr == '1 records, 0 failed, in 1 files.\n'
+    
+    def test_failures(self):
+        path = self.make_file('{"a": "1", "b": []}\n{"a": "x", "b": []}\n')
+        
+        status, stdout, stderr = self.run_main(
+            'iomanager_cli_spec:manager',
+            path,
+            '--processes', '1',
+            )
+        
+        assert status == 1
+        assert stdout == (
+            "{}:2: (byte 20) Invalid input.\n"
+            "    Wrong type: {{'a': (expected 'int'; got 'str')}}\n"
+            .format(path)
+            )
+    
+    def test_output(self):
+        path = self.make_file('{"a": 1}\n')
+        
+        status, stdout, stderr = self.run_main(
+            'iomanager_cli_spec:manager',
+            path,
+            '--output',
+            '--processes', '1',
+            )
+        
+        assert stdout.startswith('{}:1: (byte 0) Invalid output.'.format(path))
+    
+    def test_worker_processes(self):
+        path = self.make_records(100)
+        
+        serial = self.run_main(
+            'iomanager_cli_spec:manager',
+            path,
+            path,
+            '--processes', '1',
+            )
+        parallel = self.run_main(
+            'iomanager_cli_spec:manager',
+            path,
+            path,
+            '--processes', '2',
+            '--chunk-size', '7',
+            )
+        
+        assert parallel == serial
+        assert serial[2] == '200 records, 132 failed, in 2 files.\n'
+    
+    def test_bad_target(self):
+        path = self.make_file('')
+        
+        for target in ['iomanager_cli_spec', 'iomanager_cli_spec:xxx']:
+            with pytest.raises(SystemExit):
+                self.run_main(target, path)
+
+    def test_bad_numbers(self):
+        path = self.make_file('')
+        
+        for option in ['--processes', '--chunk-size']:
+            for value in ['0', '-1', 'x']:
+                with pytest.raises(SystemExit) as exc_info:
+                    self.run_main(
+                        option,
+                        value,
+                        'iomanager_cli_spec:manager',
+                        path,
+                        )
+                
+                assert exc_info.value.code == 2
+
+class TestLoadTarget(CommandLineTest):
+    def test_manager(self):
+        target = load_target('iomanager_cli_spec:manager')
+        
+        assert isinstance(target, iomanager.IOManager)
+    
+    def test_processor(self):
+        target = load_target('iomanager_cli_spec:processor')
+        
+        assert isinstance(target, IOProcessor)
+    
+    def test_manager_class(self):
+        target = load_target('iomanager_cli_spec:Manager')
+        
+        assert target.process_input({'a': '1'}) == {'a': 1}
+    
+    def test_not_a_manager(self):
+        with pytest.raises(ValueError):
+            load_target('iomanager_cli_spec:not_a_manager')
+
+class TestValidateFiles(CommandLineTest):
+    def test_same_failures(self):
+        path = self.make_records(50)
+        processor = IOProcessor(required={'a': int, 'b': ListOf(str)})
+        
+        serial = validate_files(processor, [path], processes=1)
+        parallel = validate_files(
+            processor,
+            [path],
+            processes=2,
+            chunk_size=6,
+            )
+        
+        assert [
+            (failure.index, failure.line, failure.offset, failure.message)
+            for failure in parallel[0].failures
+            ] == [
+            (failure.index, failure.line, failure.offset, failure.message)
+            for failure in serial[0].failures
+            ]
+        assert parallel[0].count == 50
@@ -0,0 +1,144 @@
+import pytest
+import unittest
+import asyncio
+import typing
+
+from iomanager import (
+    IOManager,
+    ListOf,
+    InputVerificationFailureError,
+    OutputVerificationFailureError,
+    managed,
+    web_tools,
+    )
+
+class TestManaged(unittest.TestCase):
+    def test_returns_function(self):
+        def function(a):
+            return a
+        
+        assert managed(function) is function
+        assert function(1) == 1
+    
+    def test_manager(self):
+        @managed
+        def function(a: int, b: str = 'x'):
+            pass
+        
+        assert isinstance(function.manager, IOManager)
+        assert function.manager.input_processor.required == {'a': int}
+        assert function.manager.input_processor.optional == {'b': str}
+    
+    def test_manager_made_once(self):
+        @managed
+        def function(a: int):
+            return a
+        
+        manager = function.manager
+        function.process_and_call({'a': 1})
+        function.process_and_call({'a': 2})
+        
+        assert function.manager is manager
+    
+    def test_process_and_call(self):
+        @managed
+        def function(a: int, b: int = 10):
+            return a + b
+        
+        assert function.process_and_call({'a': 1}) == 11
+        assert function.process_and_call({'a': 1, 'b': 2}) == 3
+    
+    def test_input_error(self):
+        @managed
+        def function(a: int):
+            return a
+        
+        for iovalue in [{'a': 'x'}, {}, {'a': 1, 'b': 2}]:
+            with pytest.raises(InputVerificationFailureError):
+                function.process_and_call(iovalue)
+    
+    def test_return_annotation(self):
+        @managed
+        def function(a) -> int:
+            return a
+        
+        assert function.process_and_call({'a': 1}) == 1
+        
+        with pytest.raises(OutputVerificationFailureError):
+            function.process_and_call({'a': 'x'})
+    
+    def test_no_return_annotation(self):
+        @managed
+        def function(a):
+            return a
+        
+        assert function.process_and_call({'a': 'x'}) == 'x'
+    
+    def test_optional_annotations(self):
+        @managed
+        def function(a: typing.Optional[int]) -> list[int]:
+            return a
+        
+        assert function.process_and_call({'a': None}) is None
+        assert function.process_and_call({'a': 'x'}) == 'x'
+    
+    def test_string_annotations(self):
+        @managed
+        def function(a: 'int') -> 'str':
+            return str(a)
+        
+        assert function.process_and_call({'a': 1}) == '1'
+        
+        with pytest.raises(InputVerificationFailureError):
+            function.process_and_call({'a': 'x'})
+    
+    def test_unknown_string_annotation(self):
+        with pytest.raises(ValueError):
+            @managed
+            def function(a) -> 'NotDefined':
+                pass
+    
+    def test_overrides(self):
+        @managed(required={'b': ListOf(int)}, optional={'a': str})
+        def function(a, b=None, c: int = 0):
+            pass
+        
+        processor = function.manager.input_processor
+        assert list(processor.required) == ['b']
+        assert isinstance(processor.required['b'], ListOf)
+        assert processor.optional == {'a': str, 'c': int}
+    
+    def test_method(self):
+        with pytest.raises(TypeError) as exc_info:
+            class Handler(object):
+                @managed
+                def method(self, a: int):
+                    return a
+        
+        assert 'Handler.method' in str(exc_info.value)
+    
+    def test_manager_class(self):
+        @managed(manager_class=web_tools.WebIOManager)
+        def function(a: int):
+            return a
+        
+        assert function.process_and_call({'a': '1'}) == 1
+    
+    def test_manager_kwargs(self):
+        @managed(
+            output_kwargs={'required': str},
+            coercion_functions={
+                str: lambda value, expected_type: str(value),
+                },
+            )
+        def function(a: str):
+            return a
+        
+        assert function.process_and_call({'a': 1}) == '1'
+    
+    def test_coroutine_function(self):
+        @managed
+        async def function(a: int) -> int:
+            return a * 2
+        
+        assert asyncio.run(function.process_and_call({'a': 2})) == 4
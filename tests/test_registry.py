@@ -0,0 +1,162 @@
+import pytest
+import unittest
+import gc
+
+from iomanager import (
+    IOProcessor,
+    IOManager,
+    ListOf,
+    )
+from iomanager import registry
+from iomanager.registry import ManagerRegistry
+
+class TestManagerRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ManagerRegistry()
+        self.manager = IOManager(input_kwargs={'required': {'a': int}})
+    
+    def test_register(self):
+        result = self.registry.register('a', self.manager)
+        
+        assert result is self.manager
+        assert self.registry['a'] is self.manager
+        assert self.registry.get('a') is self.manager
+        assert 'a' in self.registry
+        assert len(self.registry) == 1
+        assert list(self.registry) == ['a']
+    
+    def test_register_again(self):
+        self.registry.register('a', self.manager)
+        self.registry.register('a', self.manager)
+        
+        assert len(self.registry) == 1
+    
+    def test_register_duplicate_name(self):
+        self.registry.register('a', self.manager)
+        
+        with pytest.raises(ValueError):
+            self.registry.register('a', IOManager())
+    
+    def test_unregister(self):
+        self.registry.register('a', self.manager)
+        self.registry.unregister('a')
+        
+        assert 'a' not in self.registry
+        assert self.registry.get('a') is None
+        with pytest.raises(KeyError):
+            self.registry.unregister('a')
+    
+    def test_warm_up(self):
+        list_of = ListOf(ListOf(int))
+        self.registry.register(
+            'a',
+            IOManager(output_kwargs={'optional': {'a': [list_of]}}),
+            )
+        self.registry.register('b', IOProcessor(required={'b': list_of}))
+        
+        self.registry.warm_up(freeze=False)
+        
+        assert list_of.type_name == 'ListOf(ListOf(int))'
+        assert list_of.iospec_obj.type_name == 'ListOf(int)'
+    
+    def test_warm_up_plans(self):
+        self.registry.register('a', self.manager)
+        
+        self.registry.warm_up(
+            freeze=False,
+            batch_plans=True,
+            async_plans=True,
+            )
+        
+        processor = self.manager.input_processor
+        assert processor.batch_plans[0] is processor.plan
+        assert processor.async_plans[0] is processor.plan
+    
+    def test_warm_up_freeze(self):
+        self.registry.register('a', self.manager)
+        
+        try:
+            self.registry.warm_up()
+            assert gc.get_freeze_count() > 0
+        finally:
+            gc.unfreeze()
+
+class TestWarmUp(unittest.TestCase):
+    def test_frozen_iospecs(self):
+        """ The 'ListOf' iospecs that plans are compiled from are copies.
+            'warm_c' is not used by other tests, so the copy of the 'ListOf'
+            that holds it is new. """
+        processor = IOProcessor(
+            required={'warm_a': ListOf(str)},
+            optional={'warm_b': ListOf({'warm_c': ListOf(int)})},
+            )
+        iospec, required, optional = processor.get_plan_iospecs()
+        list_ofs = [
+            iospec['warm_a'],
+            iospec['warm_b'],
+            iospec['warm_b'].iospec_obj['warm_c'],
+            ]
+        
+        assert list_ofs[1].type_name is None
+        
+        processor.warm_up()
+        
+        for value in list_ofs:
+            assert value.type_name is not None
+    
+    def test_same_errors(self):
+        iospec = {'a': ListOf({'b': ListOf(int)})}
+        iovalue = {'a': [{'b': 'x'}]}
+        
+        cold = IOProcessor(required=iospec)
+        warm = IOProcessor(required=iospec)
+        warm.warm_up()
+        
+        with pytest.raises(Exception) as cold_error:
+            cold.verify(iovalue)
+        with pytest.raises(Exception) as warm_error:
+            warm.verify(iovalue)
+        
+        assert str(warm_error.value) == str(cold_error.value)
+    
+    def test_list_iospec(self):
+        processor = IOProcessor(required={'a': [{}, ListOf(str)]})
+        
+        processor.warm_up()
+        
+        assert processor.required['a'][1].type_name == 'ListOf(str)'
+    
+    def test_plans(self):
+        processor = IOProcessor(required={'a': int})
+        
+        processor.warm_up(batch_plans=True, async_plans=True)
+        
+        assert processor.batch_plans[0] is processor.plan
+        assert processor.async_plans[0] is processor.plan
+    
+    def test_manager_plans(self):
+        manager = IOManager(output_kwargs={'required': {'a': int}})
+        
+        manager.warm_up(batch_plans=True)
+        
+        processor = manager.output_processor
+        assert processor.batch_plans[0] is processor.plan
+        assert not hasattr(processor, 'async_plans')
+
+class TestApplicationRegistry(unittest.TestCase):
+    def tearDown(self):
+        registry.registry.managers.clear()
+    
+    def test_register(self):
+        manager = IOManager()
+        
+        assert registry.register('a', manager) is manager
+        assert registry.registry['a'] is manager
+    
+    def test_warm_up(self):
+        list_of = ListOf(float)
+        registry.register('a', IOProcessor(required={'a': list_of}))
+        
+        registry.warm_up(freeze=False)
+        
+        assert list_of.type_name == 'ListOf(float)'
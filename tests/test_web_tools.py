@@ -203,4 +203,38 @@ class TestTypeCoercionCycle(unittest.TestCase):
     
     def test_uuid(self):
         uuid_value = uuid.uuid4()
-        self.coercion_cycle_test(uuid.UUID, uuid_value)
\ No newline at end of file
+        self.coercion_cycle_test(uuid.UUID, uuid_value)
+
+class TestCoercionFunctionsReturnResults(unittest.TestCase):
+    """ The input coercion functions return 'CoercionSuccess' results instead
+        of raising 'CoercionSuccessError'. """
+    def result_test(self, coercion_function, value, type_obj, expected):
+        result = coercion_function(value, type_obj)
+        
+        assert isinstance(result, iomanager.CoercionSuccess)
+        assert result.value == expected
+    
+    def test_bool(self):
+        self.result_test(
+            iomanager.web_tools.coerce_bool_input, 'true', bool, True
+            )
+    
+    def test_numeric(self):
+        self.result_test(
+            iomanager.web_tools.coerce_numeric_input, '1', int, 1
+            )
+    
+    def test_decimal(self):
+        self.result_test(
+            iomanager.web_tools.coerce_decimal_input,
+            '1.5',
+            decimal.Decimal,
+            decimal.Decimal('1.5'),
+            )
+    
+    def test_unchanged(self):
+        value = object()
+        
+        result = iomanager.web_tools.coerce_bool_input(value, bool)
+        
+        assert result is value